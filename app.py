@@ -58,7 +58,7 @@
 #         q_lower = q.lower()
 #         show_top = any(k in q_lower for k in ["top", "best", "selling", "item", "product"])
 #         show_revenue = any(k in q_lower for k in ["revenue", "income", "sales total"])
-#         show_trend = any(k in q_lower for k in ["trend", "compare", "growth", "week", "day", "month"])
+#         show_trend = any(k in q_lower for k in ["trend", "compare", "growth", "week", "day", "month", "hour"])
 #         show_general = not (show_top or show_revenue or show_trend)
 
 #         ui = {
@@ -94,96 +94,446 @@
 
 import os
 import json
-from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, request, jsonify, session
-from sales_api import fetch_recent_orders
-from llm_agent import llm_explain
-from utils import parse_date_range, aggregate_metrics, friendly_currency, analyze_trend
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
+from sales_api import fetch_recent_orders, fetch_stats, on_orders_changed, order_archive
+import order_index
+from order_index import OrderIndex, index_for
+from rollups import rollups_metrics, synced_rollups
+from cache import LRUCache
+import columnar
+from llm_agent import llm_explain, llm_explain_stream, llm_cache_stats, detect_intent
+import conversation
+import metrics
+from records import merchant_now, wall_clock
+from utils import (
+    parse_date_range, parse_comparison, aggregate_metrics, aggregate_windows,
+    comparison_block, friendly_currency, analyze_trend, analyze_hourly,
+)
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")  # for session handling
 
+# New or changed orders update the order index (and, through it, the rollups) incrementally
+on_orders_changed(order_index.on_orders_changed)
+
+# Vectorized aggregation over the order index (needs numpy)
+COLUMNAR = os.environ.get("COLUMNAR_AGGREGATION", "0") == "1" and columnar.available()
+
+# Computed analyses keyed by (window, order snapshot version); cleared when new data arrives
+_ANALYSIS_CACHE = LRUCache(maxsize=int(os.environ.get("ANALYSIS_CACHE_SIZE", 256)))
+_ANALYSIS_VERSION = {"version": None}
+
+# Batch questions: LLM explanations run concurrently on a bounded pool
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", 50))
+_BATCH_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("BATCH_LLM_WORKERS", 4)), thread_name_prefix="batch")
+
+# Archived orders of the month partitions a window overlaps, keyed by (partitions, archive generation)
+# so live refreshes don't invalidate them; the live tail is merged in per query.
+_ARCHIVE_WINDOWS = LRUCache(maxsize=int(os.environ.get("ARCHIVE_CACHE_SIZE", 8)))
+
+# Hot-path counters (stage timings are recorded with metrics.stage; cache hit rates are exported from stats())
+_WINDOW_AGGREGATIONS = metrics.counter("window_aggregations_total", "Window aggregations by engine.", labels=("engine",))
+_ORDERS_SCANNED = metrics.counter("orders_scanned_total", "Raw orders scanned while aggregating windows.")
+
+
+def window_metrics(index, start_dt, end_dt):
+    """aggregate_metrics() for a window, using the fastest path available."""
+    # Whole days come from the daily rollups; only partial edge days are rescanned
+    with metrics.stage("rollups"):
+        result = rollups_metrics(index, start_dt, end_dt)
+    if result is not None:
+        _WINDOW_AGGREGATIONS.inc(engine="rollups")
+        return result
+    return scan_metrics(index, start_dt, end_dt)
+
+
+def scan_metrics(index, start_dt, end_dt):
+    """aggregate_metrics() for a window straight off an index's orders (columnar when enabled)."""
+    lo, hi = index.bounds(start_dt, end_dt)
+    _ORDERS_SCANNED.inc(hi - lo)
+    with metrics.stage("aggregate"):
+        if COLUMNAR:
+            _WINDOW_AGGREGATIONS.inc(engine="columnar")
+            return index.aggregate(start_dt, end_dt)
+        _WINDOW_AGGREGATIONS.inc(engine="scan")
+        return aggregate_metrics(index.orders[lo:hi], start_dt, end_dt)
+
+
+def windows_metrics(index, windows):
+    """aggregate_metrics() for several windows over one index: columnar per window when enabled, else one shared scan."""
+    with metrics.stage("aggregate"):
+        if COLUMNAR:
+            _WINDOW_AGGREGATIONS.inc(len(windows), engine="columnar")
+            return [index.aggregate(s, e) for s, e in windows]
+        lo, hi = index.bounds(min(s for s, _ in windows), max(e for _, e in windows))
+        _ORDERS_SCANNED.inc(hi - lo)
+        _WINDOW_AGGREGATIONS.inc(len(windows), engine="scan")
+        return aggregate_windows(index, windows)
+
+
+def _before_live_data(index, start_dt):
+    return not index.times or wall_clock(start_dt) < index.times[0]
+
+
+def _archived(archive, start_dt, end_dt):
+    """Archived orders of the partitions overlapping [start_dt, end_dt] as an OrderIndex, or None if there are none."""
+    months = tuple(archive.months(start_dt, end_dt))
+    if not months:
+        return None
+    key = (archive.directory, months, archive.generation())
+    archived = _ARCHIVE_WINDOWS.get(key)
+    if archived is None:
+        with metrics.stage("archive"):
+            archived = OrderIndex(rows=archive.partition_rows(months))
+        _ARCHIVE_WINDOWS.set(key, archived)
+    return archived
+
+
+def _with_history(index, start_dt, end_dt):
+    """The live index, or for windows starting before the live data, the window's orders with the archive's added.
+
+    Archived orders are taken only from before the first live order, so nothing is counted twice.
+    Only the archive partitions the window overlaps are read (and cached); the live tail is merged per call.
+    """
+    archive = order_archive()
+    if archive is None or not _before_live_data(index, start_dt):
+        return index
+    end = wall_clock(end_dt)
+    cutoff = min(end, index.times[0] - timedelta(microseconds=1)) if index.times else end
+    archived = _archived(archive, start_dt, cutoff)
+    if archived is None:
+        return index
+    a_lo, a_hi = archived.bounds(start_dt, cutoff)
+    if a_lo == a_hi:
+        return index
+    lo, hi = index.bounds(start_dt, end_dt)
+    extended = OrderIndex(rows=list(zip(archived.times[a_lo:a_hi], archived.orders[a_lo:a_hi]))
+                          + list(zip(index.times[lo:hi], index.orders[lo:hi])))
+    extended.version = index.version
+    return extended
+
+
+def _current_index():
+    """The order index for the latest snapshot; drops memoized analyses when it changes."""
+    with metrics.stage("fetch_orders"):
+        orders = fetch_recent_orders()
+    with metrics.stage("index"):
+        index = index_for(orders)
+    if _ANALYSIS_VERSION["version"] != index.version:
+        _ANALYSIS_CACHE.clear()
+        _ANALYSIS_VERSION["version"] = index.version
+    return index
+
+
+def _window_payload(window, start_dt, end_dt, range_label):
+    # Trend figures are precomputed by the aggregation engines; single days get an hourly view
+    hourly = window.get("trend_hourly")
+    with metrics.stage("trend"):
+        if hourly:
+            trend_insight = analyze_hourly(hourly)
+        else:
+            trend_insight = analyze_trend(window["trend_daily"], window.get("trend_summary"))
+    return {
+        "date_range": {"start": start_dt.isoformat(), "end": end_dt.isoformat(), "label": range_label},
+        "totals": {
+            "revenue_cents": window["total_revenue_cents"],
+            "calc_revenue_cents": window["calc_revenue_cents"],
+            "orders": window["order_count"],
+            "avg_order_value_cents": window["aov_cents"],
+        },
+        "top_items": window["top_items"],
+        "trend": window["trend_daily"],
+        "trend_hourly": hourly,
+        "trend_summary": window.get("trend_summary"),
+        "trend_insight": trend_insight,
+    }
+
+
+def analyze_window(start_dt, end_dt, range_label, index=None):
+    """The question-independent part of the analysis payload, memoized per data version."""
+    index = _current_index() if index is None else index
+    key = (start_dt, end_dt, range_label, index.version)
+    cached = _ANALYSIS_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    source = _with_history(index, start_dt, end_dt)
+    if source is index:
+        window = window_metrics(index, start_dt, end_dt)
+    else:
+        # The shared rollups track the live snapshot only, so archive-backed windows are aggregated directly
+        window = scan_metrics(source, start_dt, end_dt)
+    result = _window_payload(window, start_dt, end_dt, range_label)
+    _ANALYSIS_CACHE.set(key, result)
+    return result
+
+
+def analyze_comparison(current, previous, index=None):
+    """Analysis for the current window plus a `comparison` block, both periods in one pass."""
+    index = _current_index() if index is None else index
+    key = ("compare", *(dt.isoformat() for dt in (*current[:2], *previous[:2])), index.version)
+    cached = _ANALYSIS_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    source = _with_history(index, min(current[0], previous[0]), max(current[1], previous[1]))
+    cur, prev = windows_metrics(source, [current[:2], previous[:2]])
+    result = _window_payload(cur, *current)
+    result["comparison"] = comparison_block(cur, prev, current[2], previous[2])
+    _ANALYSIS_CACHE.set(key, result)
+    return result
+
+
+def analyze_batch(questions, now):
+    """
+    Analyses for many questions against one order snapshot. Each question goes through
+    the same path as /ask, so a window asked twice (in the batch or since the last
+    data change) is aggregated once and served from the analysis cache.
+    """
+    index = _current_index()
+    return [analyze_question(q, now, index=index) for q in questions]
+
+
+def _product_details(q, analysis, index):
+    """Product-specific extras from the rollups: revenue ranking and a mentioned item's history.
+
+    `index` must be the one the analysis was built from, so both describe the same snapshot.
+    """
+    start = datetime.fromisoformat(analysis["date_range"]["start"])
+    end = datetime.fromisoformat(analysis["date_range"]["end"])
+    q_lower = q.lower()
+
+    extras = {}
+    # The rollups only cover live orders; windows that reach into the archive keep the aggregate's ranking
+    archived = order_archive() is not None and _before_live_data(index, start)
+    with synced_rollups(index) as rollups:
+        if rollups is None:
+            return analysis
+        if "revenue" in q_lower and not archived and any(k in q_lower for k in ["top", "best", "product", "item", "selling"]):
+            by_revenue = rollups.top_items(index, start, end, by="revenue")
+            if by_revenue is not None:
+                extras["top_items"] = by_revenue
+        item = rollups.find_item(q)
+        if item:
+            extras["item_history"] = {"name": item, "days": rollups.item_history(item, start.date(), end.date())}
+    return {**analysis, **extras} if extras else analysis
+
+
+def analyze_question(q, now, index=None):
+    """Resolve the question's date window(s) and return the question-independent analysis."""
+    index = _current_index() if index is None else index
+    windows = parse_comparison(q, now)
+    if windows:
+        analysis = analyze_comparison(*windows, index=index)
+    else:
+        window = parse_date_range(q, now=now)
+        analysis = analyze_window(*window, index=index)
+        if window.assumed:
+            # No timeframe in the question: say so rather than silently answering for today
+            analysis = {**analysis, "date_range_assumed": True}
+    return _product_details(q, analysis, index)
+
+
+def build_ui(q, analysis, llm_answer):
+    """Shape an analysis payload into the JSON the frontend renders."""
+    totals = analysis["totals"]
+    q_lower = q.lower()
+    show_top = any(k in q_lower for k in ["top", "best", "selling", "item", "product"])
+    show_revenue = any(k in q_lower for k in ["revenue", "income", "sales total"])
+    show_trend = any(k in q_lower for k in ["trend", "compare", "growth", "week", "day", "month", "hour"])
+    show_general = not (show_top or show_revenue or show_trend)
+
+    return {
+        "label": analysis["date_range"]["label"],
+        "date_range_assumed": analysis.get("date_range_assumed", False),
+        "llm_answer": llm_answer,
+        "show_top": show_top,
+        "show_revenue": show_revenue,
+        "show_trend": show_trend,
+        "show_general": show_general,
+        "orders": totals["orders"],
+        "revenue": friendly_currency(totals["revenue_cents"]),
+        "calc_revenue": friendly_currency(totals["calc_revenue_cents"]),
+        "aov": friendly_currency(totals["avg_order_value_cents"]),
+        "trend_insight": analysis["trend_insight"],
+        "top_items": [
+            {"name": i["name"], "qty": i["qty"], "revenue": friendly_currency(i["revenue_cents"])}
+            for i in analysis["top_items"]
+        ],
+        "trend": [{"date": d, "revenue": round(v / 100.0, 2), "orders": c} for d, (v, c) in analysis["trend"].items()],
+        "trend_hourly": [
+            {"date": h, "revenue": round(v / 100.0, 2), "orders": c} for h, (v, c) in (analysis.get("trend_hourly") or {}).items()
+        ],
+        "comparison": analysis.get("comparison"),
+        "item_history": analysis.get("item_history"),
+    }
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
 
-@app.route("/ask", methods=["POST"])
-def ask():
-    try:
-        q = (request.form.get("question") or request.json.get("question") or "").strip()
-        if not q:
-            return jsonify({"error": "Please provide a question."}), 400
-
-        # Retrieve conversation context
-        convo = session.get("conversation_history", [])
+def _wants_timing(payload):
+    return bool(payload.get("timing")) or request.args.get("timing") == "1"
 
-        tz = timezone.utc
-        start_dt, end_dt, range_label = parse_date_range(q, now=datetime.now(tz))
-
-        orders = fetch_recent_orders()
 
-        def in_range(o):
-            try:
-                ct = datetime.fromisoformat(o["createdTime"])
-            except Exception:
-                return False
-            ct = ct.replace(tzinfo=None)
-            return start_dt.replace(tzinfo=None) <= ct <= end_dt.replace(tzinfo=None) and o.get("state") == "locked"
+def _failed(route, e):
+    metrics.REQUEST_ERRORS.inc(route=route)
+    logger.exception("%s failed", route)
+    return jsonify({"error": f"Something went wrong: {str(e)}"}), 500
 
-        filtered = [o for o in orders if in_range(o)]
-        metrics = aggregate_metrics(filtered, start_dt, end_dt)
-        trend_insight = analyze_trend(metrics["trend_daily"])
 
+@app.route("/ask", methods=["POST"])
+def ask():
+    with metrics.track_request("ask") as trace:
+        try:
+            q = (request.form.get("question") or request.json.get("question") or "").strip()
+            if not q:
+                return jsonify({"error": "Please provide a question."}), 400
+
+            # Retrieve conversation context (kept server-side; the cookie only holds its id)
+            sid = conversation.session_id(session)
+
+            analysis = {
+                "question": q,
+                **analyze_question(q, merchant_now()),
+                "conversation_context": conversation.recent_turns(sid),  # include last 3 turns
+            }
+
+            # Clients can skip cached LLM answers with {"no_cache": true} or Cache-Control: no-cache
+            payload = request.get_json(silent=True) or {}
+            use_cache = not (payload.get("no_cache") or "no-cache" in request.headers.get("Cache-Control", ""))
+            with metrics.stage("llm"):
+                llm_answer = llm_explain(analysis, use_cache=use_cache)
+
+            # Update conversation memory
+            conversation.record_turn(sid, conversation.summarize_turn(q, analysis, detect_intent(q)))
+
+            # {"timing": true} (or ?timing=1) adds a per-stage breakdown to the response
+            result = build_ui(q, analysis, llm_answer)
+            if not _wants_timing(payload):
+                return jsonify(result)
+            result["timing"] = metrics.breakdown(trace)
+            response = jsonify(result)
+            response.headers["Server-Timing"] = metrics.server_timing(trace)
+            return response
+
+        except Exception as e:
+            return _failed("ask", e)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/ask/stream", methods=["GET", "POST"])
+def ask_stream():
+    """Server-Sent Events version of /ask: metrics first, then the LLM answer in chunks."""
+    payload = request.get_json(silent=True) or {}
+    q = (request.values.get("question") or payload.get("question") or "").strip()
+    if not q:
+        return jsonify({"error": "Please provide a question."}), 400
+
+    # The request scope stays open until the stream finishes, so streamed stages and errors are traced too
+    scope = ExitStack()
+    scope.enter_context(metrics.track_request("ask_stream"))
+    try:
+        sid = conversation.session_id(session)
         analysis = {
             "question": q,
-            "date_range": {"start": start_dt.isoformat(), "end": end_dt.isoformat(), "label": range_label},
-            "totals": {
-                "revenue_cents": metrics["total_revenue_cents"],
-                "calc_revenue_cents": metrics["calc_revenue_cents"],
-                "orders": metrics["order_count"],
-                "avg_order_value_cents": metrics["aov_cents"],
-            },
-            "top_items": metrics["top_items"],
-            "trend": metrics["trend_daily"],
-            "trend_insight": trend_insight,
-            "conversation_context": convo[-3:],  # include last 3 turns
-        }
-
-        llm_answer = llm_explain(analysis)
-
-        # Update conversation memory
-        convo.append({"user": q, "bot": llm_answer})
-        session["conversation_history"] = convo[-5:]  # keep recent 5
-
-        q_lower = q.lower()
-        show_top = any(k in q_lower for k in ["top", "best", "selling", "item", "product"])
-        show_revenue = any(k in q_lower for k in ["revenue", "income", "sales total"])
-        show_trend = any(k in q_lower for k in ["trend", "compare", "growth", "week", "day", "month"])
-        show_general = not (show_top or show_revenue or show_trend)
-
-        ui = {
-            "label": range_label,
-            "llm_answer": llm_answer,
-            "show_top": show_top,
-            "show_revenue": show_revenue,
-            "show_trend": show_trend,
-            "show_general": show_general,
-            "orders": metrics["order_count"],
-            "revenue": friendly_currency(metrics["total_revenue_cents"]),
-            "calc_revenue": friendly_currency(metrics["calc_revenue_cents"]),
-            "aov": friendly_currency(metrics["aov_cents"]),
-            "trend_insight": trend_insight,
-            "top_items": [
-                {"name": i["name"], "qty": i["qty"], "revenue": friendly_currency(i["revenue_cents"])}
-                for i in metrics["top_items"]
-            ],
-            "trend": [{"date": d, "revenue": round(v / 100.0, 2), "orders": c} for d, (v, c) in metrics["trend_daily"].items()],
+            **analyze_question(q, merchant_now()),
+            "conversation_context": conversation.recent_turns(sid),
         }
+        # Turns are summarized from the data, so they can be recorded before the answer streams
+        conversation.record_turn(sid, conversation.summarize_turn(q, analysis, detect_intent(q)))
+    except Exception as e:
+        with scope:
+            return _failed("ask_stream", e)
 
-        return jsonify(ui)
+    use_cache = not (payload.get("no_cache") or "no-cache" in request.headers.get("Cache-Control", ""))
 
-    except Exception as e:
-        return jsonify({"error": f"Something went wrong: {str(e)}"}), 500
+    def events():
+        with scope:
+            ui = build_ui(q, analysis, "")
+            ui.pop("llm_answer")
+            yield _sse("metrics", ui)
+            try:
+                with metrics.stage("llm_stream"):
+                    for chunk in llm_explain_stream(analysis, use_cache=use_cache):
+                        yield _sse("chunk", {"text": chunk})
+            except Exception as e:
+                metrics.REQUEST_ERRORS.inc(route="ask_stream")
+                logger.exception("ask_stream failed while streaming")
+                yield _sse("error", {"error": f"Something went wrong: {str(e)}"})
+            yield _sse("done", {})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/ask/batch", methods=["POST"])
+def ask_batch():
+    """Answer a list of questions at once, e.g. for dashboards and scheduled reports."""
+    with metrics.track_request("ask_batch") as trace:
+        try:
+            payload = request.get_json(silent=True) or {}
+            questions = payload.get("questions")
+            if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+                return jsonify({"error": "Please provide a non-empty list of questions."}), 400
+            questions = [q.strip() for q in questions]
+            if not questions or not all(questions):
+                return jsonify({"error": "Please provide a non-empty list of questions."}), 400
+            if len(questions) > BATCH_MAX_QUESTIONS:
+                return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch."}), 400
+
+            analyses = [
+                {"question": q, **base, "conversation_context": []}
+                for q, base in zip(questions, analyze_batch(questions, merchant_now()))
+            ]
+            use_cache = not payload.get("no_cache")
+            with metrics.stage("llm"):
+                answers = list(_BATCH_POOL.map(lambda a: llm_explain(a, use_cache=use_cache), analyses))
+
+            result = {"results": [build_ui(a["question"], a, ans) for a, ans in zip(analyses, answers)]}
+            if _wants_timing(payload):
+                result["timing"] = metrics.breakdown(trace)
+            return jsonify(result)
+
+        except Exception as e:
+            return _failed("ask_batch", e)
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "orders_api": fetch_stats(),
+        "analysis_cache": _ANALYSIS_CACHE.stats(),
+        "llm_cache": llm_cache_stats(),
+        "conversations": conversation.stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    gauges = {}
+    for prefix, values in [
+        ("orders_api_", fetch_stats()),
+        ("analysis_cache_", _ANALYSIS_CACHE.stats()),
+        ("llm_cache_", llm_cache_stats()),
+        ("conversations_", conversation.stats()),
+    ]:
+        gauges.update({prefix + k: v for k, v in values.items()})
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+"""Append-only local archive of ingested orders, for questions older than the API's window.
+
+Orders are partitioned by merchant-local month (`<dir>/2025-10/`). Every
+append writes one new immutable segment file into each partition it
+touches, in the columnar, mmap-able format of shared_orders. A segment holds
+only the orders that are new or changed since they were last archived.
+Readers map a partition's segments in sequence order, and later copies of
+an order win. A range query opens only the partitions the range overlaps.
+When a partition has ORDERS_ARCHIVE_COMPACT_AFTER segments they are merged
+into one. A small counter file is bumped after every append that wrote
+something, so readers can key caches on `generation()`.
+
+Nothing is ever removed, only superseded: orders that drop out of the
+upstream window stay queryable for as long as the archive is kept.
+"""
+
+import os
+import re
+import time
+import struct
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from operator import itemgetter
+
+import shared_orders
+from cache import LRUCache
+from order_index import created_at
+from order_store import order_key
+from records import OrderRecord, _encode_time, created_day, order_lines, wall_clock
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows: keep a single writer process per archive
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT = re.compile(r"^\d{8}\.seg$")
+_PARTITION = re.compile(r"^\d{4}-\d{2}$")
+_GENERATION = "GENERATION"
+
+
+def _fingerprint(o):
+    """What must match for an archived copy of an order to count as current."""
+    if isinstance(o, OrderRecord):
+        stamps = o.stamps()
+    else:
+        stamps = (*_encode_time(o.get("createdTime")), *_encode_time(o.get("modifiedTime")))
+    return (o.get("state"), o.get("total"), stamps, tuple(order_lines(o)))
+
+
+class _Partition:
+    """One month: its segment files, the latest copy of each order, and locked orders by creation time."""
+
+    __slots__ = ("files", "latest", "times", "orders", "fingerprints")
+
+    def __init__(self, files, latest, fingerprints):
+        self.files = files
+        self.latest = latest  # order key -> newest archived copy (SharedOrder)
+        self.fingerprints = fingerprints  # filled lazily, only for keys that get appended again
+        rows = [(ct, o) for o in latest.values() if (ct := created_at(o)) is not None]
+        rows.sort(key=itemgetter(0))
+        self.times = [ct for ct, _ in rows]
+        self.orders = [o for _, o in rows]
+
+    def fingerprint(self, key):
+        if key not in self.fingerprints:
+            o = self.latest.get(key)
+            self.fingerprints[key] = None if o is None else _fingerprint(o)
+        return self.fingerprints[key]
+
+
+class Archive:
+    def __init__(self, directory, compact_after=32, cached_partitions=24):
+        self.directory = directory
+        self.compact_after = compact_after
+        self._parts = LRUCache(maxsize=cached_partitions)
+        self._lock = threading.Lock()
+
+    # ------------------------
+    # Reading
+    # ------------------------
+    def months(self, start=None, end=None):
+        """Partition names, oldest first, optionally only those overlapping [start, end] (None is unbounded)."""
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if _PARTITION.match(n))
+        except FileNotFoundError:
+            return []
+        # A day's slack either side: partitions were cut in the timezone in force when written
+        if start is not None:
+            lo = f"{wall_clock(start) - timedelta(days=1):%Y-%m}"
+            names = [n for n in names if lo <= n]
+        if end is not None:
+            hi = f"{wall_clock(end) + timedelta(days=1):%Y-%m}"
+            names = [n for n in names if n <= hi]
+        return names
+
+    def generation(self):
+        """A number that grows with every append that wrote orders (0 for an empty archive)."""
+        try:
+            with open(os.path.join(self.directory, _GENERATION)) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _files(self, month):
+        try:
+            names = os.listdir(os.path.join(self.directory, month))
+        except FileNotFoundError:
+            return ()
+        return tuple(sorted(n for n in names if _SEGMENT.match(n)))
+
+    def _partition(self, month):
+        """The partition as currently on disk; only segments added since the cached copy are mapped."""
+        for _ in range(3):
+            files = self._files(month)
+            part = self._parts.get(month)
+            if part is not None and part.files == files:
+                return part
+            known = part.files if part is not None and files[:len(part.files)] == part.files else ()
+            latest = dict(part.latest) if known else {}
+            fingerprints = dict(part.fingerprints) if known else {}
+            try:
+                for name in files[len(known):]:
+                    for o in self._segment(month, name):
+                        key = order_key(o)
+                        latest[key] = o
+                        fingerprints.pop(key, None)
+            except FileNotFoundError:
+                continue  # compacted while we were reading; list again
+            fresh = _Partition(files, latest, fingerprints)
+            self._parts.set(month, fresh)
+            return fresh
+        raise RuntimeError(f"Order archive partition {month} keeps changing under the reader")
+
+    def _segment(self, month, name):
+        """One mapped segment file; an empty or damaged one is skipped (with a warning) rather than failing reads."""
+        try:
+            return shared_orders.Segment(os.path.join(self.directory, month, name))
+        except (ValueError, struct.error) as e:
+            logger.warning("Skipping unreadable archive segment %s/%s: %s", month, name, e)
+            return ()
+
+    def rows(self, start_dt=None, end_dt=None):
+        """(wall-clock creation time, order) for archived locked orders in [start_dt, end_dt], oldest first.
+
+        A None bound is open-ended.
+        """
+        start = None if start_dt is None else wall_clock(start_dt)
+        end = None if end_dt is None else wall_clock(end_dt)
+        out = []
+        for month in self.months(start, end):
+            part = self._partition(month)
+            lo = 0 if start is None else bisect.bisect_left(part.times, start)
+            hi = len(part.times) if end is None else bisect.bisect_right(part.times, end)
+            out.extend(zip(part.times[lo:hi], part.orders[lo:hi]))
+        out.sort(key=itemgetter(0))  # already sorted per partition; this only stitches the edges
+        return out
+
+    def partition_rows(self, months):
+        """(wall-clock creation time, order) for every archived locked order in these partitions, oldest first."""
+        out = []
+        for month in months:
+            part = self._partition(month)
+            out.extend(zip(part.times, part.orders))
+        out.sort(key=itemgetter(0))
+        return out
+
+    def between(self, start_dt, end_dt):
+        """Archived locked orders created within [start_dt, end_dt], oldest first."""
+        return [o for _, o in self.rows(start_dt, end_dt)]
+
+    def stats(self):
+        months = self.months()
+        return {
+            "partitions": len(months),
+            "segments": sum(len(self._files(m)) for m in months),
+            "first_month": months[0] if months else None,
+            "last_month": months[-1] if months else None,
+        }
+
+    # ------------------------
+    # Writing
+    # ------------------------
+    def append(self, orders):
+        """Archive the orders that are new or changed; returns how many were written."""
+        by_month = {}
+        for o in orders:
+            day = created_day(o)
+            if len(day) == 10:
+                by_month.setdefault(day[:7], []).append(o)
+        written = 0
+        with self._writer():
+            for month, batch in sorted(by_month.items()):
+                written += self._append(month, batch)
+            if written:
+                self._bump_generation()
+        return written
+
+    def _bump_generation(self):
+        path = os.path.join(self.directory, _GENERATION)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.generation() + 1))
+        os.replace(tmp, path)
+
+    def _append(self, month, batch):
+        part = self._partition(month)
+        fresh = []
+        for o in batch:
+            archived = part.fingerprint(order_key(o))
+            if archived is None or archived != _fingerprint(o):
+                fresh.append(o)
+        if not fresh:
+            return 0
+        self._write(month, part.files, fresh)
+        if len(part.files) + 1 >= self.compact_after:
+            self._compact(month)
+        return len(fresh)
+
+    def _write(self, month, files, orders):
+        seq = int(files[-1][:8]) + 1 if files else 1
+        directory = os.path.join(self.directory, month)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{seq:08d}.seg")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(shared_orders.encode(orders, seq, time.time()))
+        os.replace(tmp, path)
+
+    def _compact(self, month):
+        """Merge a partition's segments into one; readers holding the old mappings are unaffected."""
+        part = self._partition(month)
+        self._write(month, part.files, list(part.latest.values()))
+        for name in part.files:
+            try:
+                os.remove(os.path.join(self.directory, month, name))
+            except OSError as e:
+                logger.warning("Could not remove compacted archive segment %s/%s: %s", month, name, e)
+
+    @contextmanager
+    def _writer(self):
+        """One writer at a time, across threads and (with flock) across processes."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, "writer.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,162 @@
+"""ASGI entry point with an async /ask pipeline.
+
+Run with:  uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+POST /ask is handled natively here: fetching orders and aggregating run in a
+thread pool, and the Gemini call is awaited, so one process can keep hundreds
+of questions in flight instead of one per thread. The JSON contract and the
+conversation memory are the same as the Flask route (the session cookie is
+signed with the Flask app's own serializer and carries the conversation id).
+Every other route (including /ask/stream, which the UI uses) is served by
+the Flask app through asgiref's WSGI bridge, run on a real thread pool
+(ASGI_WSGI_WORKERS): asgiref's default would put every Flask request on one
+shared thread, one at a time.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from itsdangerous import BadSignature
+
+from app import app as flask_app, analyze_question, build_ui
+from llm_agent import llm_explain_async, detect_intent
+import conversation
+import metrics
+from records import merchant_now
+
+logger = logging.getLogger(__name__)
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("ASGI_EXECUTOR_WORKERS", 16)), thread_name_prefix="ask")
+_WSGI_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("ASGI_WSGI_WORKERS", 16)), thread_name_prefix="wsgi")
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """asgiref's per-request WSGI bridge, run on _WSGI_EXECUTOR instead of the single thread-sensitive thread."""
+
+    _run = staticmethod(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func)  # the undecorated method
+
+    async def run_wsgi_app(self, body):
+        return await sync_to_async(self._run, thread_sensitive=False, executor=_WSGI_EXECUTOR)(self, body)
+
+
+class _ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+_flask = _ThreadPoolWsgiToAsgi(flask_app)
+
+
+# ------------------------
+# Session cookie (shared with Flask)
+# ------------------------
+def _load_session(headers):
+    cookie = SimpleCookie(headers.get("cookie", ""))
+    name = flask_app.config["SESSION_COOKIE_NAME"]
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if name not in cookie or serializer is None:
+        return {}
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return dict(serializer.loads(cookie[name].value, max_age=max_age))
+    except BadSignature:
+        return {}
+
+
+def _session_header(data):
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    parts = [f"{flask_app.config['SESSION_COOKIE_NAME']}={serializer.dumps(data)}", "Path=/"]
+    if flask_app.config["SESSION_COOKIE_HTTPONLY"]:
+        parts.append("HttpOnly")
+    if flask_app.config["SESSION_COOKIE_SECURE"]:
+        parts.append("Secure")
+    if flask_app.config["SESSION_COOKIE_SAMESITE"]:
+        parts.append(f"SameSite={flask_app.config['SESSION_COOKIE_SAMESITE']}")
+    return (b"set-cookie", "; ".join(parts).encode("latin-1"))
+
+
+# ------------------------
+# HTTP helpers
+# ------------------------
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def _parse_payload(headers, body):
+    content_type = headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            payload = json.loads(body or b"{}")
+            return payload if isinstance(payload, dict) else {}
+        except ValueError:
+            return {}
+    return {k: v[0] for k, v in parse_qs(body.decode("utf-8", "replace")).items()}
+
+
+async def _send_json(send, status, data, extra_headers=()):
+    body = json.dumps(data).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+# ------------------------
+# Async /ask
+# ------------------------
+async def ask(scope, receive, send):
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    payload = _parse_payload(headers, await _read_body(receive))
+    with metrics.track_request("ask", profile=False) as trace:
+        try:
+            q = (payload.get("question") or "").strip()
+            if not q:
+                return await _send_json(send, 400, {"error": "Please provide a question."})
+
+            session = _load_session(headers)
+            sid = conversation.session_id(session)
+
+            # Order fetch + aggregation are blocking; run them off the event loop
+            # (in a copy of this context, so their stage timings land in this request's trace)
+            loop = asyncio.get_running_loop()
+            ctx = contextvars.copy_context()
+            window = await loop.run_in_executor(_EXECUTOR, ctx.run, analyze_question, q, merchant_now())
+            analysis = {"question": q, **window, "conversation_context": conversation.recent_turns(sid)}
+
+            use_cache = not (payload.get("no_cache") or "no-cache" in headers.get("cache-control", ""))
+            with metrics.stage("llm"):
+                llm_answer = await llm_explain_async(analysis, use_cache=use_cache)
+
+            conversation.record_turn(sid, conversation.summarize_turn(q, analysis, detect_intent(q)))
+
+            result = build_ui(q, analysis, llm_answer)
+            extra_headers = [_session_header(session)]
+            if payload.get("timing") or parse_qs(scope.get("query_string", b"").decode()).get("timing") == ["1"]:
+                result["timing"] = metrics.breakdown(trace)
+                extra_headers.append((b"server-timing", metrics.server_timing(trace).encode("latin-1")))
+            await _send_json(send, 200, result, extra_headers)
+
+        except Exception as e:
+            metrics.REQUEST_ERRORS.inc(route="ask")
+            logger.exception("ask failed")
+            await _send_json(send, 500, {"error": f"Something went wrong: {str(e)}"})
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == "/ask" and scope["method"] == "POST":
+        await ask(scope, receive, send)
+    else:
+        await _flask(scope, receive, send)
@@ -0,0 +1,4 @@
+"""Benchmarks for the /ask pipeline: synthetic orders, a local orders API and a stub LLM.
+
+Run with:  python -m bench.run --orders 100000
+"""
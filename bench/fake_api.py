@@ -0,0 +1,113 @@
+"""A local stand-in for the orders API, serving a fixed order list over HTTP.
+
+Responds like the sandbox: {"orders": [...]} with an ETag, and 304 to a
+matching If-None-Match. Point the app at it with ORDERS_API_URL.
+
+The body is never held in memory: it is encoded (and gzipped) a chunk of
+orders at a time while it is sent with chunked transfer encoding, and the
+ETag comes from one hashing pass over the same chunks at start-up. Pass a
+callable such as functools.partial(iter_orders, n) instead of a list and the
+fake API itself stays flat in memory whatever the order count.
+"""
+
+import hashlib
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOrdersAPI:
+    """Serve orders on 127.0.0.1 (random port unless given) from a background thread.
+
+    `orders` is a list, or a zero-argument callable returning a fresh iterable
+    of orders for every response.
+    """
+
+    def __init__(self, orders, port=0, latency=0.0, chunk_orders=1000):
+        self._orders = orders if callable(orders) else (lambda: orders)
+        self.chunk_orders = chunk_orders
+        digest = hashlib.sha256()
+        for piece in self.pieces():
+            digest.update(piece)
+        self.etag = '"%s"' % digest.hexdigest()[:16]
+        self.latency = latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/ch-portal/api/v1/orders/recent"
+
+    def pieces(self):
+        """The JSON body as byte strings of up to `chunk_orders` orders each."""
+        yield b'{"orders":['
+        sep, batch = "", []
+        for o in self._orders():
+            batch.append(json.dumps(o, separators=(",", ":")))
+            if len(batch) >= self.chunk_orders:
+                yield (sep + ",".join(batch)).encode("utf-8")
+                sep, batch = ",", []
+        if batch:
+            yield (sep + ",".join(batch)).encode("utf-8")
+        yield b"]}"
+
+    def _gzipped_pieces(self):
+        gz = zlib.compressobj(5, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for piece in self.pieces():
+            out = gz.compress(piece)
+            if out:
+                yield out
+        yield gz.flush()
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # chunked transfer encoding
+
+            def do_GET(self):
+                api.requests += 1
+                if api.latency:
+                    threading.Event().wait(api.latency)
+                if self.headers.get("If-None-Match") == api.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", api.etag)
+                    self.end_headers()
+                    return
+                pieces = api.pieces()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", api.etag)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    pieces = api._gzipped_pieces()
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for piece in pieces:
+                    if piece:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-orders-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,51 @@
+"""Synthetic orders shaped like the sandbox API's (createdTime, state, total, lineItems)."""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+_ADJECTIVES = ["Iced", "Hot", "Large", "Small", "Vanilla", "Caramel", "Spicy", "Classic", "Double", "Mini"]
+_NOUNS = ["Latte", "Mocha", "Bagel", "Muffin", "Croissant", "Sandwich", "Salad", "Tea", "Smoothie", "Cookie"]
+
+
+def catalog(size=200, seed=0):
+    """(name, price_cents) pairs; names repeat the way a real menu's do."""
+    rng = random.Random(seed)
+    names = [f"{a} {n}" for a in _ADJECTIVES for n in _NOUNS]
+    while len(names) < size:
+        names.append(f"{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} #{len(names)}")
+    return [(name, rng.randrange(150, 2500, 25)) for name in names[:size]]
+
+
+def iter_orders(n, days=30, end=None, items=200, locked_ratio=0.95, utc_offset=-5, seed=0):
+    """Yield n orders spread over the `days` days before `end` (default: now), oldest first.
+
+    Item popularity is skewed (a few best sellers, a long tail), and a small share
+    of orders are open or have a zero total so the line-item fallbacks get exercised.
+    """
+    rng = random.Random(seed)
+    menu = catalog(items, seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(menu))]
+    tz = timezone(timedelta(hours=utc_offset))
+    end = (end or datetime.now(timezone.utc)).astimezone(tz)
+    start = end - timedelta(days=days)
+    step = (end - start) / max(n, 1)
+
+    for i in range(n):
+        created = start + step * i
+        line_items = []
+        for name, price in rng.choices(menu, weights, k=rng.randint(1, 4)):
+            line_items.append({"name": name, "price": price, "unitQty": rng.choice((1, 1, 1, 2, 3))})
+        total = sum(li["price"] for li in line_items)
+        yield {
+            "id": f"ORD{i:09d}",
+            "state": "locked" if rng.random() < locked_ratio else "open",
+            "createdTime": created.isoformat(timespec="seconds"),
+            "modifiedTime": created.isoformat(timespec="seconds"),
+            "total": 0 if rng.random() < 0.02 else total,
+            "lineItems": line_items,
+        }
+
+
+def generate_orders(n, **kwargs):
+    """iter_orders() as a list."""
+    return list(iter_orders(n, **kwargs))
@@ -0,0 +1,259 @@
+"""Benchmark each stage of the /ask pipeline against synthetic data.
+
+    python -m bench.run --orders 100000 --iterations 50
+    python -m bench.run --orders 1000000 --stages aggregate,index,rollups --json bench.json
+
+Every stage reports throughput, p50/p95/p99 latency and the tracemalloc peak
+of one extra traced call (kept out of the timed runs, since tracing slows
+allocation-heavy code down). Orders come from bench.orders, the orders API
+is bench.fake_api on localhost and Gemini is bench.stub_llm, so the numbers
+only reflect this codebase.
+
+Orders are generated lazily and the fake API streams its body, so neither
+holds the raw order dicts. What remains is what the app itself holds: the
+decoded records and the structures built over them (about 1 KB per order
+resident) and, for the fetch and ask stages, the whole response body plus
+its parsed JSON while sales_api decodes it (about 5 KB per order at peak).
+So 10M orders needs roughly 10 GB for the compute-only stages (parse,
+aggregate, trend, index, rollups, window); with fetch or ask, plan on
+about 5 GB per million orders.
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from bench.fake_api import FakeOrdersAPI
+from bench.orders import iter_orders
+from bench import stub_llm
+
+QUESTIONS = [
+    "What was our revenue today?",
+    "How did we do yesterday?",
+    "Top 5 best-selling products this week",
+    "Show the sales trend last week",
+    "Summarize this month",
+    "Compare this week vs last week",
+    "Revenue in the last 7 days",
+    "Which products performed best in October?",
+    "Orders since Monday",
+    "How did Q3 go?",
+]
+
+STAGES = ["parse", "aggregate", "trend", "index", "rollups", "window", "fetch", "ask"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def measure(name, fn, iterations, items=1):
+    """Time `iterations` calls of fn(i), then one traced call for peak memory.
+
+    `items` is the number of units (orders, questions) one call processes, so
+    throughput is reported in units per second.
+    """
+    fn(0)  # warm-up: imports, lazily built structures
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn(iterations)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "stage": name,
+        "iterations": iterations,
+        "throughput_per_s": round(iterations * items / total, 1) if total else None,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+@contextmanager
+def local_pipeline(orders, llm_latency=0.0):
+    """Point sales_api at a fake API serving `orders` (a list, or a callable yielding them) and swap Gemini for the stub.
+
+    Module state is restored afterwards, so this is safe inside a test session:
+    sales_api's cache, store, snapshot paths, validators and listeners, the
+    order index, the stub's sys.modules entries and llm_agent's model and
+    answer cache (stub answers never outlive the pipeline).
+    """
+    import app  # noqa: F401  registers its order listener, which must survive the restore below
+    import llm_agent
+    import order_index
+    import sales_api
+    from cache import LRUCache
+
+    saved = {name: getattr(sales_api, name) for name in (
+        "API_URL", "_CACHE", "_REFRESHING", "_STORE", "_SNAPSHOT_BASE", "_SNAPSHOT_PATH",
+    )}
+    saved_validators = dict(sales_api._VALIDATORS)
+    saved_listeners = list(sales_api._LISTENERS)
+    saved_index = {k: order_index._INDEX[k] for k in ("source", "index")}  # the version counter only grows
+    saved_llm = {name: getattr(llm_agent, name) for name in ("_LLM_CACHE", "_LLM_CACHE_DIR")}
+    saved_model = dict(llm_agent._MODEL)
+    saved_modules = {name: sys.modules.get(name) for name in ("google", "google.generativeai")}
+    saved_google_attr = getattr(saved_modules["google"], "generativeai", None)
+    saved_key = os.environ.get("GEMINI_API_KEY")
+    try:
+        with tempfile.TemporaryDirectory() as tmp, FakeOrdersAPI(orders) as api:
+            sales_api.API_URL = api.url
+            sales_api._CACHE = {"data": None, "ts": 0, "error": None, "retry_at": 0, "snapshot_loaded": False}
+            sales_api._REFRESHING = False
+            sales_api._STORE = sales_api.OrderStore()
+            sales_api._SNAPSHOT_BASE = os.path.join(tmp, "orders_snapshot")
+            sales_api._SNAPSHOT_PATH = os.path.join(tmp, "orders_snapshot.bin")
+            sales_api._VALIDATORS.update(etag=None, last_modified=None)
+            llm_agent._LLM_CACHE = LRUCache(maxsize=saved_llm["_LLM_CACHE"].maxsize, ttl=llm_agent._LLM_CACHE_TTL)
+            llm_agent._LLM_CACHE_DIR = None
+            os.environ["GEMINI_API_KEY"] = "bench"
+            stub_llm.install(latency=llm_latency)
+            yield api
+    finally:
+        for name, value in saved.items():
+            setattr(sales_api, name, value)
+        sales_api._VALIDATORS.update(saved_validators)
+        sales_api._LISTENERS[:] = saved_listeners
+        with order_index._INDEX_LOCK:
+            order_index._INDEX.update(saved_index)
+        for name, value in saved_llm.items():
+            setattr(llm_agent, name, value)
+        with llm_agent._MODEL_LOCK:
+            llm_agent._MODEL.clear()
+            llm_agent._MODEL.update(saved_model)
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        if saved_modules["google"] is not None:
+            if saved_google_attr is None:
+                saved_modules["google"].__dict__.pop("generativeai", None)
+            else:
+                saved_modules["google"].generativeai = saved_google_attr
+        if saved_key is None:
+            os.environ.pop("GEMINI_API_KEY", None)
+        else:
+            os.environ["GEMINI_API_KEY"] = saved_key
+
+
+def run_benchmarks(n_orders=10000, iterations=20, stages=STAGES, llm_latency=0.0, days=90):
+    """Run the selected stages and return one result dict per stage."""
+    import app as app_module
+    from order_index import OrderIndex
+    from records import decode_orders
+    from rollups import DailyRollups
+    from utils import parse_date_range, aggregate_metrics, analyze_trend
+
+    now = datetime.now(timezone.utc)
+    api_orders = functools.partial(iter_orders, n_orders, days=days, end=now)  # regenerated per response
+    orders = decode_orders(api_orders())  # what the fetch path hands to the rest of the pipeline
+    windows = [parse_date_range(q, now=now) for q in QUESTIONS]
+    span_start, span_end = now - timedelta(days=days), now  # every generated order
+    results = []
+
+    if "parse" in stages:
+        results.append(measure(
+            "parse_date_range", lambda i: parse_date_range(QUESTIONS[i % len(QUESTIONS)], now=now), iterations * 50,
+        ))
+    if "aggregate" in stages:
+        results.append(measure(
+            "aggregate_metrics", lambda i: aggregate_metrics(orders, span_start, span_end), iterations, n_orders,
+        ))
+    if "trend" in stages:
+        trend = aggregate_metrics(orders, span_start, span_end)["trend_daily"]
+        results.append(measure("analyze_trend", lambda i: analyze_trend(trend), iterations * 50))
+
+    index = OrderIndex(orders)
+    if "index" in stages:
+        results.append(measure("order_index_build", lambda i: OrderIndex(orders), iterations, n_orders))
+    if "rollups" in stages:
+        results.append(measure("rollups_build", lambda i: DailyRollups().update(index), iterations, n_orders))
+    if "window" in stages:
+        rollups = DailyRollups()
+        rollups.update(index)
+
+        def window(i):
+            start, end, _ = windows[i % len(windows)]
+            return rollups.metrics(index, start, end) or aggregate_metrics(index.between(start, end), start, end)
+
+        results.append(measure("window_metrics", window, iterations * 10))
+
+    if "fetch" in stages or "ask" in stages:
+        with local_pipeline(api_orders, llm_latency=llm_latency):
+            import sales_api
+
+            if "fetch" in stages:
+                def fetch(i):
+                    sales_api._VALIDATORS.update(etag=None, last_modified=None)  # force a full 200
+                    return sales_api._download_orders()
+
+                results.append(measure("fetch_orders", fetch, max(1, iterations // 4), n_orders))
+
+            if "ask" in stages:
+                client = app_module.app.test_client()
+
+                def ask(i):
+                    rv = client.post("/ask", json={"question": QUESTIONS[i % len(QUESTIONS)], "no_cache": True})
+                    if rv.status_code != 200:
+                        raise RuntimeError(f"/ask returned {rv.status_code}: {rv.get_data(as_text=True)}")
+
+                results.append(measure("ask_end_to_end", ask, iterations * 5))
+
+    return results
+
+
+def format_table(results):
+    columns = ["stage", "iterations", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "peak_kib"]
+    rows = [columns] + [[str(r[c]) for c in columns] for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100000, help="synthetic orders to generate (~1 KB RAM each; ~5 KB with fetch/ask)")
+    parser.add_argument("--days", type=int, default=90, help="days the orders are spread over")
+    parser.add_argument("--iterations", type=int, default=20, help="timed runs per stage (cheap stages run more)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM sleeps per call")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.orders, args.iterations, stages, args.llm_latency, args.days)
+    print(f"{args.orders} orders over {args.days} days\n")
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"orders": args.orders, "days": args.days, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""A stand-in for google.generativeai, so benchmarks measure our code and not Gemini."""
+
+import sys
+import threading
+import types
+
+
+class StubModel:
+    latency = 0.0  # seconds per call, to model a real round trip
+    calls = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def generate_content(self, parts, stream=False, **kwargs):
+        StubModel.calls += 1
+        if StubModel.latency:
+            threading.Event().wait(StubModel.latency)
+        text = f"Stub answer ({len(''.join(parts))} prompt chars)."
+        if stream:
+            return iter([types.SimpleNamespace(text=w + " ") for w in text.split()])
+        return types.SimpleNamespace(text=text)
+
+
+def install(latency=0.0):
+    """Register the stub as google.generativeai and make llm_agent use it."""
+    genai = types.SimpleNamespace(configure=lambda **kw: None, GenerativeModel=StubModel)
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.generativeai = genai
+    sys.modules["google"] = google
+    sys.modules["google.generativeai"] = genai
+    StubModel.latency = latency
+    StubModel.calls = 0
+
+    import llm_agent
+    llm_agent._MODEL.update(key=None, model=None)
+    return StubModel
@@ -0,0 +1,125 @@
+"""Columnar, vectorized implementation of utils.aggregate_metrics.
+
+Orders and their line items are flattened once into typed numpy arrays
+(order totals, line prices, quantities, interned item-name ids, day ids, hours);
+any contiguous run of orders can then be aggregated with bincount-based
+group-bys instead of a Python loop over dicts. numpy is optional: when it is
+missing, `available()` is False and callers stay on the dict-based path.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from records import created_day, created_hour
+from utils import HOURS, trend_summary
+
+
+def available():
+    return np is not None
+
+
+class OrderColumns:
+    """Orders flattened into parallel arrays, in the order they were given."""
+
+    def __init__(self, orders):
+        item_ids, day_ids = {}, {}
+        self.item_names, self.day_names = [], []
+
+        order_total, line_total, order_day, order_hour, line_offsets = [], [], [], [], [0]
+        line_price, line_qty, line_item = [], [], []
+
+        for o in orders:
+            items = o.get("lineItems") or []
+            order_total.append(int(o.get("total") or 0))
+
+            day = created_day(o)
+            did = day_ids.get(day)
+            if did is None:
+                did = day_ids[day] = len(self.day_names)
+                self.day_names.append(day)
+            order_day.append(did)
+            order_hour.append(created_hour(o))
+
+            subtotal = 0
+            for li in items:
+                price = int(li.get("price") or 0)
+                name = li.get("name") or "Unknown Item"
+                iid = item_ids.get(name)
+                if iid is None:
+                    iid = item_ids[name] = len(self.item_names)
+                    self.item_names.append(name)
+                subtotal += price
+                line_price.append(price)
+                line_qty.append(li.get("unitQty") if li.get("unitQty") else 1)
+                line_item.append(iid)
+            line_total.append(subtotal)
+            line_offsets.append(len(line_price))
+
+        self.order_total = np.array(order_total, dtype=np.int64)
+        self.line_total = np.array(line_total, dtype=np.int64)
+        self.order_day = np.array(order_day, dtype=np.int64)
+        self.order_hour = np.array(order_hour, dtype=np.int64)
+        self.line_offsets = np.array(line_offsets, dtype=np.int64)
+        self.line_price = np.array(line_price, dtype=np.float64)
+        self.line_qty = np.array(line_qty, dtype=np.float64)
+        self.line_item = np.array(line_item, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.order_total)
+
+    def aggregate(self, lo=0, hi=None, top_n=10, hourly=False):
+        """Aggregate orders [lo, hi); returns the same dict as utils.aggregate_metrics.
+
+        hourly=True (for single-day windows) adds the trend_hourly series.
+        """
+        hi = len(self) if hi is None else hi
+        order_total = self.order_total[lo:hi]
+        line_total = self.line_total[lo:hi]
+        order_count = int(hi - lo)
+
+        total_revenue_cents = int(order_total.sum())
+        calc_revenue_cents = int(line_total.sum())
+        aov_cents = int(total_revenue_cents / order_count) if order_count else 0
+
+        # Daily trend: recorded total when positive, otherwise the line-item total
+        days = self.order_day[lo:hi]
+        trend_revenue = np.where(order_total > 0, order_total, line_total)
+        day_rev = np.bincount(days, weights=trend_revenue, minlength=len(self.day_names))
+        day_cnt = np.bincount(days, minlength=len(self.day_names))
+        trend_daily = {
+            self.day_names[d]: (int(day_rev[d]), int(day_cnt[d]))
+            for d in sorted(np.flatnonzero(day_cnt), key=lambda d: self.day_names[d])
+        }
+        trend_hourly = None
+        if hourly:
+            hours = self.order_hour[lo:hi]
+            hour_rev = np.bincount(hours, weights=trend_revenue, minlength=24)
+            hour_cnt = np.bincount(hours, minlength=24)
+            trend_hourly = {label: (int(hour_rev[h]), int(hour_cnt[h])) for h, label in enumerate(HOURS)}
+
+        # Per-item totals; ties keep first-seen order like Counter.most_common
+        a, b = self.line_offsets[lo], self.line_offsets[hi]
+        ids, qty, price = self.line_item[a:b], self.line_qty[a:b], self.line_price[a:b]
+        top_items = []
+        if len(ids):
+            present, first_pos = np.unique(ids, return_index=True)
+            qty_sum = np.bincount(ids, weights=qty)[present]
+            rev_sum = np.bincount(ids, weights=price * qty)[present]
+            order = np.lexsort((first_pos, -qty_sum))[:top_n]
+            top_items = [
+                {"name": self.item_names[present[k]], "qty": int(qty_sum[k]), "revenue_cents": int(rev_sum[k])}
+                for k in order
+            ]
+
+        return {
+            "order_count": order_count,
+            "total_revenue_cents": total_revenue_cents,
+            "calc_revenue_cents": calc_revenue_cents,
+            "aov_cents": aov_cents,
+            "top_items": top_items,
+            "trend_daily": trend_daily,
+            "trend_summary": trend_summary(trend_daily),
+            "trend_hourly": trend_hourly,
+        }
@@ -0,0 +1,62 @@
+"""Server-side conversation memory.
+
+The session cookie only carries an opaque id; the turns themselves live here,
+bounded per session and evicted (least recently used, or idle past the TTL)
+across sessions. Each turn is a compact summary of what was asked and the key
+numbers that were reported, not the verbatim LLM answer, so both the cookie
+and the prompt context stay small.
+"""
+
+import os
+import secrets
+from collections import deque
+
+from cache import LRUCache
+
+MAX_TURNS = int(os.environ.get("CONVERSATION_MAX_TURNS", 5))
+
+_STORE = LRUCache(
+    maxsize=int(os.environ.get("CONVERSATION_MAX_SESSIONS", 10000)),
+    ttl=float(os.environ.get("CONVERSATION_IDLE_TTL", 3600)),
+)
+
+
+def session_id(session) -> str:
+    """Opaque conversation id stored in the (Flask or ASGI) session mapping, created on first use."""
+    session.pop("conversation_history", None)  # cookies from before the server-side store
+    sid = session.get("sid")
+    if not sid:
+        sid = session["sid"] = secrets.token_urlsafe(16)
+    return sid
+
+
+def recent_turns(sid: str, n: int = 3) -> list:
+    turns = _STORE.get(sid)
+    return list(turns)[-n:] if turns else []
+
+
+def summarize_turn(q: str, analysis: dict, intent: str) -> dict:
+    """Compact record of one exchange: intent, date range and the key numbers."""
+    totals = analysis["totals"]
+    turn = {
+        "q": q[:200],
+        "intent": intent,
+        "range": analysis["date_range"]["label"],
+        "orders": totals["orders"],
+        "revenue_cents": totals["revenue_cents"],
+    }
+    if analysis.get("top_items"):
+        turn["top_item"] = analysis["top_items"][0]["name"]
+    if analysis.get("comparison"):
+        turn["rev_growth_pct"] = analysis["comparison"]["rev_growth_pct"]
+    return turn
+
+
+def record_turn(sid: str, turn: dict):
+    turns = _STORE.get(sid) or deque(maxlen=MAX_TURNS)
+    turns.append(turn)
+    _STORE.set(sid, turns)  # re-set so the idle TTL restarts
+
+
+def stats() -> dict:
+    return {**_STORE.stats(), "max_turns": MAX_TURNS}
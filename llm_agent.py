@@ -144,6 +144,88 @@
 
 import os
 import json
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from cache import LRUCache
+import metrics
+from utils import trend_summary
+
+logger = logging.getLogger(__name__)
+
+# Cache of LLM answers keyed by a canonical hash of the prompt inputs.
+# An optional on-disk layer (LLM_CACHE_DIR) survives restarts and is shared by workers.
+_LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 900))
+_LLM_CACHE = LRUCache(maxsize=int(os.environ.get("LLM_CACHE_SIZE", 512)), ttl=_LLM_CACHE_TTL)
+_LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR")
+
+
+def detect_intent(q: str) -> str:
+    q = q.lower()
+    if any(w in q for w in ["compare", "versus", " vs", "difference"]):
+        return "compare"
+    if any(w in q for w in ["top", "best", "product", "item"]):
+        return "top"
+    if any(w in q for w in ["trend", "growth", "increase", "decrease", "pattern"]):
+        return "trend"
+    return "summary"
+
+
+def _cache_key(analysis: dict) -> str:
+    """Canonical hash of everything that shapes the prompt, minus the question's wording."""
+    context = json.dumps(analysis.get("conversation_context", []), sort_keys=True, default=str)
+    payload = {
+        "intent": detect_intent(analysis.get("question", "")),
+        "date_range": analysis["date_range"],
+        "totals": analysis["totals"],
+        "top_items": analysis["top_items"][:5],
+        "trend": analysis["trend"],
+        "comparison": analysis.get("comparison"),
+        "item_history": analysis.get("item_history"),
+        "context": hashlib.sha256(context.encode("utf-8")).hexdigest(),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str):
+    answer = _LLM_CACHE.get(key)
+    if answer is not None or not _LLM_CACHE_DIR:
+        return answer
+    try:
+        with open(os.path.join(_LLM_CACHE_DIR, key + ".json"), encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("ts", 0) > _LLM_CACHE_TTL:
+        return None
+    _LLM_CACHE.set(key, entry["answer"])
+    return entry["answer"]
+
+
+def _cache_put(key: str, answer: str):
+    _LLM_CACHE.set(key, answer)
+    if not _LLM_CACHE_DIR:
+        return
+    path = os.path.join(_LLM_CACHE_DIR, key + ".json")
+    try:
+        os.makedirs(_LLM_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "answer": answer}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Could not write LLM cache entry %s: %s", path, e)
+
+
+def llm_cache_stats() -> dict:
+    return {**_LLM_CACHE.stats(), "ttl_seconds": _LLM_CACHE_TTL, "disk": bool(_LLM_CACHE_DIR)}
+
 
 def _fallback_explanation(analysis: dict) -> str:
     q = analysis.get("question", "").lower()
@@ -155,7 +237,20 @@ def _fallback_explanation(analysis: dict) -> str:
 
     lines = [f"Based on {label},"]
 
-    if any(w in q for w in ["top", "best", "product", "item"]):
+    comp = analysis.get("comparison")
+    if comp:
+        growth_rev = comp.get("rev_growth_pct", 0)
+        lines.append(f"here’s how {comp['current_label']} compares with {comp['previous_label']}:")
+        lines.append(f"Revenue: ${comp['rev_current']:,.2f} vs ${comp['rev_previous']:,.2f} ({growth_rev:+.1f}%)")
+        lines.append(f"Orders: {comp['orders_current']} vs {comp['orders_previous']} ({comp.get('order_growth_pct', 0):+.1f}%)")
+        if growth_rev > 0:
+            lines.append("\nSales performance improved compared to the previous period.")
+        elif growth_rev < 0:
+            lines.append("\nSales performance declined compared to the previous period.")
+        else:
+            lines.append("\nSales performance remained flat.")
+
+    elif any(w in q for w in ["top", "best", "product", "item"]):
         top_items = analysis.get("top_items", [])
         if not top_items:
             lines.append("No sales data found.")
@@ -182,42 +277,425 @@ def _fallback_explanation(analysis: dict) -> str:
     return "\n".join(lines)
 
 
-def llm_explain(analysis: dict) -> str:
+def _format_turn(turn: dict) -> str:
+    """One line per past turn, from the compact summaries kept by conversation.py."""
+    line = (
+        f"- Asked \"{turn['q']}\" ({turn['intent']}, {turn['range']}): "
+        f"{turn['orders']} orders, ${turn['revenue_cents'] / 100:,.2f} revenue"
+    )
+    if turn.get("top_item"):
+        line += f", top item {turn['top_item']}"
+    if turn.get("rev_growth_pct") is not None:
+        line += f", revenue change {turn['rev_growth_pct']:+.1f}%"
+    return line
+
+
+# ------------------------
+# Prompt building and token budget
+# ------------------------
+# Tokens are estimated at ~4 characters each (close enough for English and numbers with Gemini);
+# sections that do not fit LLM_PROMPT_TOKEN_BUDGET are shortened or dropped, least important first.
+_PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", 1000))
+_TREND_MAX_POINTS = int(os.environ.get("LLM_TREND_MAX_POINTS", 8))
+_PROMPT_TOKENS = metrics.histogram(
+    "llm_prompt_tokens", "Estimated tokens per LLM prompt.", buckets=(100, 200, 400, 800, 1600, 3200, 6400),
+)
+
+_SYSTEM_PROMPT = (
+    "You are a friendly business analyst who provides conversational summaries of sales data. "
+    "Always start with a natural intro like 'Based on yesterday’s sales' or 'According to this week’s data'. "
+    "Include total orders and total revenue in all answers. "
+    "Keep responses concise, human-like, and context-aware."
+)
+_CLOSING = "Now answer naturally and clearly with total revenue and total orders mentioned."
+
+# Optional sections per intent, most important first (the totals are always sent)
+_INTENT_SECTIONS = {
+    "compare": ("comparison", "item_history", "context"),
+    "top": ("top_items", "item_history", "context"),
+    "trend": ("trend", "item_history", "context"),
+    "summary": ("top_items", "trend", "item_history", "context"),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _money(cents) -> str:
+    return f"${(cents or 0) / 100:,.2f}"
+
+
+def _sample(series: dict, max_points: int, summary: dict) -> dict:
+    """At most max_points entries of an ordered series: start, end, peak and trough plus evenly spaced points."""
+    labels = list(series)
+    if len(labels) <= max_points:
+        return series
+    keep = {summary["first"], summary["last"], summary["peak"], summary["trough"]}
+    step = (len(labels) - 1) / max(1, max_points - 1)
+    for i in range(max_points):
+        if len(keep) >= max_points:
+            break
+        keep.add(labels[round(i * step)])
+    return {label: series[label] for label in labels if label in keep}
+
+
+def _series_lines(series: dict, unit: str = "orders") -> str:
+    return "\n".join(f"{label}: {_money(rev)}, {n} {unit}" for label, (rev, n) in series.items())
+
+
+def _trend_variants(analysis: dict, intent: str):
+    hourly = {h: v for h, v in (analysis.get("trend_hourly") or {}).items() if v[1]}
+    series, name = (hourly, "Hourly trend") if hourly else (analysis.get("trend") or {}, "Daily trend")
+    summary = trend_summary(series)
+    if summary is None:
+        return []
+    key_points = (
+        f"{name} key points ({summary['points']} points): start {_money(summary['start_revenue_cents'])} "
+        f"({summary['first']}), end {_money(summary['end_revenue_cents'])} ({summary['last']}), "
+        f"change {summary['growth_pct']:+.1f}%, peak {_money(summary['peak_revenue_cents'])} ({summary['peak']}), "
+        f"trough {_money(summary['trough_revenue_cents'])} ({summary['trough']})."
+    )
+    insight = f"\nTrend insight: {analysis['trend_insight']}" if analysis.get("trend_insight") else ""
+    if intent != "trend":
+        return [key_points]
+    sampled = _sample(series, _TREND_MAX_POINTS, summary)
+    heading = f"{name}:" if len(sampled) == len(series) else f"{name} (sampled, {len(sampled)} of {len(series)}):"
+    return [
+        f"{heading}\n{_series_lines(sampled)}\n{key_points}{insight}",
+        f"{key_points}{insight}",
+        key_points,
+    ]
+
+
+def _top_item_variants(analysis: dict, intent: str):
+    items = analysis.get("top_items") or []
+    if not items:
+        return []
+
+    def render(n):
+        return "Top items: " + "; ".join(
+            f"{i}. {item['name']} ({item['qty']} sold, {_money(item['revenue_cents'])})"
+            for i, item in enumerate(items[:n], 1)
+        )
+
+    return [render(5), render(3), render(1)] if intent == "top" else [render(3), render(1)]
+
+
+def _comparison_variants(analysis: dict, intent: str):
+    comp = analysis.get("comparison")
+    if not comp:
+        return []
+    line = (
+        f"Comparison, {comp['current_label']} vs {comp['previous_label']}: "
+        f"revenue ${comp['rev_current']:,.2f} vs ${comp['rev_previous']:,.2f} ({comp['rev_growth_pct']:+.1f}%), "
+        f"orders {comp['orders_current']} vs {comp['orders_previous']} ({comp['order_growth_pct']:+.1f}%), "
+        f"AOV ${comp['aov_current']:,.2f} vs ${comp['aov_previous']:,.2f}."
+    )
+    return [line + "\nDescribe the differences in percentages and say whether performance improved or declined."]
+
+
+def _item_history_variants(analysis: dict, intent: str):
+    history = analysis.get("item_history")
+    if not history or not history.get("days"):
+        return []
+    days = history["days"]
+    series = {day: (d["revenue_cents"], d["qty"]) for day, d in days.items()}
+    summary = trend_summary(series)
+    total = (
+        f"{history['name']}: {sum(d['qty'] for d in days.values())} sold on {len(days)} days, "
+        f"{_money(sum(d['revenue_cents'] for d in days.values()))} revenue, best day {summary['peak']}."
+    )
+    sampled = _sample(series, _TREND_MAX_POINTS, summary)
+    return [f"Item history for {history['name']}:\n{_series_lines(sampled, 'sold')}\n{total}", total]
+
+
+def _context_variants(analysis: dict, intent: str):
+    turns = analysis.get("conversation_context") or []
+    return ["Previous conversation:\n" + "\n".join(_format_turn(t) for t in turns[-n:])
+            for n in range(len(turns), 0, -1)]
+
+
+_SECTION_VARIANTS = {
+    "comparison": _comparison_variants,
+    "top_items": _top_item_variants,
+    "trend": _trend_variants,
+    "item_history": _item_history_variants,
+    "context": _context_variants,
+}
+
+
+def _compose(analysis: dict, budget: int):
+    """(system, prompt, report): the prompt fitted to `budget` estimated tokens."""
+    intent = "compare" if analysis.get("comparison") else detect_intent(analysis.get("question", ""))
+    totals = analysis["totals"]
+    head = (
+        f"User question: {analysis['question']}\n"
+        f"Date range: {analysis['date_range']['label']}"
+        f"{' (assumed: the question names no period)' if analysis.get('date_range_assumed') else ''}\n"
+        f"Totals: {totals['orders']} orders, {_money(totals['revenue_cents'])} revenue "
+        f"({_money(totals['calc_revenue_cents'])} from line items), "
+        f"average order {_money(totals['avg_order_value_cents'])}"
+    )
+    used = estimate_tokens(_SYSTEM_PROMPT) + estimate_tokens(head) + estimate_tokens(_CLOSING)
+
+    chosen, shortened, dropped = {}, [], []
+    for name in _INTENT_SECTIONS[intent]:
+        variants = _SECTION_VARIANTS[name](analysis, intent)
+        for i, text in enumerate(variants):
+            cost = estimate_tokens(text)
+            if used + cost <= budget:
+                chosen[name] = text
+                used += cost
+                if i:
+                    shortened.append(name)
+                break
+        else:
+            if variants:
+                dropped.append(name)
+
+    context = chosen.pop("context", None)
+    prompt = "\n\n".join(([context] if context else []) + [head, *chosen.values(), _CLOSING])
+    report = {"intent": intent, "tokens": estimate_tokens(_SYSTEM_PROMPT) + estimate_tokens(prompt),
+              "chars": len(_SYSTEM_PROMPT) + len(prompt), "shortened": shortened, "dropped": dropped}
+    return _SYSTEM_PROMPT, prompt, report
+
+
+def _build_prompt(analysis: dict):
+    system, prompt, report = _compose(analysis, _PROMPT_TOKEN_BUDGET)
+    _PROMPT_TOKENS.observe(report["tokens"])
+    logger.info(
+        "LLM prompt (%s): ~%d tokens, %d chars, budget %d; shortened %s; dropped %s",
+        report["intent"], report["tokens"], report["chars"], _PROMPT_TOKEN_BUDGET,
+        ",".join(report["shortened"]) or "-", ",".join(report["dropped"]) or "-",
+    )
+    return system, prompt
+
+
+# ------------------------
+# Gemini client, deadlines and circuit breaker
+# ------------------------
+_LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 20))
+_LLM_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_MAX_WORKERS", 8)), thread_name_prefix="gemini")
+_MODEL = {"key": None, "model": None}
+_MODEL_LOCK = threading.Lock()
+
+
+class _CircuitBreaker:
+    """Skip the LLM for `cooldown` seconds after `threshold` consecutive failures."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            if time.monotonic() >= self.open_until:
+                # Half-open: let one trial call through and re-arm the cooldown
+                self.open_until = time.monotonic() + self.cooldown
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self.cooldown
+
+
+_BREAKER = _CircuitBreaker(
+    threshold=int(os.environ.get("LLM_BREAKER_FAILURES", 3)),
+    cooldown=float(os.environ.get("LLM_BREAKER_COOLDOWN", 60)),
+)
+
+
+def _gemini_model(gemini_key: str):
+    """Process-wide GenerativeModel, configured once (and again only if the key changes)."""
+    with _MODEL_LOCK:
+        if _MODEL["model"] is None or _MODEL["key"] != gemini_key:
+            import google.generativeai as genai
+            genai.configure(api_key=gemini_key)
+            _MODEL["model"] = genai.GenerativeModel("gemini-2.5-pro")
+            _MODEL["key"] = gemini_key
+        return _MODEL["model"]
+
+
+def _generate(gemini_key: str, analysis: dict, **kwargs):
+    model = _gemini_model(gemini_key)
+    return model.generate_content(
+        list(_build_prompt(analysis)), request_options={"timeout": _LLM_TIMEOUT_SECONDS}, **kwargs
+    )
+
+
+_LLM_CALLS = metrics.counter("llm_requests_total", "LLM explanations by outcome.", labels=("outcome",))
+_LLM_TOKENS = metrics.counter("llm_tokens_total", "Gemini tokens reported in usage metadata.", labels=("kind",))
+
+
+def _answer(resp) -> str:
+    """Text of a Gemini response, recording its token usage when reported."""
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None:
+        _LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, kind="prompt")
+        _LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, kind="completion")
+    _LLM_CALLS.inc(outcome="ok")
+    return resp.text.strip() if hasattr(resp, "text") else str(resp)
+
+
+def _fallback(analysis: dict, outcome: str, reason: str = "") -> str:
+    _LLM_CALLS.inc(outcome=outcome)
+    if outcome == "skipped":
+        return _skipped_explanation(analysis)
+    if not reason:
+        return _fallback_explanation(analysis)
+    return _fallback_explanation(analysis) + f"\n\n(Note: LLM fallback due to: {reason})"
+
+
+def _cached(key):
+    answer = _cache_get(key) if key else None
+    if answer is not None:
+        _LLM_CALLS.inc(outcome="cache_hit")
+    return answer
+
+
+def _skipped_explanation(analysis: dict) -> str:
+    return _fallback_explanation(analysis) + "\n\n(Note: LLM temporarily skipped after repeated failures.)"
+
+
+def llm_explain(analysis: dict, use_cache: bool = True) -> str:
     gemini_key = os.getenv("GEMINI_API_KEY")
     if not gemini_key:
-        return _fallback_explanation(analysis)
+        return _fallback(analysis, "no_key")
+
+    key = _cache_key(analysis) if use_cache else None
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+
+    if not _BREAKER.allow():
+        return _fallback(analysis, "skipped")
 
+    future = _LLM_POOL.submit(_generate, gemini_key, analysis)
     try:
-        import google.generativeai as genai
-        genai.configure(api_key=gemini_key)
+        resp = future.result(timeout=_LLM_TIMEOUT_SECONDS)
+        answer = _answer(resp)
+        _BREAKER.record_success()
+        if key:
+            _cache_put(key, answer)
+        return answer
+
+    except FutureTimeout:
+        # Detach: the worker is abandoned (or cancelled if it never started)
+        future.cancel()
+        _BREAKER.record_failure()
+        return _fallback(analysis, "timeout", f"no response within {_LLM_TIMEOUT_SECONDS:g}s")
+    except Exception as e:
+        _BREAKER.record_failure()
+        return _fallback(analysis, "error", e)
 
-        context = "\n".join([f"User: {m['user']}\nAssistant: {m['bot']}" for m in analysis.get("conversation_context", [])])
 
-        system = (
-            "You are a friendly business analyst who provides conversational summaries of sales data. "
-            "Always start with a natural intro like 'Based on yesterday’s sales' or 'According to this week’s data'. "
-            "Include total orders and total revenue in all answers. "
-            "Keep responses concise, human-like, and context-aware."
-        )
+async def llm_explain_async(analysis: dict, use_cache: bool = True) -> str:
+    """Awaitable llm_explain for the ASGI path: same cache, deadline, breaker and fallback."""
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_key:
+        return _fallback(analysis, "no_key")
 
-        prompt = f"""
-Previous Conversation:
-{context}
+    key = _cache_key(analysis) if use_cache else None
+    cached = _cached(key)
+    if cached is not None:
+        return cached
 
-User Question: {analysis['question']}
+    if not _BREAKER.allow():
+        return _fallback(analysis, "skipped")
 
-Date Range: {analysis['date_range']['label']} ({analysis['date_range']['start']} → {analysis['date_range']['end']})
+    try:
+        model = _gemini_model(gemini_key)
+        if hasattr(model, "generate_content_async"):
+            call = model.generate_content_async(
+                list(_build_prompt(analysis)), request_options={"timeout": _LLM_TIMEOUT_SECONDS}
+            )
+        else:
+            call = asyncio.wrap_future(_LLM_POOL.submit(_generate, gemini_key, analysis))
+        resp = await asyncio.wait_for(call, timeout=_LLM_TIMEOUT_SECONDS)
+        answer = _answer(resp)
+        _BREAKER.record_success()
+        if key:
+            _cache_put(key, answer)
+        return answer
+
+    except asyncio.TimeoutError:
+        _BREAKER.record_failure()
+        return _fallback(analysis, "timeout", f"no response within {_LLM_TIMEOUT_SECONDS:g}s")
+    except Exception as e:
+        _BREAKER.record_failure()
+        return _fallback(analysis, "error", e)
 
-Totals: {json.dumps(analysis['totals'])}
-Top Items: {json.dumps(analysis['top_items'][:5])}
-Trend: {json.dumps(analysis['trend'])}
 
-Now answer naturally and clearly with total revenue and total orders mentioned.
-"""
+def _pump_stream(gemini_key: str, analysis: dict, out: queue.Queue, cancelled: threading.Event):
+    try:
+        for chunk in _generate(gemini_key, analysis, stream=True):
+            if cancelled.is_set():
+                return
+            text = getattr(chunk, "text", "")
+            if text:
+                out.put(("chunk", text))
+        out.put(("done", None))
+    except Exception as e:
+        out.put(("error", e))
 
-        model = genai.GenerativeModel("gemini-2.5-pro")
-        resp = model.generate_content([system, prompt])
-        return resp.text.strip() if hasattr(resp, "text") else str(resp)
 
+def llm_explain_stream(analysis: dict, use_cache: bool = True):
+    """Like llm_explain, but yields the answer in chunks as Gemini produces them."""
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_key:
+        yield _fallback(analysis, "no_key")
+        return
+
+    key = _cache_key(analysis) if use_cache else None
+    cached = _cached(key)
+    if cached is not None:
+        yield cached
+        return
+
+    if not _BREAKER.allow():
+        yield _fallback(analysis, "skipped")
+        return
+
+    # The deadline applies to the first chunk and to every gap between chunks
+    out, cancelled, parts = queue.Queue(), threading.Event(), []
+    _LLM_POOL.submit(_pump_stream, gemini_key, analysis, out, cancelled)
+    try:
+        while True:
+            kind, value = out.get(timeout=_LLM_TIMEOUT_SECONDS)  # queue.Empty past the deadline
+            if kind == "error":
+                raise value
+            if kind == "done":
+                break
+            parts.append(value)
+            yield value
+
+        _BREAKER.record_success()
+        _LLM_CALLS.inc(outcome="ok")
+        if key and parts:
+            _cache_put(key, "".join(parts).strip())
+
+    except queue.Empty:
+        cancelled.set()
+        _BREAKER.record_failure()
+        prefix = "\n\n" if parts else ""
+        yield prefix + _fallback(analysis, "timeout", f"no response within {_LLM_TIMEOUT_SECONDS:g}s")
     except Exception as e:
-        return _fallback_explanation(analysis) + f"\n\n(Note: LLM fallback due to: {e})"
+        cancelled.set()
+        _BREAKER.record_failure()
+        prefix = "\n\n" if parts else ""
+        yield prefix + _fallback(analysis, "error", e)
+    finally:
+        cancelled.set()
@@ -0,0 +1,255 @@
+"""In-process counters, latency histograms and per-request stage timing.
+
+Metrics are exported in the Prometheus text format by GET /metrics. Code on
+the hot path wraps its work in `stage("name")`, which feeds the
+sales_insight_stage_seconds histogram and, when a request is being traced,
+that request's timing breakdown (returned with `"timing": true`).
+
+Set PROFILE_SLOW_REQUESTS_MS to turn on a sampling profiler: a background
+thread snapshots the stacks of requests that have run longer than the
+threshold (sys._current_frames, every PROFILE_SAMPLE_INTERVAL_MS) and the
+most frequent stacks are logged when such a request finishes.
+"""
+
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import traceback
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "sales_insight_"
+_DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.labels, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (seconds by default), optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=_DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, "") for n in self.labels))
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {cumulative}")
+        return lines
+
+
+def _register(cls, name, help, **kwargs):
+    with _REGISTRY_LOCK:
+        metric = _REGISTRY.get(_PREFIX + name)
+        if metric is None:
+            metric = _REGISTRY[_PREFIX + name] = cls(_PREFIX + name, help, **kwargs)
+        return metric
+
+
+def counter(name, help, labels=()):
+    """Get or create the counter sales_insight_<name>."""
+    return _register(Counter, name, help, labels=labels)
+
+
+def histogram(name, help, labels=(), buckets=_DEFAULT_BUCKETS):
+    """Get or create the histogram sales_insight_<name>."""
+    return _register(Histogram, name, help, labels=labels, buckets=buckets)
+
+
+def render(gauges=None):
+    """All registered metrics, plus `gauges` ({name: value}), in the Prometheus text format."""
+    lines = []
+    with _REGISTRY_LOCK:
+        metrics = sorted(_REGISTRY.values(), key=lambda m: m.name)
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render())
+    for name, value in sorted((gauges or {}).items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {_PREFIX}{name} gauge")
+        lines.append(f"{_PREFIX}{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------
+# Request tracing and stage timers
+# ------------------------
+STAGE_SECONDS = histogram("stage_seconds", "Time spent in each /ask pipeline stage.", labels=("stage",))
+REQUEST_SECONDS = histogram("request_seconds", "End-to-end request latency.", labels=("route",))
+REQUEST_ERRORS = counter("request_errors_total", "Requests that failed with an exception.", labels=("route",))
+
+_TRACE = ContextVar("sales_insight_trace", default=None)
+
+_PROFILE_THRESHOLD = float(os.environ.get("PROFILE_SLOW_REQUESTS_MS", 0)) / 1000.0
+_PROFILE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 10)) / 1000.0
+_INFLIGHT = {}  # thread id -> trace of the request running on it
+_INFLIGHT_LOCK = threading.Lock()
+_SAMPLER = {"thread": None}
+
+
+@contextmanager
+def stage(name):
+    """Time a block as pipeline stage `name` (histogram plus the current request's breakdown)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _TRACE.get()
+        if trace is not None:
+            with trace["lock"]:
+                trace["stages"][name] = trace["stages"].get(name, 0.0) + elapsed
+
+
+@contextmanager
+def track_request(route, profile=True):
+    """Trace one request: total latency, error count and, if enabled, slow-request profiling.
+
+    Yields the trace; `breakdown(trace)` turns it into the per-stage timing dict.
+    Pass profile=False when the request does not own its thread (e.g. on an event loop).
+    """
+    trace = {"route": route, "started": time.perf_counter(), "stages": {}, "samples": _Tally(),
+             "lock": threading.Lock()}
+    token = _TRACE.set(trace)
+    profiled = profile and _PROFILE_THRESHOLD > 0
+    if profiled:
+        _ensure_sampler()
+        with _INFLIGHT_LOCK:
+            _INFLIGHT[threading.get_ident()] = trace
+    try:
+        yield trace
+    except Exception:
+        REQUEST_ERRORS.inc(route=route)
+        raise
+    finally:
+        _TRACE.reset(token)
+        elapsed = time.perf_counter() - trace["started"]
+        REQUEST_SECONDS.observe(elapsed, route=route)
+        if profiled:
+            with _INFLIGHT_LOCK:
+                _INFLIGHT.pop(threading.get_ident(), None)
+            if trace["samples"]:
+                _log_profile(trace, elapsed)
+
+
+def breakdown(trace):
+    """Per-stage milliseconds recorded so far for a trace, plus the running total."""
+    with trace["lock"]:
+        timing = {f"{name}_ms": round(s * 1000, 3) for name, s in trace["stages"].items()}
+    timing["total_ms"] = round((time.perf_counter() - trace["started"]) * 1000, 3)
+    return timing
+
+
+def server_timing(trace):
+    """A Server-Timing header value for a trace."""
+    with trace["lock"]:
+        stages = list(trace["stages"].items())
+    return ", ".join(f"{name};dur={s * 1000:.1f}" for name, s in stages)
+
+
+# ------------------------
+# Sampling profiler (opt-in)
+# ------------------------
+def _ensure_sampler():
+    if _SAMPLER["thread"] is not None:
+        return
+    with _INFLIGHT_LOCK:
+        if _SAMPLER["thread"] is None:
+            _SAMPLER["thread"] = threading.Thread(target=_sample_forever, name="slow-request-sampler", daemon=True)
+            _SAMPLER["thread"].start()
+
+
+def _sample_forever():
+    while True:
+        time.sleep(_PROFILE_INTERVAL)
+        now = time.perf_counter()
+        with _INFLIGHT_LOCK:
+            slow = {tid: t for tid, t in _INFLIGHT.items() if now - t["started"] >= _PROFILE_THRESHOLD}
+        if not slow:
+            continue
+        frames = sys._current_frames()
+        for tid, trace in slow.items():
+            frame = frames.get(tid)
+            if frame is None:
+                continue
+            stack = tuple(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+                          for f in traceback.extract_stack(frame)[-12:])
+            trace["samples"][stack] += 1
+
+
+def _log_profile(trace, elapsed):
+    total = sum(trace["samples"].values())
+    lines = [f"Slow {trace['route']} request took {elapsed * 1000:.0f}ms; {total} stack samples:"]
+    for stack, n in trace["samples"].most_common(3):
+        lines.append(f"  {n}/{total} samples:")
+        lines.extend(f"    {frame}" for frame in stack)
+    logger.warning("\n".join(lines))
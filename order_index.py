@@ -0,0 +1,145 @@
+import bisect
+import heapq
+import threading
+from datetime import datetime
+from operator import itemgetter
+
+import columnar
+import shared_orders
+from order_store import order_key
+from records import OrderRecord, wall_clock
+from utils import single_day
+
+
+def created_at(o):
+    """Naive merchant wall-clock creation time of a locked order, or None if it should not be indexed."""
+    if o.get("state") != "locked":
+        return None
+    if isinstance(o, OrderRecord):
+        return o.local_created()
+    try:
+        return wall_clock(datetime.fromisoformat(o["createdTime"]))
+    except Exception:
+        return None
+
+
+def _rows(orders):
+    rows = []
+    for o in orders:
+        ct = created_at(o)
+        if ct is not None:
+            rows.append((ct, o))
+    rows.sort(key=itemgetter(0))
+    return rows
+
+
+class OrderIndex:
+    """Locked orders sorted by creation time, so any date window is a binary search away.
+
+    Timestamps are compared as naive merchant wall-clock times (records.wall_clock);
+    aware window bounds are converted the same way.
+    """
+
+    def __init__(self, orders=(), rows=None):
+        rows = _rows(orders) if rows is None else rows
+
+        self.version = 0
+        # Set when this index was derived from the previous one by a ChangeSet
+        self.base_version = None
+        self.changes = None
+        self.times = [ct for ct, _ in rows]
+        self.orders = [o for _, o in rows]
+        self._columns = None
+        self._columns_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def bounds(self, start_dt, end_dt):
+        """Return the [lo, hi) slice of orders created within [start_dt, end_dt]."""
+        lo = bisect.bisect_left(self.times, wall_clock(start_dt))
+        hi = bisect.bisect_right(self.times, wall_clock(end_dt))
+        return lo, max(lo, hi)
+
+    def between(self, start_dt, end_dt):
+        """Orders created within [start_dt, end_dt], oldest first."""
+        lo, hi = self.bounds(start_dt, end_dt)
+        return self.orders[lo:hi]
+
+    @classmethod
+    def presorted(cls, times, orders):
+        """An index over sequences already in creation order, e.g. a shared segment's mapped views."""
+        index = cls()
+        index.times = times
+        index.orders = orders
+        return index
+
+    def updated(self, changes):
+        """A new index with a ChangeSet applied; only the changed orders are parsed."""
+        stale = set(changes.removed)
+        stale.update(order_key(o) for o in changes.upserted)
+        kept = [(ct, o) for ct, o in zip(self.times, self.orders) if order_key(o) not in stale]
+        index = OrderIndex(rows=list(heapq.merge(kept, _rows(changes.upserted), key=itemgetter(0))))
+        index.base_version = self.version
+        index.changes = changes
+        return index
+
+    @property
+    def columns(self):
+        """Columnar copy of the indexed orders, built on first use (requires numpy)."""
+        with self._columns_lock:
+            if self._columns is None:
+                self._columns = columnar.OrderColumns(self.orders)
+            return self._columns
+
+    def aggregate(self, start_dt, end_dt):
+        """aggregate_metrics() for a window, computed on the columnar arrays."""
+        lo, hi = self.bounds(start_dt, end_dt)
+        return self.columns.aggregate(lo, hi, hourly=single_day(start_dt, end_dt))
+
+
+# One index per order snapshot; rebuilt only when fetch_recent_orders returns a new list.
+# Each rebuild bumps `version`, which downstream caches use as a data version.
+_INDEX = {"source": None, "index": None, "version": 0}
+_INDEX_LOCK = threading.Lock()
+
+
+def _install(index, orders):
+    _INDEX["version"] += 1
+    index.version = _INDEX["version"]
+    _INDEX["index"] = index
+    _INDEX["source"] = orders
+    return index
+
+
+def _build(orders):
+    """A fresh index, plus the ChangeSet from the previous one when the source published it."""
+    if isinstance(orders, shared_orders.Segment):
+        created = orders.created_order()
+        if created is not None:
+            return OrderIndex.presorted(*created), orders.changes_since(_INDEX["source"])
+    return OrderIndex(orders), None
+
+
+def index_for(orders):
+    """Return the OrderIndex for this order list, building it once per snapshot.
+
+    A shared segment already carries its creation order, so a follower's index
+    is a view over the mapping; the ChangeSet it carries lets rollups catch up
+    with a delta.
+    """
+    with _INDEX_LOCK:
+        if _INDEX["source"] is not orders:
+            index, changes = _build(orders)
+            if changes is not None and _INDEX["index"] is not None:
+                index.base_version = _INDEX["index"].version
+                index.changes = changes
+            _install(index, orders)
+        return _INDEX["index"]
+
+
+def on_orders_changed(old_orders, new_orders, changes):
+    """sales_api listener: derive the next index incrementally instead of rebuilding it."""
+    with _INDEX_LOCK:
+        if _INDEX["index"] is not None and _INDEX["source"] is old_orders:
+            _install(_INDEX["index"].updated(changes), new_orders)
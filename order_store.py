@@ -0,0 +1,103 @@
+"""Local order store keyed by order id, kept in sync with the orders API.
+
+Instead of replacing the whole order list on every refresh, changes are
+applied in place: new and modified orders are upserted, vanished or deleted
+orders are dropped, and each sync returns a ChangeSet describing exactly
+what moved so downstream indexes and rollups can update incrementally.
+"""
+
+import threading
+from typing import NamedTuple
+
+
+def order_key(o):
+    """Stable identity for an order (falls back to creation time + total when there is no id)."""
+    return o.get("id") or (o.get("createdTime"), o.get("total"))
+
+
+def _is_deleted(o):
+    return bool(o.get("deleted")) or o.get("state") == "deleted"
+
+
+def _later(a, b):
+    try:
+        return a > b
+    except TypeError:
+        return str(a) > str(b)
+
+
+class ChangeSet(NamedTuple):
+    version: int
+    upserted: list   # new or modified orders (latest copies)
+    removed: list    # keys of orders that were removed
+
+    def __bool__(self):
+        return bool(self.upserted or self.removed)
+
+    def then(self, later):
+        """One ChangeSet equivalent to applying this one and then `later`."""
+        upserted = {order_key(o): o for o in self.upserted}
+        removed = dict.fromkeys(self.removed)
+        for key in later.removed:
+            upserted.pop(key, None)
+            removed[key] = None
+        for o in later.upserted:
+            key = order_key(o)
+            removed.pop(key, None)
+            upserted[key] = o
+        return ChangeSet(later.version, list(upserted.values()), list(removed))
+
+
+class OrderStore:
+    def __init__(self):
+        self._orders = {}       # key -> order
+        self._list = []
+        self.version = 0
+        self.high_water = None  # latest modifiedTime/createdTime seen
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._orders)
+
+    def orders(self):
+        """Live orders as a list; the same list object is returned until something changes."""
+        return self._list
+
+    def replace_all(self, orders):
+        """Sync with a full payload: diff it against the store, removing orders that vanished."""
+        with self._lock:
+            incoming = {}
+            for o in orders:
+                if not _is_deleted(o):
+                    incoming[order_key(o)] = o
+            upserted = [o for k, o in incoming.items() if self._orders.get(k) != o]
+            removed = [k for k in self._orders if k not in incoming]
+            return self._commit(upserted, removed)
+
+    def apply_delta(self, orders):
+        """Sync with a payload that only holds orders created or modified since the high-water mark."""
+        with self._lock:
+            upserted, removed = [], []
+            for o in orders:
+                key = order_key(o)
+                if _is_deleted(o):
+                    if key in self._orders:
+                        removed.append(key)
+                elif self._orders.get(key) != o:
+                    upserted.append(o)
+            return self._commit(upserted, removed)
+
+    def _commit(self, upserted, removed):
+        if not upserted and not removed:
+            return ChangeSet(self.version, [], [])
+        self.version += 1
+        for key in removed:
+            self._orders.pop(key, None)
+        for o in upserted:
+            key = order_key(o)
+            self._orders[key] = o
+            mark = o.get("modifiedTime") or o.get("createdTime")
+            if mark is not None and (self.high_water is None or _later(mark, self.high_water)):
+                self.high_water = mark
+        self._list = list(self._orders.values())
+        return ChangeSet(self.version, upserted, removed)
@@ -0,0 +1,356 @@
+"""Compact, read-only order records decoded from the orders API.
+
+API orders arrive as JSON dicts that carry many fields we never read. The
+fetch path decodes them into slotted records instead. Only the fields that
+the aggregation and indexing code use are kept: id, state, total,
+created/modified time, and line items (name, price, unitQty). Item names and
+states are interned, timestamps are stored as integer epoch milliseconds
+plus a UTC offset in minutes, and each order's local day string is shared
+across all orders of that day.
+
+Records are Mappings, so existing code that does `o.get("total")` or
+`o["createdTime"]` keeps working, and a record compares equal to the dict it
+was decoded from (minus dropped fields). Timestamps are turned back into ISO
+strings on access; hot paths use `created_day()` and `Order.local_created()`
+to avoid that.
+
+Days and wall-clock times are in the merchant's timezone when MERCHANT_TZ is
+set (an IANA name such as "America/Chicago"). Otherwise they are in the
+offset the API sent with each timestamp.
+"""
+
+import os
+import sys
+import logging
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_TZ = {}
+
+
+def _merchant_tz(name):
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown MERCHANT_TZ %r; using the API's own offsets", name)
+        return None
+
+
+MERCHANT_TZ = _merchant_tz(os.environ.get("MERCHANT_TZ"))
+_OFFSETS = {}  # (tz, UTC quarter-hour) -> offset in minutes; zone transitions fall on quarter hours
+
+
+def _tz(offset):
+    tz = _TZ.get(offset)
+    if tz is None:
+        tz = _TZ[offset] = timezone(timedelta(minutes=offset))
+    return tz
+
+
+def _encode_time(value):
+    """(epoch ms, UTC offset in minutes) for an ISO string or epoch-ms int.
+
+    Naive timestamps get offset None; values that cannot be parsed are kept as-is.
+    """
+    if value is None or isinstance(value, bool):
+        return value, None
+    if isinstance(value, (int, float)):
+        return int(value), 0
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value, None
+    local = dt.replace(tzinfo=None)
+    ms = (local - _EPOCH) // timedelta(milliseconds=1)
+    if dt.tzinfo is None:
+        return ms, None
+    offset = int(dt.utcoffset() // timedelta(minutes=1))
+    return ms - offset * 60000, offset
+
+
+def _local(ms, offset):
+    return _EPOCH + timedelta(milliseconds=ms + (offset or 0) * 60000)
+
+
+def _wall_ms(ms, offset):
+    """Epoch ms shifted to merchant wall-clock time (naive timestamps are taken as already local)."""
+    tz = MERCHANT_TZ
+    if tz is None or offset is None:
+        return ms + (offset or 0) * 60000
+    key = (tz, ms // 900000)
+    minutes = _OFFSETS.get(key)
+    if minutes is None:
+        minutes = _OFFSETS[key] = int(datetime.fromtimestamp(key[1] * 900, tz).utcoffset() // timedelta(minutes=1))
+    return ms + minutes * 60000
+
+
+def _wall(ms, offset):
+    """Naive merchant wall-clock datetime for epoch ms."""
+    return _EPOCH + timedelta(milliseconds=_wall_ms(ms, offset))
+
+
+def wall_clock(dt):
+    """An aware datetime as naive merchant wall-clock time (naive datetimes pass through)."""
+    if MERCHANT_TZ is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(MERCHANT_TZ)
+    return dt.replace(tzinfo=None)
+
+
+def merchant_now():
+    """The current time in the merchant's timezone (UTC if MERCHANT_TZ is unset)."""
+    return datetime.now(MERCHANT_TZ or timezone.utc)
+
+
+def _decode_time(ms, offset):
+    if not isinstance(ms, int):
+        return ms
+    local = _local(ms, offset)
+    spec = "seconds" if ms % 1000 == 0 else "milliseconds"
+    if offset is not None:
+        local = local.replace(tzinfo=_tz(offset))
+    return local.isoformat(timespec=spec)
+
+
+_PLAIN_FIELDS = frozenset(("id", "state", "total"))
+
+
+class OrderRecord(Mapping, ABC):
+    """Read-only order interface shared by Order and shared_orders.SharedOrder.
+
+    Besides the Mapping API, records answer the hot-path questions directly.
+    They are abstract, so a subclass missing one fails when it is constructed.
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def day(self):
+        """Local "YYYY-MM-DD" creation day ("" if unknown)."""
+
+    @abstractmethod
+    def lines(self):
+        """[(name, price, qty)] with the defaults aggregate_metrics applies."""
+
+    @abstractmethod
+    def local_created(self):
+        """Creation time as a naive wall-clock datetime, or None."""
+
+    @abstractmethod
+    def hour(self):
+        """Local hour of creation, 0-23 (0 if unknown)."""
+
+    @abstractmethod
+    def stamps(self):
+        """(created ms, created offset, modified ms, modified offset), as _encode_time gives them."""
+
+
+class LineItem(Mapping):
+    __slots__ = ("name", "price", "unitQty")
+    _KEYS = __slots__
+
+    def __init__(self, name, price, unitQty):
+        self.name = sys.intern(name) if isinstance(name, str) else name
+        self.price = price
+        self.unitQty = unitQty
+
+    @classmethod
+    def from_api(cls, li):
+        return cls(li.get("name"), li.get("price"), li.get("unitQty"))
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self._KEYS else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (k for k in self._KEYS if getattr(self, k) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, LineItem):
+            return self.to_row() == other.to_row()
+        if isinstance(other, Mapping):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_row(self):
+        return [self.name, self.price, self.unitQty]
+
+    def __repr__(self):
+        return f"LineItem({dict(self)!r})"
+
+
+class Order(OrderRecord):
+    __slots__ = ("id", "state", "total", "lineItems", "_created", "_created_offset",
+                 "_modified", "_modified_offset", "_day")
+    _KEYS = ("id", "state", "total", "createdTime", "modifiedTime", "lineItems")
+
+    def __init__(self, id=None, state=None, total=None, created=(None, None), modified=(None, None), lineItems=()):
+        self.id = id
+        self.state = sys.intern(state) if isinstance(state, str) else state
+        self.total = total
+        self.lineItems = tuple(lineItems)
+        self._created, self._created_offset = created
+        self._modified, self._modified_offset = modified
+        if modified == created:
+            self._modified = self._created  # share the int instead of holding an equal copy
+        self._day = None
+        if isinstance(self._created, int):
+            self._day = sys.intern(_wall(*created).date().isoformat())
+        elif isinstance(self._created, str):
+            self._day = sys.intern(self._created[:10])
+
+    @classmethod
+    def from_api(cls, o):
+        """Decode one API order dict, keeping only the fields we use."""
+        state = o.get("state")
+        if o.get("deleted"):
+            state = "deleted"  # the store only needs to know it is gone
+        return cls(
+            id=o.get("id"),
+            state=state,
+            total=o.get("total"),
+            created=_encode_time(o.get("createdTime")),
+            modified=_encode_time(o.get("modifiedTime")),
+            lineItems=[LineItem.from_api(li) for li in o.get("lineItems") or ()],
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        oid, state, total, created, created_offset, modified, modified_offset, items = row
+        return cls(oid, state, total, (created, created_offset), (modified, modified_offset),
+                   [LineItem(*li) for li in items])
+
+    def to_row(self):
+        """Plain-list form used by the snapshot file."""
+        return [self.id, self.state, self.total, self._created, self._created_offset,
+                self._modified, self._modified_offset, [li.to_row() for li in self.lineItems]]
+
+    def to_dict(self):
+        """Plain dict with the kept fields, shaped like the API's."""
+        d = {k: self.get(k) for k in self}
+        if "lineItems" in d:
+            d["lineItems"] = [dict(li) for li in self.lineItems]
+        return d
+
+    def local_created(self):
+        """Creation time as a naive merchant wall-clock datetime (see wall_clock)."""
+        if not isinstance(self._created, int):
+            return None
+        return _wall(self._created, self._created_offset)
+
+    def day(self):
+        return self._day or ""
+
+    def hour(self):
+        if not isinstance(self._created, int):
+            return 0
+        return _wall_ms(self._created, self._created_offset) // 3600000 % 24
+
+    def stamps(self):
+        return (self._created, self._created_offset, self._modified, self._modified_offset)
+
+    def lines(self):
+        return [(li.name or "Unknown Item", int(li.price or 0), li.unitQty or 1) for li in self.lineItems]
+
+    def get(self, key, default=None):
+        if key in _PLAIN_FIELDS:
+            value = getattr(self, key)
+        elif key == "createdTime":
+            value = _decode_time(self._created, self._created_offset)
+        elif key == "modifiedTime":
+            value = _decode_time(self._modified, self._modified_offset)
+        elif key == "lineItems":
+            value = self.lineItems or None
+        else:
+            value = None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (k for k in self._KEYS if self.get(k) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, Order):
+            return self.to_row() == other.to_row()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Order({self.to_dict()!r})"
+
+
+def decode_orders(orders):
+    """API dicts (or snapshot rows) to Order records; records are passed through."""
+    out = []
+    for o in orders:
+        if isinstance(o, Order):
+            out.append(o)
+        elif isinstance(o, (list, tuple)):
+            out.append(Order.from_row(o))
+        else:
+            out.append(Order.from_api(o))
+    return out
+
+
+def order_lines(o):
+    """(name, price, qty) for each line item, with the defaults aggregate_metrics applies."""
+    if isinstance(o, OrderRecord):
+        return o.lines()
+    return [
+        (li.get("name") or "Unknown Item", int(li.get("price") or 0), li.get("unitQty") if li.get("unitQty") else 1)
+        for li in o.get("lineItems") or []
+    ]
+
+
+def created_day(o):
+    """The order's local "YYYY-MM-DD" day (createdTime[:10] for dict orders unless MERCHANT_TZ is set)."""
+    if isinstance(o, OrderRecord):
+        return o.day()
+    created = o.get("createdTime", "")
+    if MERCHANT_TZ is not None:
+        try:
+            return wall_clock(datetime.fromisoformat(created)).date().isoformat()
+        except (TypeError, ValueError):
+            pass
+    return created[:10]
+
+
+def created_hour(o):
+    """The order's local creation hour, 0-23 (0 if unknown)."""
+    if isinstance(o, OrderRecord):
+        return o.hour()
+    created = o.get("createdTime", "")
+    if MERCHANT_TZ is None and created[13:14] == ":":
+        return int(created[11:13]) if created[11:13].isdigit() else 0
+    try:
+        return wall_clock(datetime.fromisoformat(created)).hour
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,324 @@
+"""Per-day rollups so multi-day questions merge day buckets instead of rescanning orders.
+
+Each day bucket holds recorded revenue, calculated revenue, trend revenue,
+order count and per-item qty/revenue. Buckets are updated incrementally:
+every order's contribution is remembered, so a new, changed or removed
+order only touches the buckets it belongs to. A range query merges the
+buckets of the days fully inside the window and rescans raw orders only for
+the partial days at its edges (usually "today").
+
+Item names are interned to small integer ids, so a bucket's per-item totals
+are int -> [qty, revenue, lines] and top-K for a window is a sum over those
+followed by a bounded heap, never a full sort of the catalog.
+
+Buckets are merchant-local days (records.MERCHANT_TZ), and each one also
+keeps 24 hourly revenue/order slots. A window's daily series, its summary
+(growth, peak, trough) and, for single-day windows, its hourly series are
+read straight off the buckets.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from order_index import created_at
+from order_store import order_key
+from records import created_day, created_hour, order_lines, wall_clock
+from utils import HOURS, single_day, trend_summary
+
+
+def _contribution(o, intern):
+    """What one order adds to its day bucket, mirroring utils.aggregate_metrics."""
+    order_total = int(o.get("total") or 0)
+    items = []
+    line_total = 0
+    for name, price, qty in order_lines(o):
+        line_total += price
+        items.append((intern(name), qty, price * qty))
+    trend = order_total if order_total > 0 else line_total
+    return (order_total, line_total, trend, tuple(items), created_hour(o))
+
+
+class _Bucket:
+    __slots__ = ("revenue", "calc_revenue", "trend_revenue", "orders", "items", "hour_revenue", "hour_orders")
+
+    def __init__(self):
+        self.revenue = 0
+        self.calc_revenue = 0
+        self.trend_revenue = 0
+        self.orders = 0
+        self.items = {}  # item id -> [qty, revenue, line count], in first-seen order
+        self.hour_revenue = [0] * 24  # trend revenue per local hour
+        self.hour_orders = [0] * 24
+
+    def apply(self, contrib, sign=1):
+        order_total, line_total, trend, items, hour = contrib
+        self.revenue += sign * order_total
+        self.calc_revenue += sign * line_total
+        self.trend_revenue += sign * trend
+        self.orders += sign
+        self.hour_revenue[hour] += sign * trend
+        self.hour_orders[hour] += sign
+        for item, qty, rev in items:
+            stats = self.items.get(item)
+            if stats is None:
+                stats = self.items[item] = [0, 0, 0]
+            stats[0] += sign * qty
+            stats[1] += sign * rev
+            stats[2] += sign
+            if stats[2] == 0:
+                del self.items[item]
+
+
+class DailyRollups:
+    """Incrementally maintained per-day aggregates over locked orders."""
+
+    def __init__(self):
+        self._days = {}       # "YYYY-MM-DD" -> _Bucket
+        self._day_keys = []   # sorted keys of _days
+        self._contrib = {}    # order key -> (day, contribution)
+        self._names = []      # item id -> name
+        self._ids = {}        # name -> item id
+        self._matcher = None  # (name count, whole-word regex, lowercased name -> name), built lazily
+        self._lock = threading.Lock()
+
+    def _intern(self, name):
+        item = self._ids.get(name)
+        if item is None:
+            item = self._ids[name] = len(self._names)
+            self._names.append(name)
+        return item
+
+    def update(self, index):
+        """Sync the buckets with the orders in an OrderIndex, touching only what changed."""
+        with self._lock:
+            seen = set()
+            for o in index.orders:
+                key = order_key(o)
+                seen.add(key)
+                self._put(key, o)
+
+            for key in [k for k in self._contrib if k not in seen]:
+                self._drop(key)
+            self._prune()
+
+    def apply_changes(self, changes):
+        """Apply an order_store.ChangeSet; cost scales with the number of changed orders."""
+        with self._lock:
+            for key in changes.removed:
+                self._drop(key)
+            for o in changes.upserted:
+                if created_at(o) is None:
+                    self._drop(order_key(o))  # no longer locked (or unparseable)
+                else:
+                    self._put(order_key(o), o)
+            self._prune()
+
+    def _put(self, key, o):
+        entry = (created_day(o), _contribution(o, self._intern))
+        old = self._contrib.get(key)
+        if old == entry:
+            return
+        if old is not None:
+            self._bucket(old[0]).apply(old[1], -1)
+        self._bucket(entry[0]).apply(entry[1])
+        self._contrib[key] = entry
+
+    def _drop(self, key):
+        old = self._contrib.pop(key, None)
+        if old is not None:
+            self._bucket(old[0]).apply(old[1], -1)
+
+    def _prune(self):
+        for day in [d for d, b in self._days.items() if b.orders == 0]:
+            del self._days[day]
+        self._day_keys = sorted(self._days)
+
+    def _bucket(self, day):
+        bucket = self._days.get(day)
+        if bucket is None:
+            bucket = self._days[day] = _Bucket()
+        return bucket
+
+    @staticmethod
+    def _whole_days(start, end):
+        """First and last day lying entirely inside [start, end]."""
+        first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+        last_day = end.date() if end.time() == time.max else end.date() - timedelta(days=1)
+        return first_day, last_day
+
+    def _window(self, index, start_dt, end_dt):
+        """Day -> bucket for a window, in day order: stored buckets for whole days, fresh ones for partial edges.
+
+        Caller holds the lock. Returns None if no whole day falls inside the window.
+        """
+        start = wall_clock(start_dt)
+        end = wall_clock(end_dt)
+        first_day, last_day = self._whole_days(start, end)
+        if first_day > last_day:
+            return None
+
+        # Raw orders for the partial days at either edge of the window
+        head = index.between(start, datetime.combine(first_day, time.min) - timedelta(microseconds=1))
+        tail = index.between(datetime.combine(last_day, time.max) + timedelta(microseconds=1), end)
+
+        merged = self._scan(head)
+        lo = bisect.bisect_left(self._day_keys, first_day.isoformat())
+        hi = bisect.bisect_right(self._day_keys, last_day.isoformat())
+        for day in self._day_keys[lo:hi]:
+            merged[day] = self._days[day]
+        merged.update(self._scan(tail))
+        return merged
+
+    def _top(self, buckets, k, by):
+        """Top k items over some day buckets, ties in first-seen order like Counter.most_common."""
+        rank = 0 if by == "qty" else 1
+        if len(buckets) == 1:
+            totals = buckets[0].items
+        else:
+            totals = {}
+            for bucket in buckets:
+                for item, stats in bucket.items.items():
+                    acc = totals.get(item)
+                    if acc is None:
+                        totals[item] = [stats[0], stats[1]]
+                    else:
+                        acc[0] += stats[0]
+                        acc[1] += stats[1]
+        best = heapq.nlargest(k, totals.items(), key=lambda kv: kv[1][rank])
+        return [
+            {"name": self._names[item], "qty": int(stats[0]), "revenue_cents": int(stats[1])}
+            for item, stats in best
+        ]
+
+    def metrics(self, index, start_dt, end_dt, top_n=10):
+        """aggregate_metrics() for [start_dt, end_dt], or None if no whole day falls inside it."""
+        with self._lock:
+            merged = self._window(index, start_dt, end_dt)
+            if merged is None:
+                return None
+
+            order_count = total = calc = 0
+            trend_daily = {}
+            for day, bucket in merged.items():
+                order_count += bucket.orders
+                total += bucket.revenue
+                calc += bucket.calc_revenue
+                trend_daily[day] = (bucket.trend_revenue, bucket.orders)
+            top_items = self._top(list(merged.values()), top_n, "qty")
+            trend_hourly = None
+            if single_day(start_dt, end_dt):
+                bucket = next(iter(merged.values()), None) or _Bucket()
+                trend_hourly = dict(zip(HOURS, zip(bucket.hour_revenue, bucket.hour_orders)))
+
+        return {
+            "order_count": order_count,
+            "total_revenue_cents": total,
+            "calc_revenue_cents": calc,
+            "aov_cents": int(total / order_count) if order_count else 0,
+            "top_items": top_items,
+            "trend_daily": trend_daily,
+            "trend_summary": trend_summary(trend_daily),
+            "trend_hourly": trend_hourly,
+        }
+
+    def top_items(self, index, start_dt, end_dt, k=10, by="qty"):
+        """Top k items in a window ranked by "qty" or "revenue", or None if no whole day fits."""
+        with self._lock:
+            merged = self._window(index, start_dt, end_dt)
+            return None if merged is None else self._top(list(merged.values()), k, by)
+
+    def _name_matcher(self):
+        """Whole-word, case-insensitive regex over the interned names; rebuilt only when new names appear.
+
+        Caller holds the lock.
+        """
+        if self._matcher is None or self._matcher[0] != len(self._names):
+            by_lower = {}
+            for name in self._names:
+                if len(name) >= 3:
+                    by_lower.setdefault(name.lower(), name)
+            # Longest names first, so "Iced Tea" wins over "Tea" at the same position
+            alternatives = "|".join(re.escape(n) for n in sorted(by_lower, key=len, reverse=True))
+            pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE) if alternatives else None
+            self._matcher = (len(self._names), pattern, by_lower)
+        return self._matcher[1:]
+
+    def find_item(self, text):
+        """The longest known item name mentioned in text as a whole word (case-insensitive), or None."""
+        with self._lock:
+            pattern, by_lower = self._name_matcher()
+        if pattern is None:
+            return None
+        names = [by_lower[m.group(0).lower()] for m in pattern.finditer(text)]
+        return max(names, key=len) if names else None
+
+    def item_history(self, name, start_day=None, end_day=None):
+        """Per-day {"qty", "revenue_cents", "orders"} for one item over whole-day buckets.
+
+        Days are "YYYY-MM-DD" strings or dates; None means unbounded.
+        """
+        with self._lock:
+            item = self._ids.get(name)
+            if item is None:
+                return {}
+            lo = 0 if start_day is None else bisect.bisect_left(self._day_keys, str(start_day))
+            hi = len(self._day_keys) if end_day is None else bisect.bisect_right(self._day_keys, str(end_day))
+            history = {}
+            for day in self._day_keys[lo:hi]:
+                stats = self._days[day].items.get(item)
+                if stats is not None:
+                    history[day] = {"qty": int(stats[0]), "revenue_cents": int(stats[1]), "orders": stats[2]}
+            return history
+
+    def _scan(self, orders):
+        """Bucket a handful of raw orders by day (used for partial edge days)."""
+        buckets = {}
+        for o in orders:
+            day = created_day(o)
+            bucket = buckets.get(day)
+            if bucket is None:
+                bucket = buckets[day] = _Bucket()
+            bucket.apply(_contribution(o, self._intern))
+        return buckets
+
+
+# A single store per process, synced whenever a new order index is built. When
+# the index was derived from the one we last synced with, only its ChangeSet
+# is applied; otherwise the buckets are diffed against the whole index. Syncing
+# and querying happen under one lock, so a request never reads buckets another
+# request has since moved to a different snapshot.
+_ROLLUPS = DailyRollups()
+_SYNCED = {"index": lambda: None, "version": None}
+_SYNC_LOCK = threading.Lock()
+
+
+def _sync(index):
+    """Bring the rollups up to date with this index; None if they reflect a newer one. Caller holds _SYNC_LOCK."""
+    if _SYNCED["index"]() is not index:
+        if _SYNCED["version"] is not None and index.version < _SYNCED["version"]:
+            return None  # an older snapshot: rolling the buckets back would undo a newer request's sync
+        if index.changes is not None and index.base_version == _SYNCED["version"]:
+            _ROLLUPS.apply_changes(index.changes)
+        else:
+            _ROLLUPS.update(index)
+        _SYNCED["index"] = weakref.ref(index)
+        _SYNCED["version"] = index.version
+    return _ROLLUPS
+
+
+@contextmanager
+def synced_rollups(index):
+    """The process-wide rollups synced with this index, held for the block; None if the index is outdated."""
+    with _SYNC_LOCK:
+        yield _sync(index)
+
+
+def rollups_metrics(index, start_dt, end_dt, top_n=10):
+    """DailyRollups.metrics() over this index's snapshot, or None when the rollups cannot answer."""
+    with synced_rollups(index) as rollups:
+        return None if rollups is None else rollups.metrics(index, start_dt, end_dt, top_n)
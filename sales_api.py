@@ -1,38 +1,482 @@
 import os
 import json
 import time
+import logging
+import threading
+from contextlib import contextmanager
 import requests
+from order_store import OrderStore
+import records
+import shared_orders
+from archive import Archive
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-API_URL = "https://sandbox.mkonnekt.net/ch-portal/api/v1/orders/recent"
+try:
+    import msgpack
+except ImportError:  # optional: fall back to JSON snapshots
+    msgpack = None
 
-# Simple in-memory cache (60s)
-_CACHE = {"data": None, "ts": 0}
-_TTL_SECONDS = 60
+try:
+    import brotli  # noqa: F401  (lets urllib3 decode "br" responses)
+    _ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    _ACCEPT_ENCODING = "gzip, deflate"
 
-def fetch_recent_orders():
-    """Fetch recent orders from the sandbox API with flexible format handling."""
-    now = time.time()
-    if _CACHE["data"] is not None and now - _CACHE["ts"] < _TTL_SECONDS:
-        return _CACHE["data"]
+try:
+    import fcntl
+except ImportError:  # not available on Windows; snapshot writes are still atomic
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.environ.get("ORDERS_API_URL", "https://sandbox.mkonnekt.net/ch-portal/api/v1/orders/recent")
+
+# In-memory cache with stale-while-revalidate semantics:
+#   age < soft TTL            -> serve cached orders
+#   soft TTL <= age < hard TTL -> serve cached orders, refresh in the background
+#   age >= hard TTL           -> refresh now (one caller fetches, the rest wait on it)
+# If a refresh fails, the last good snapshot keeps being served and the
+# upstream is not retried until the backoff window has passed.
+_CACHE = {"data": None, "ts": 0, "error": None, "retry_at": 0, "snapshot_loaded": False}
+_SOFT_TTL_SECONDS = float(os.environ.get("ORDERS_CACHE_SOFT_TTL", 60))
+_HARD_TTL_SECONDS = float(os.environ.get("ORDERS_CACHE_HARD_TTL", 300))
+_RETRY_BACKOFF_SECONDS = float(os.environ.get("ORDERS_CACHE_RETRY_BACKOFF", 10))
+_TIMEOUT_SECONDS = float(os.environ.get("ORDERS_API_TIMEOUT", 15))
+
+# The last good order set is also persisted to a local snapshot file. Workers
+# load it on their first call instead of hitting the API, and refreshes are
+# serialized across processes with a file lock so a fresh snapshot written by
+# one worker is picked up by the others.
+_SNAPSHOT_BASE = os.environ.get(
+    "ORDERS_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "orders_snapshot"),
+)
+_SNAPSHOT_PATH = _SNAPSHOT_BASE + (".msgpack" if msgpack else ".json")
+
+# Orders live in a local store keyed by id. In "full" sync mode each payload is
+# diffed against the store; in "delta" mode only orders modified since the
+# store's high-water mark are requested (via ORDERS_SINCE_PARAM) and upserted.
+# Either way, listeners registered with on_orders_changed() get the ChangeSet.
+_SYNC_MODE = os.environ.get("ORDERS_SYNC_MODE", "full")
+_SINCE_PARAM = os.environ.get("ORDERS_SINCE_PARAM", "modifiedSince")
+_STORE = OrderStore()
+_LISTENERS = []
+
+# Multi-worker mode (ORDERS_SHARED_DIR set, ideally on /dev/shm): one elected
+# worker per host polls the API and publishes each order set into a shared,
+# memory-mapped segment; every other worker serves orders straight from that
+# mapping and never calls the API itself. If the leader dies, its flock is
+# released and the first worker to find the segment going stale takes over.
+_SHARED_DIR = os.environ.get("ORDERS_SHARED_DIR", "")
+_SHARED = {"reader": None, "leader": None, "published": None, "pending": None, "shared_at": 0.0}
+_SHARE_LOCK = threading.Lock()  # serializes segment writes, which happen outside _LOCK
+# Identifies this process's store versions in published deltas: a new leader
+# numbers its versions afresh, so followers only chain deltas from the same lineage.
+_LINEAGE = int.from_bytes(os.urandom(7), "big")
+
+# Every ingested order is also appended to a local, month-partitioned archive
+# (ORDERS_ARCHIVE_DIR) so windows reaching back past the API's retention can
+# still be answered. Only the process that talks to the API writes it.
+_ARCHIVE_DIR = os.environ.get("ORDERS_ARCHIVE_DIR", "")
+_ARCHIVE = {"archive": None}
+
+_LOCK = threading.Lock()
+_REFRESH_DONE = threading.Condition(_LOCK)
+_REFRESHING = False
+
+
+# One pooled keep-alive session per process, with retry/backoff on transient errors.
+# Refreshes send the last ETag / Last-Modified so an unchanged dataset costs a 304.
+_SESSION = {"session": None}
+_VALIDATORS = {"etag": None, "last_modified": None}
+_FETCH_STATS = {
+    "requests": 0,
+    "not_modified": 0,
+    "errors": 0,
+    "bytes_received": 0,
+    "bytes_decoded": 0,
+    "last_status": None,
+    "last_duration_ms": None,
+    "last_bytes_received": None,
+    "total_duration_ms": 0.0,
+}
+
+
+def _session():
+    if _SESSION["session"] is None:
+        retry = Retry(
+            total=int(os.environ.get("ORDERS_API_RETRIES", 2)),
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+        )
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=4))
+        session.mount("http://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=4))
+        session.headers.update({"Accept": "application/json", "Accept-Encoding": _ACCEPT_ENCODING})
+        _SESSION["session"] = session
+    return _SESSION["session"]
+
+
+def fetch_stats():
+    """Timings and transfer sizes of orders API calls made by this process."""
+    stats = dict(_FETCH_STATS)
+    stats["avg_duration_ms"] = round(stats["total_duration_ms"] / stats["requests"], 1) if stats["requests"] else None
+    stats["total_duration_ms"] = round(stats["total_duration_ms"], 1)
+    if _SHARED_DIR and _SHARED["reader"] is not None:
+        seg = _SHARED["reader"].segment
+        stats["shared"] = {
+            "role": "leader" if _SHARED["leader"].held else "follower",
+            "segment_version": seg.version if seg else None,
+            "segment_orders": len(seg) if seg else 0,
+        }
+    if order_archive() is not None:
+        stats["archive"] = order_archive().stats()
+    return stats
+
+
+def order_archive():
+    """The local order archive, or None when ORDERS_ARCHIVE_DIR is not set."""
+    if _ARCHIVE_DIR and _ARCHIVE["archive"] is None:
+        _ARCHIVE["archive"] = Archive(_ARCHIVE_DIR, int(os.environ.get("ORDERS_ARCHIVE_COMPACT_AFTER", 32)))
+    return _ARCHIVE["archive"]
 
+
+def _archive(changes):
+    archive = order_archive()
+    if archive is None or not changes.upserted:
+        return
     try:
-        resp = requests.get(API_URL, timeout=15)
+        archive.append(changes.upserted)
+    except (OSError, RuntimeError) as e:
+        logger.warning("Could not append to order archive %s: %s", _ARCHIVE_DIR, e)
+
+
+def _delta_sync():
+    return _SYNC_MODE == "delta" and len(_STORE) > 0 and _STORE.high_water is not None
+
+
+def _download_orders():
+    """Fetch and unwrap the order list from the sandbox API; None if unchanged (304)."""
+    params = {_SINCE_PARAM: _STORE.high_water} if _delta_sync() else None
+    headers = {}
+    if _CACHE["data"] is not None:
+        if _VALIDATORS["etag"]:
+            headers["If-None-Match"] = _VALIDATORS["etag"]
+        if _VALIDATORS["last_modified"]:
+            headers["If-Modified-Since"] = _VALIDATORS["last_modified"]
+
+    started = time.perf_counter()
+    _FETCH_STATS["requests"] += 1
+    try:
+        resp = _session().get(API_URL, params=params, headers=headers, timeout=_TIMEOUT_SECONDS)
+        _record_fetch(resp, started)
+        if resp.status_code == 304 and _CACHE["data"] is not None:
+            _FETCH_STATS["not_modified"] += 1
+            return None
         resp.raise_for_status()
         data = resp.json()
 
+        _VALIDATORS["etag"] = resp.headers.get("ETag")
+        _VALIDATORS["last_modified"] = resp.headers.get("Last-Modified")
+
         # ✅ The API might return a dict with "orders" instead of a top-level list
         if isinstance(data, dict) and "orders" in data:
-            orders = data["orders"]
-        elif isinstance(data, list):
-            orders = data
-        else:
+            data = data["orders"]
+        elif not isinstance(data, list):
             raise ValueError("Unexpected response format: missing 'orders' key or list.")
-
-        _CACHE["data"] = orders
-        _CACHE["ts"] = now
-        return orders
+        # Keep only the fields we use, in compact records (see records.py)
+        return records.decode_orders(data)
 
     except requests.exceptions.RequestException as e:
+        _FETCH_STATS["errors"] += 1
         raise RuntimeError(f"Sales API request failed: {e}")
     except ValueError as ve:
+        _FETCH_STATS["errors"] += 1
         raise RuntimeError(f"Sales API returned invalid JSON: {ve}")
+
+
+def _record_fetch(resp, started):
+    duration_ms = (time.perf_counter() - started) * 1000
+    try:
+        received = resp.raw.tell()  # bytes read off the wire, before decompression
+    except Exception:
+        received = int(resp.headers.get("Content-Length") or 0)
+    _FETCH_STATS["last_status"] = resp.status_code
+    _FETCH_STATS["last_duration_ms"] = round(duration_ms, 1)
+    _FETCH_STATS["last_bytes_received"] = received
+    _FETCH_STATS["total_duration_ms"] += duration_ms
+    _FETCH_STATS["bytes_received"] += received
+    _FETCH_STATS["bytes_decoded"] += len(resp.content)
+
+
+# ------------------------
+# Snapshot persistence
+# ------------------------
+def _read_snapshot(newer_than=0):
+    """Load the snapshot file, or None if missing, unreadable or not newer than `newer_than`."""
+    try:
+        if os.stat(_SNAPSHOT_PATH).st_mtime <= newer_than:
+            return None
+        with open(_SNAPSHOT_PATH, "rb") as f:
+            raw = f.read()
+        snap = msgpack.unpackb(raw, raw=False) if msgpack else json.loads(raw)
+        if not isinstance(snap.get("orders"), list) or snap.get("ts", 0) <= newer_than:
+            return None
+        snap["orders"] = records.decode_orders(snap["orders"])
+        return snap
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable order snapshot %s: %s", _SNAPSHOT_PATH, e)
+        return None
+
+
+def _write_snapshot(orders, ts):
+    """Atomically replace the snapshot file with the given order set."""
+    rows = [o.to_row() for o in records.decode_orders(orders)]
+    snap = {"ts": ts, "orders": rows, "validators": dict(_VALIDATORS)}
+    tmp = f"{_SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(_SNAPSHOT_PATH), exist_ok=True)
+        with open(tmp, "wb") as f:
+            if msgpack:
+                f.write(msgpack.packb(snap, use_bin_type=True))
+            else:
+                f.write(json.dumps(snap, separators=(",", ":")).encode("utf-8"))
+        os.replace(tmp, _SNAPSHOT_PATH)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Could not write order snapshot %s: %s", _SNAPSHOT_PATH, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+@contextmanager
+def _snapshot_lock():
+    """Cross-process lock so only one worker per host refreshes at a time."""
+    if fcntl is None:
+        yield
+        return
+    try:
+        os.makedirs(os.path.dirname(_SNAPSHOT_PATH), exist_ok=True)
+        f = open(_SNAPSHOT_BASE + ".lock", "a")
+    except OSError:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load_snapshot_once():
+    """Seed the in-memory cache from disk on the first call. Caller holds _LOCK."""
+    if _CACHE["snapshot_loaded"]:
+        return
+    _CACHE["snapshot_loaded"] = True
+    snap = _read_snapshot()
+    if snap and _CACHE["data"] is None:
+        _publish(_STORE.replace_all(snap["orders"]), snap["ts"])
+        _VALIDATORS.update(snap.get("validators") or {})
+
+
+# ------------------------
+# Refresh
+# ------------------------
+def on_orders_changed(listener):
+    """Register listener(old_orders, new_orders, changes), called whenever the order set changes."""
+    _LISTENERS.append(listener)
+
+
+def _publish(changes, ts):
+    """Swap in the store's current order list and notify listeners. Caller holds _LOCK."""
+    old, new = _CACHE["data"], _STORE.orders()
+    if changes:
+        for listener in _LISTENERS:
+            try:
+                listener(old, new, changes)
+            except Exception as e:
+                logger.warning("Order change listener %r failed: %s", listener, e)
+    _CACHE["data"] = new
+    _CACHE["ts"] = ts
+    _CACHE["error"] = None
+    if _SHARED_DIR and _SHARED["leader"] is not None and _SHARED["leader"].held:
+        # Encoding the segment is slow, so it is only queued here; _flush_share() writes it.
+        # Changes queued but not yet written are folded in, so followers still get one delta.
+        base = changes.version - 1 if changes else None
+        queued = _SHARED.get("pending")
+        if queued is not None and queued[3]:
+            changes, base = (queued[3].then(changes) if changes else queued[3]), queued[4]
+        _SHARED["pending"] = (new, _STORE.version, ts, changes, base)
+
+
+# ------------------------
+# Shared segment (multi-worker mode)
+# ------------------------
+def _shared():
+    if _SHARED["reader"] is None:
+        _SHARED["reader"] = shared_orders.Reader(_SHARED_DIR)
+        _SHARED["leader"] = shared_orders.Leadership(_SHARED_DIR)
+    return _SHARED["reader"], _SHARED["leader"]
+
+
+def _share(orders, version, ts, changes, base):
+    """Leader: publish the order set to the other workers (a 304 only marks it fresh).
+
+    The ChangeSet since version `base` goes along so followers can apply it as a delta.
+    """
+    try:
+        if changes or _SHARED["published"] is None:
+            shared_orders.write(_SHARED_DIR, orders, version, ts, _LINEAGE, base, changes)
+            _SHARED["published"] = version
+        else:
+            shared_orders.touch(_SHARED_DIR, ts)
+        _SHARED["shared_at"] = time.time()
+    except OSError as e:
+        logger.warning("Could not publish shared order segment in %s: %s", _SHARED_DIR, e)
+
+
+def _flush_share():
+    """Write the order set queued by _publish, if any. Must be called without holding _LOCK."""
+    with _SHARE_LOCK:
+        with _LOCK:
+            pending, _SHARED["pending"] = _SHARED.get("pending"), None
+        if pending is not None:
+            _share(*pending)
+
+
+def _lead_forever():
+    """Leader sidecar: keep the shared segment fresh even when this worker gets no traffic.
+
+    If nothing has been published for as long as followers tolerate (a wedged or
+    failing refresh), leadership is given up so another worker can take over.
+    """
+    global _REFRESHING
+    leader = _SHARED["leader"]
+    while leader.held:
+        time.sleep(_SOFT_TTL_SECONDS)
+        try:
+            with _LOCK:
+                start = not _REFRESHING
+                _REFRESHING = True
+            if start:
+                _refresh()
+        except Exception as e:
+            logger.warning("Order refresher in worker %s failed: %s", os.getpid(), e)
+        if time.time() - _SHARED.get("shared_at", 0.0) >= 2 * _SOFT_TTL_SECONDS:
+            logger.warning("Worker %s stopped publishing orders to %s; giving up leadership", os.getpid(), _SHARED_DIR)
+            leader.release()
+
+
+def _shared_segment():
+    """Followers: the current shared segment. None means this process leads (use the normal path)."""
+    reader, leader = _shared()
+    deadline = time.time() + _TIMEOUT_SECONDS
+    while not leader.held:
+        seg, ts = reader.current()
+        fresh = seg is not None and time.time() - ts < 2 * _SOFT_TTL_SECONDS
+        if not fresh and leader.try_acquire():
+            logger.info("Worker %s is now the order refresher for %s", os.getpid(), _SHARED_DIR)
+            _SHARED["shared_at"] = time.time()
+            threading.Thread(target=_lead_forever, name="orders-leader", daemon=True).start()
+            break
+        if seg is not None:
+            return seg
+        if time.time() >= deadline:
+            raise RuntimeError("Sales API request failed: no shared order snapshot has been published yet.")
+        time.sleep(0.05)
+    return None
+
+
+def _refresh():
+    """Run a single upstream fetch and publish the result to waiting callers."""
+    global _REFRESHING
+    error = None
+    try:
+        with _snapshot_lock():
+            try:
+                # Another worker may have refreshed the shared snapshot while we waited.
+                snap = _read_snapshot(newer_than=_CACHE["ts"])
+                if snap and time.time() - snap["ts"] < _SOFT_TTL_SECONDS:
+                    _VALIDATORS.update(snap.get("validators") or {})
+                    with _LOCK:
+                        _publish(_STORE.replace_all(snap["orders"]), snap["ts"])
+                    _flush_share()
+                else:
+                    delta = _delta_sync()
+                    payload = _download_orders()
+                    ts = time.time()
+                    with _LOCK:
+                        if payload is None:
+                            changes = None  # 304: same list, so downstream indexes are kept
+                        elif delta:
+                            changes = _STORE.apply_delta(payload)
+                        else:
+                            changes = _STORE.replace_all(payload)
+                        _publish(changes, ts)
+                    _flush_share()
+                    if changes:
+                        _write_snapshot(_STORE.orders(), ts)
+                        _archive(changes)
+            except RuntimeError as e:
+                error = e
+    finally:
+        # Whatever fails above (a listener, the snapshot, sharing, archiving), the
+        # single-flight flag must clear or every later caller would wait forever.
+        with _LOCK:
+            if error is not None:
+                _CACHE["error"] = error
+                _CACHE["retry_at"] = time.time() + _RETRY_BACKOFF_SECONDS
+            _REFRESHING = False
+            _REFRESH_DONE.notify_all()
+
+
+def _start_background_refresh():
+    """Kick off a refresh thread unless one is already running. Caller holds _LOCK."""
+    global _REFRESHING
+    if _REFRESHING:
+        return
+    _REFRESHING = True
+    threading.Thread(target=_refresh, name="orders-refresh", daemon=True).start()
+
+
+def fetch_recent_orders():
+    """Fetch recent orders from the sandbox API with flexible format handling."""
+    global _REFRESHING
+    if _SHARED_DIR:
+        segment = _shared_segment()
+        if segment is not None:
+            return segment
+    if not _CACHE["snapshot_loaded"]:
+        with _LOCK:
+            _load_snapshot_once()
+        _flush_share()
+    with _LOCK:
+        now = time.time()
+        age = now - _CACHE["ts"]
+        if _CACHE["data"] is not None:
+            backing_off = now < _CACHE["retry_at"]
+            if age < _HARD_TTL_SECONDS or backing_off:
+                if age >= _SOFT_TTL_SECONDS and not backing_off:
+                    _start_background_refresh()
+                return _CACHE["data"]
+
+        # Hard-expired or empty: join an in-flight refresh or run one ourselves.
+        if _REFRESHING:
+            _REFRESH_DONE.wait_for(lambda: not _REFRESHING)
+            if _CACHE["data"] is not None:
+                return _CACHE["data"]
+            raise _CACHE["error"] or RuntimeError("Sales API request failed.")
+        _REFRESHING = True
+
+    _refresh()
+
+    with _LOCK:
+        if _CACHE["data"] is not None:
+            return _CACHE["data"]
+        raise _CACHE["error"] or RuntimeError("Sales API request failed.")
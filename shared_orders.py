@@ -0,0 +1,411 @@
+"""Order snapshot shared by all worker processes on a host through one mmap'd file.
+
+One elected worker (whoever holds the leader flock) fetches orders and
+encodes them into a segment: fixed-width int64 columns for orders and line
+items plus a deduplicated string table. The segment is written to a temp
+file and swapped in with os.replace, so readers always see a complete
+version. Readers mmap the current file and answer every field lookup
+straight from the mapping through memoryview casts. The pages live in the
+page cache once per host (on /dev/shm, in RAM), however many workers read
+them. A reader keeps its old mapping until it sees a new inode, so a swap
+never tears an in-flight request.
+
+The writer also publishes what followers would otherwise recompute per
+version: the positions of indexable orders in creation order (so a follower's
+OrderIndex is a view over the mapping, not a private sorted copy) and, when
+the previous version it published is known, the orders changed since then
+(so rollups apply a delta instead of re-walking every order).
+"""
+
+import os
+import mmap
+import time
+import struct
+import threading
+from array import array
+from collections.abc import Sequence
+from operator import itemgetter
+
+from order_store import ChangeSet
+from records import LineItem, OrderRecord, _decode_time, _encode_time, _wall, _wall_ms
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows: every process leads its own (private) segment
+    fcntl = None
+
+_MAGIC = b"SIORD02\0"
+_NONE = -(2 ** 63)
+_ORDER_COLS = ("created", "created_offset", "modified", "modified_offset", "total", "state", "id", "day", "line_start")
+_LINE_COLS = ("price", "qty", "name")
+# by_created: positions of locked orders sorted by wall-clock creation time.
+# delta: [lineage, base version or _NONE]; changed/removed describe the step from the base version.
+_INDEX_COLS = ("by_created", "delta", "changed", "removed")
+_SECTIONS = _ORDER_COLS + _LINE_COLS + _INDEX_COLS + ("str_offsets", "str_blob")
+_FORMATS = {  # magic -> section layout; version 1 segments (older archive files) have no index sections
+    b"SIORD01\0": _ORDER_COLS + _LINE_COLS + ("str_offsets", "str_blob"),
+    _MAGIC: _SECTIONS,
+}
+_HEADER = struct.Struct("<8sQdQQQ")  # magic, version, ts, orders, lines, strings
+_SECTION = struct.Struct("<QQ")      # byte offset, byte length
+SEGMENT_NAME = "orders.seg"
+
+
+# ------------------------
+# Writer
+# ------------------------
+def _int(value):
+    return _NONE if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) else int(value)
+
+
+def encode(orders, version, ts, lineage=None, base=None, changes=None):
+    """Serialize orders (dicts or records) into segment bytes.
+
+    `lineage` names the writer's version sequence, and `changes` is the
+    ChangeSet taking the order set from version `base` of it to this one. The
+    delta is dropped unless every changed order has a string id, since keys are
+    stored in the string table.
+    """
+    strings, string_ids = [], {}
+
+    def sid(value):
+        if value is None:
+            return -1
+        i = string_ids.get(value)
+        if i is None:
+            i = string_ids[value] = len(strings)
+            strings.append(value)
+        return i
+
+    changed_ids = None
+    if base is not None and changes is not None:
+        keys = [o.get("id") for o in changes.upserted] + list(changes.removed)
+        if all(isinstance(k, str) and k for k in keys):
+            changed_ids = set(keys[:len(changes.upserted)])
+
+    cols = {name: array("q") for name in _ORDER_COLS + _LINE_COLS + _INDEX_COLS}
+    cols["line_start"].append(0)
+    created_rows = []
+    for pos, o in enumerate(orders):
+        created, created_offset = _encode_time(o.get("createdTime"))
+        modified, modified_offset = _encode_time(o.get("modifiedTime"))
+        if not isinstance(created, int):
+            created, created_offset = None, None  # unparseable: such orders are never indexed
+        if not isinstance(modified, int):
+            modified, modified_offset = None, None
+        cols["created"].append(_int(created))
+        cols["created_offset"].append(_int(created_offset))
+        cols["modified"].append(_int(modified))
+        cols["modified_offset"].append(_int(modified_offset))
+        cols["total"].append(_int(o.get("total")))
+        cols["state"].append(sid(o.get("state")))
+        cols["id"].append(sid(o.get("id")))
+        cols["day"].append(sid(_wall(created, created_offset).date().isoformat() if created is not None else None))
+        if created is not None and o.get("state") == "locked":
+            created_rows.append((_wall_ms(created, created_offset), pos))
+        if changed_ids is not None and o.get("id") in changed_ids:
+            cols["changed"].append(pos)
+        for li in o.get("lineItems") or ():
+            cols["price"].append(_int(li.get("price")))
+            cols["qty"].append(_int(li.get("unitQty")))
+            cols["name"].append(sid(li.get("name")))
+        cols["line_start"].append(len(cols["price"]))
+    created_rows.sort(key=itemgetter(0))  # stable, like order_index._rows
+    cols["by_created"].extend(pos for _, pos in created_rows)
+    if lineage is not None:
+        cols["delta"].extend((lineage, _NONE if changed_ids is None else base))
+    if changed_ids is not None:
+        cols["removed"].extend(sid(k) for k in changes.removed)
+
+    blob = bytearray()
+    cols["str_offsets"] = array("q", [0])
+    for s in strings:
+        blob += str(s).encode("utf-8")
+        cols["str_offsets"].append(len(blob))
+    cols["str_blob"] = bytes(blob)
+
+    n_orders = len(cols["line_start"]) - 1
+    table_end = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    header = _HEADER.pack(_MAGIC, version, ts, n_orders, len(cols["price"]), len(strings))
+    sections, body, offset = [], [], table_end
+    for name in _SECTIONS:
+        data = cols[name].tobytes() if isinstance(cols[name], array) else cols[name]
+        offset += -offset % 8  # keep int64 columns aligned
+        body.append((offset, data))
+        sections.append(_SECTION.pack(offset, len(data)))
+        offset += len(data)
+
+    out = bytearray(offset)
+    out[:table_end] = header + b"".join(sections)
+    for start, data in body:
+        out[start:start + len(data)] = data
+    return bytes(out)
+
+
+def write(directory, orders, version, ts, lineage=None, base=None, changes=None):
+    """Atomically publish a new segment version into `directory` (see encode for the delta)."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, SEGMENT_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode(orders, version, ts, lineage, base, changes))
+    os.replace(tmp, path)
+
+
+def touch(directory, ts=None):
+    """Mark the current segment as fresh without rewriting it (e.g. after a 304)."""
+    try:
+        os.utime(os.path.join(directory, SEGMENT_NAME), (ts or time.time(),) * 2)
+    except OSError:
+        pass
+
+
+# ------------------------
+# Reader
+# ------------------------
+class Segment(Sequence):
+    """A mapped segment; behaves as a read-only sequence of SharedOrder views."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (st.st_dev, st.st_ino)
+        buf = memoryview(self._mm)
+        magic, self.version, self.ts, self.n_orders, self.n_lines, self.n_strings = _HEADER.unpack_from(buf, 0)
+        sections = _FORMATS.get(magic)
+        if sections is None:
+            raise ValueError(f"{path} is not an order segment")
+        cols = {}
+        for i, name in enumerate(sections):
+            start, length = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+            if start + length > len(buf) or (name != "str_blob" and length % 8):
+                raise ValueError(f"{path} is truncated")
+            view = buf[start:start + length]
+            cols[name] = view if name == "str_blob" else view.cast("q")
+        expected = {"line_start": self.n_orders + 1, "str_offsets": self.n_strings + 1}
+        expected.update({name: self.n_orders for name in _ORDER_COLS if name != "line_start"})
+        expected.update({name: self.n_lines for name in _LINE_COLS})
+        if any(len(cols[name]) != n for name, n in expected.items()) or len(cols.get("delta", ())) not in (0, 2):
+            raise ValueError(f"{path} is truncated")
+        self._cols = cols
+        for name in _ORDER_COLS + _LINE_COLS:
+            setattr(self, name, cols[name])
+        self._strings = {}
+        delta = cols.get("delta")
+        self.lineage, self.base_version = (delta[0], _value(delta[1])) if delta is not None and len(delta) == 2 else (None, None)
+
+    def created_order(self):
+        """(wall-clock times, orders) of the locked orders sorted by creation, as views over the mapping.
+
+        None for a segment written without the creation order.
+        """
+        positions = self._cols.get("by_created")
+        if positions is None:
+            return None
+        created, offsets = self.created, self.created_offset
+        return (
+            _Positions(positions, lambda p: _wall(created[p], _value(offsets[p]))),
+            _Positions(positions, lambda p: SharedOrder(self, p)),
+        )
+
+    def changes_since(self, previous):
+        """The order_store.ChangeSet from `previous` (a Segment) to this one, or None if it was not published."""
+        if (
+            not isinstance(previous, Segment)
+            or self.base_version is None
+            or (previous.lineage, previous.version) != (self.lineage, self.base_version)
+        ):
+            return None
+        return ChangeSet(
+            self.version,
+            [SharedOrder(self, p) for p in self._cols["changed"]],
+            [self.string(i) for i in self._cols["removed"]],
+        )
+
+    def string(self, i):
+        if i < 0:
+            return None
+        s = self._strings.get(i)
+        if s is None:
+            offsets = self._cols["str_offsets"]
+            s = self._strings[i] = str(self._cols["str_blob"][offsets[i]:offsets[i + 1]], "utf-8")
+        return s
+
+    def __len__(self):
+        return self.n_orders
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [SharedOrder(self, j) for j in range(*i.indices(self.n_orders))]
+        if i < 0:
+            i += self.n_orders
+        if not 0 <= i < self.n_orders:
+            raise IndexError(i)
+        return SharedOrder(self, i)
+
+
+def _value(v):
+    return None if v == _NONE else v
+
+
+class _Positions(Sequence):
+    """A read-only sequence of `item(position)` for each position in an int64 column."""
+
+    __slots__ = ("_positions", "_item")
+
+    def __init__(self, positions, item):
+        self._positions = positions
+        self._item = item
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._item(p) for p in self._positions[i]]
+        return self._item(self._positions[i])
+
+
+class SharedOrder(OrderRecord):
+    """One order inside a Segment; every field is read from the mapping on access."""
+
+    __slots__ = ("_seg", "_i")
+    _KEYS = ("id", "state", "total", "createdTime", "modifiedTime", "lineItems")
+
+    def __init__(self, seg, i):
+        self._seg = seg
+        self._i = i
+
+    def _line_range(self):
+        return range(self._seg.line_start[self._i], self._seg.line_start[self._i + 1])
+
+    def get(self, key, default=None):
+        seg, i = self._seg, self._i
+        if key == "id":
+            value = seg.string(seg.id[i])
+        elif key == "state":
+            value = seg.string(seg.state[i])
+        elif key == "total":
+            value = _value(seg.total[i])
+        elif key == "createdTime":
+            value = _decode_time(_value(seg.created[i]), _value(seg.created_offset[i]))
+        elif key == "modifiedTime":
+            value = _decode_time(_value(seg.modified[i]), _value(seg.modified_offset[i]))
+        elif key == "lineItems":
+            value = tuple(
+                LineItem(seg.string(seg.name[j]), _value(seg.price[j]), _value(seg.qty[j])) for j in self._line_range()
+            ) or None
+        else:
+            value = None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (k for k in self._KEYS if self.get(k) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def day(self):
+        return self._seg.string(self._seg.day[self._i]) or ""
+
+    def lines(self):
+        seg = self._seg
+        out = []
+        for j in self._line_range():
+            price, qty = seg.price[j], seg.qty[j]
+            out.append((
+                seg.string(seg.name[j]) or "Unknown Item",
+                0 if price == _NONE else price,
+                1 if qty == _NONE or not qty else qty,
+            ))
+        return out
+
+    def local_created(self):
+        ms = self._seg.created[self._i]
+        return None if ms == _NONE else _wall(ms, _value(self._seg.created_offset[self._i]))
+
+    def stamps(self):
+        seg, i = self._seg, self._i
+        return (_value(seg.created[i]), _value(seg.created_offset[i]), _value(seg.modified[i]), _value(seg.modified_offset[i]))
+
+    def hour(self):
+        ms = self._seg.created[self._i]
+        return 0 if ms == _NONE else _wall_ms(ms, _value(self._seg.created_offset[self._i])) // 3600000 % 24
+
+    def __repr__(self):
+        return f"SharedOrder({dict(self)!r})"
+
+
+class Reader:
+    """Follows the current segment in a directory, remapping only when it is swapped."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, SEGMENT_NAME)
+        self.segment = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """(segment or None, last-refresh timestamp) for the newest published version."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        with self._lock:
+            if self.segment is None or self.segment.inode != (st.st_dev, st.st_ino):
+                try:
+                    self.segment = Segment(self.path)
+                except (OSError, ValueError, struct.error):
+                    return self.segment, 0
+        return self.segment, st.st_mtime
+
+
+# ------------------------
+# Leader election
+# ------------------------
+class Leadership:
+    """Non-blocking flock election: the holder refreshes, everyone else only reads.
+
+    The lock is held for the life of the process, so when the leader dies the
+    kernel releases it and the next worker to try takes over.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "leader.lock")
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        with self._lock:
+            if self._file is not None:
+                return True
+            if fcntl is None:
+                self._file = True
+                return True
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            f = open(self.path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._file = f
+            return True
+
+    def release(self):
+        """Step down: drop the flock so another worker can take over."""
+        with self._lock:
+            if self._file is not None and self._file is not True:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+            self._file = None
@@ -14,3 +14,102 @@ def test_home_page(client):
 def test_ask_endpoint(client):
     rv = client.post('/ask', json={"question": "Top 5 best-selling products today"})
     assert rv.status_code in [200, 500]  # 500 if no API
+
+def test_stats_endpoint(client):
+    rv = client.get('/stats')
+    assert rv.status_code == 200
+    assert "hits" in rv.get_json()["analysis_cache"]
+
+def test_ask_stream_sends_metrics_before_answer(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    rv = client.post('/ask/stream', json={"question": "What was our revenue today?"})
+    body = rv.get_data(as_text=True)
+    assert rv.mimetype == "text/event-stream"
+    assert body.index("event: metrics") < body.index("event: chunk") < body.index("event: done")
+
+def test_ask_stream_is_traced_until_the_stream_ends(client, monkeypatch):
+    import app as app_module
+    import metrics
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    requests_before = metrics.REQUEST_SECONDS.count(route="ask_stream")
+    streams_before = metrics.STAGE_SECONDS.count(stage="llm_stream")
+    rv = client.post('/ask/stream', json={"question": "What was our revenue today?"})
+    rv.get_data()
+    assert metrics.REQUEST_SECONDS.count(route="ask_stream") == requests_before + 1
+    assert metrics.STAGE_SECONDS.count(stage="llm_stream") == streams_before + 1
+
+def test_compare_question_includes_comparison(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    rv = client.post('/ask', json={"question": "Compare this week vs last week"})
+    data = rv.get_json()
+    assert rv.status_code == 200
+    assert data["comparison"]["current_label"].startswith("This week")
+    assert data["comparison"]["previous_label"].startswith("Last week")
+
+def test_batch_endpoint_returns_one_result_per_question(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    questions = ["Revenue today", "Top products yesterday", "Compare this week vs last week"]
+    rv = client.post('/ask/batch', json={"questions": questions})
+    results = rv.get_json()["results"]
+    assert rv.status_code == 200
+    assert [r["label"].split(" (")[0] for r in results] == ["Today", "Yesterday", "This week"]
+    assert results[2]["comparison"] is not None
+
+def test_batch_endpoint_rejects_non_list_questions(client):
+    for questions in ["abc", ["ok", 3], {"q": "Revenue today"}]:
+        rv = client.post('/ask/batch', json={"questions": questions})
+        assert rv.status_code == 400
+
+def test_metrics_endpoint_and_timing_breakdown(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    rv = client.post('/ask', json={"question": "Revenue today", "timing": True})
+    assert {"fetch_orders_ms", "llm_ms", "total_ms"} <= set(rv.get_json()["timing"])
+    assert "llm;dur=" in rv.headers["Server-Timing"]
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'sales_insight_stage_seconds_count{stage="llm"}' in text
+    assert 'sales_insight_llm_requests_total{outcome="no_key"}' in text
+
+def test_today_questions_get_an_hourly_trend(client, monkeypatch):
+    import app as app_module
+    from records import merchant_now
+    now = merchant_now()
+    orders = [{"id": "h1", "state": "locked", "createdTime": now.isoformat(), "total": 1250, "lineItems": []}]
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: orders)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    data = client.post('/ask', json={"question": "Revenue today by hour"}).get_json()
+    assert len(data["trend_hourly"]) == 24
+    assert data["trend_hourly"][now.hour] == {"date": f"{now.hour:02d}:00", "revenue": 12.5, "orders": 1}
+
+def test_batch_results_match_ask(client, monkeypatch):
+    import app as app_module
+    from datetime import timedelta
+    from records import merchant_now
+    now = merchant_now()
+    orders = [
+        {"id": f"b{i}", "state": "locked", "createdTime": (now - timedelta(days=i)).isoformat(), "total": 500 * (i + 1),
+         "lineItems": [{"name": "Latte", "price": 500, "unitQty": i + 1}]}
+        for i in range(5)
+    ]
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: orders)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    questions = ["Top items by revenue this week", "How did the Latte sell this month?", "Revenue this week vs last week"]
+    batch = client.post('/ask/batch', json={"questions": questions}).get_json()["results"]
+    for q, result in zip(questions, batch):
+        assert result == client.post('/ask', json={"question": q}).get_json()
+
+def test_questions_without_a_timeframe_are_flagged(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    assert client.post('/ask', json={"question": "How are we doing?"}).get_json()["date_range_assumed"] is True
+    assert client.post('/ask', json={"question": "Revenue today"}).get_json()["date_range_assumed"] is False
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+
+import app as app_module
+import order_index
+import sales_api
+from archive import Archive
+from order_index import OrderIndex
+from order_store import ChangeSet
+from records import decode_orders
+from utils import aggregate_metrics
+
+
+def order(oid, created, total, state="locked"):
+    return {"id": oid, "state": state, "total": total, "createdTime": created,
+            "lineItems": [{"name": "Latte", "price": total, "unitQty": 1}]}
+
+
+HISTORY = [
+    order("a", "2025-08-14T09:00:00-05:00", 400),
+    order("b", "2025-09-02T10:00:00-05:00", 500),
+    order("c", "2025-09-30T18:00:00-05:00", 600),
+    order("d", "2025-09-30T19:00:00-05:00", 700, state="open"),
+    order("e", "2025-10-01T08:00:00-05:00", 800),
+]
+
+
+def test_unreadable_segments_are_skipped(tmp_path):
+    archive = Archive(str(tmp_path))
+    archive.append(HISTORY)
+    (tmp_path / "2025-09" / "00000002.seg").write_bytes(b"")
+    good = (tmp_path / "2025-09" / "00000001.seg").read_bytes()
+    (tmp_path / "2025-09" / "00000003.seg").write_bytes(good[:len(good) // 2])
+
+    september = (datetime(2025, 9, 1), datetime(2025, 9, 30, 23, 59, 59, 999999))
+    assert [o["id"] for o in Archive(str(tmp_path)).between(*september)] == ["b", "c"]
+    assert archive.append([order("f", "2025-09-03T10:00:00-05:00", 900)]) == 1
+
+
+def test_appends_only_what_changed_and_prunes_partitions(tmp_path):
+    archive = Archive(str(tmp_path), compact_after=3)
+    assert archive.append(decode_orders(HISTORY)) == 5
+    assert archive.append(HISTORY) == 0
+    assert archive.append([order("b", "2025-09-02T10:00:00-05:00", 550)]) == 1
+    assert sorted(os.listdir(tmp_path / "2025-09")) == ["00000001.seg", "00000002.seg"]
+
+    september = (datetime(2025, 9, 1), datetime(2025, 9, 30, 23, 59, 59, 999999))
+    assert archive.months(*september) == ["2025-08", "2025-09", "2025-10"]  # a day's slack either side
+    reader = Archive(str(tmp_path))
+    assert [(o["id"], o["total"]) for o in reader.between(*september)] == [("b", 550), ("c", 600)]
+
+    archive.append([order("c", "2025-09-30T18:00:00-05:00", 650)])  # third segment: compacted
+    assert os.listdir(tmp_path / "2025-09") == ["00000004.seg"]
+    assert [(o["id"], o["total"]) for o in reader.between(*september)] == [("b", 550), ("c", 650)]
+    assert reader.stats() == {"partitions": 3, "segments": 3, "first_month": "2025-08", "last_month": "2025-10"}
+
+
+def test_long_range_questions_read_past_the_live_window(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path))
+    archive.append(decode_orders(HISTORY[1:]))
+    live = HISTORY[2:]  # upstream no longer returns "b"
+    monkeypatch.setattr(app_module, "order_archive", lambda: archive)
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: live)
+    monkeypatch.setattr(order_index, "_INDEX", {"source": None, "index": None, "version": 0})
+
+    start, end = datetime(2025, 9, 1), datetime(2025, 10, 1, 23, 59, 59, 999999)
+    analysis = app_module.analyze_window(start, end, "Sep 1 to Oct 1")
+    expected = aggregate_metrics([HISTORY[1], HISTORY[2], HISTORY[4]], start, end)
+    assert analysis["totals"]["orders"] == 3
+    assert analysis["totals"]["revenue_cents"] == expected["total_revenue_cents"]
+    assert analysis["trend"] == expected["trend_daily"]
+
+
+def test_archived_partitions_are_cached_across_live_refreshes(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path))
+    archive.append(decode_orders(HISTORY[:3] + [order("j", "2025-06-10T09:00:00-05:00", 300)]))
+    reads = []
+    partition_rows = archive.partition_rows
+    monkeypatch.setattr(archive, "partition_rows", lambda months: reads.append(months) or partition_rows(months))
+    monkeypatch.setattr(app_module, "order_archive", lambda: archive)
+    monkeypatch.setattr(app_module, "_ARCHIVE_WINDOWS", app_module.LRUCache(maxsize=8))
+    september = datetime(2025, 9, 1), datetime(2025, 9, 30, 23, 59, 59, 999999)
+
+    first = app_module._with_history(OrderIndex(HISTORY[4:]), *september)
+    refreshed = OrderIndex(HISTORY[4:] + [order("g", "2025-10-02T09:00:00-05:00", 100)])
+    second = app_module._with_history(refreshed, *september)
+    assert [o["id"] for o in first.orders] == [o["id"] for o in second.orders] == ["b", "c"]
+    assert reads == [("2025-08", "2025-09")]  # only the months overlapping the window, read once
+
+    archive.append([order("f", "2025-09-05T10:00:00-05:00", 900)])
+    third = app_module._with_history(refreshed, *september)
+    assert app_module.scan_metrics(third, *september)["order_count"] == 3
+    assert len(reads) == 2
+
+
+def test_refresh_archives_upserted_orders(tmp_path, monkeypatch):
+    monkeypatch.setattr(sales_api, "_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(sales_api, "_ARCHIVE", {"archive": None})
+    sales_api._archive(ChangeSet(1, decode_orders(HISTORY[:2]), ["gone"]))
+    assert sales_api.fetch_stats()["archive"]["partitions"] == 2
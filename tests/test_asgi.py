@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("asgiref")
+
+import app as app_module
+import asgi
+
+
+def call(path, body=b"", headers=()):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [(b"content-type", b"application/json"), *headers],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"]), json.loads(sent[1]["body"])
+
+
+@pytest.fixture(autouse=True)
+def no_upstream(monkeypatch):
+    monkeypatch.setattr(app_module, "fetch_recent_orders", lambda: [])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+
+
+def test_async_ask_keeps_json_contract():
+    status, headers, data = call("/ask", json.dumps({"question": "What was our revenue today?"}).encode())
+    assert status == 200
+    assert data["orders"] == 0 and "llm_answer" in data and "trend" in data
+    assert headers[b"set-cookie"].startswith(b"session=")
+
+
+def test_async_ask_session_round_trips():
+    _, headers, _ = call("/ask", json.dumps({"question": "revenue today"}).encode())
+    cookie = headers[b"set-cookie"].split(b";")[0]
+    _, headers, _ = call("/ask", json.dumps({"question": "and yesterday?"}).encode(), [(b"cookie", cookie)])
+    value = headers[b"set-cookie"].split(b";")[0].split(b"=", 1)[1].decode()
+    session = asgi.flask_app.session_interface.get_signing_serializer(asgi.flask_app).loads(value)
+    assert [t["q"] for t in asgi.conversation.recent_turns(session["sid"])] == ["revenue today", "and yesterday?"]
+
+
+def test_missing_question_is_400():
+    status, _, data = call("/ask", b"{}")
+    assert status == 400 and "error" in data
+
+
+def test_flask_routes_run_concurrently(monkeypatch):
+    def slow_stats():
+        time.sleep(0.3)
+        return {}
+
+    monkeypatch.setattr(app_module, "fetch_stats", slow_stats)
+    scope = {"type": "http", "method": "GET", "path": "/stats", "headers": [], "query_string": b"",
+             "http_version": "1.1"}
+
+    async def one():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.application(dict(scope), receive, send)
+        return sent[0]["status"]
+
+    async def four():
+        return await asyncio.gather(*(one() for _ in range(4)))
+
+    started = time.perf_counter()
+    assert asyncio.run(four()) == [200] * 4
+    assert time.perf_counter() - started < 1.0  # serialized, four would take 1.2s
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+
+import requests
+
+from bench.fake_api import FakeOrdersAPI
+from bench.orders import generate_orders
+from bench.run import local_pipeline, run_benchmarks
+from order_index import OrderIndex
+from utils import parse_date_range
+
+
+def test_generated_orders_look_like_the_api():
+    orders = generate_orders(50, days=2, seed=1)
+    assert orders == generate_orders(50, days=2, seed=1)
+    o = orders[0]
+    assert set(o) >= {"id", "state", "createdTime", "total", "lineItems"}
+    assert {"name", "price", "unitQty"} <= set(o["lineItems"][0])
+    assert datetime.fromisoformat(o["createdTime"]) < datetime.fromisoformat(orders[-1]["createdTime"])
+
+
+def test_fake_api_honours_etags():
+    with FakeOrdersAPI(generate_orders(5)) as api:
+        first = requests.get(api.url, timeout=5)
+        assert len(first.json()["orders"]) == 5
+        again = requests.get(api.url, headers={"If-None-Match": first.headers["ETag"]}, timeout=5)
+        assert again.status_code == 304
+
+
+def test_ask_pipeline_against_local_api():
+    import app as app_module
+
+    now = datetime.now(timezone.utc)
+    orders = generate_orders(300, days=3, end=now)
+    start, end, _ = parse_date_range("today", now=now)
+    with local_pipeline(orders):
+        rv = app_module.app.test_client().post("/ask", json={"question": "How did we do today?"})
+        assert rv.status_code == 200
+        body = rv.get_json()
+        assert body["orders"] == len(OrderIndex(orders).between(start, end)) > 0
+        assert body["llm_answer"].startswith("Stub answer")
+
+
+def test_local_pipeline_restores_module_state():
+    import sys
+
+    import llm_agent
+    import order_index
+    import sales_api
+
+    before = (sys.modules.get("google.generativeai"), dict(llm_agent._MODEL), list(sales_api._LISTENERS),
+              order_index._INDEX["index"], llm_agent._LLM_CACHE)
+    with local_pipeline(generate_orders(20, days=1)):
+        sales_api.fetch_recent_orders()
+        llm_agent._gemini_model("bench")
+    after = (sys.modules.get("google.generativeai"), dict(llm_agent._MODEL), list(sales_api._LISTENERS),
+             order_index._INDEX["index"], llm_agent._LLM_CACHE)
+    assert after == before
+
+
+def test_benchmarks_report_every_stage():
+    results = run_benchmarks(n_orders=500, iterations=2, days=7)
+    assert [r["stage"] for r in results] == [
+        "parse_date_range", "aggregate_metrics", "analyze_trend", "order_index_build",
+        "rollups_build", "window_metrics", "fetch_orders", "ask_end_to_end",
+    ]
+    assert all(r["p50_ms"] <= r["p99_ms"] and r["peak_kib"] >= 0 for r in results)
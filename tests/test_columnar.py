@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from columnar import OrderColumns
+from utils import aggregate_metrics
+
+
+def make_orders(n, seed=7):
+    rng = random.Random(seed)
+    names = ["Red Bull", "Newport", "McCormick", None, "Gift Card"]
+    orders = []
+    for _ in range(n):
+        items = [
+            {"name": rng.choice(names), "price": rng.choice([0, 199, 499, None]), "unitQty": rng.choice([None, 1, 2, 3])}
+            for _ in range(rng.randint(0, 4))
+        ]
+        orders.append({
+            "createdTime": f"2025-10-{rng.randint(1, 9):02d}T12:00:00-05:00",
+            "total": rng.choice([None, 0, 1500, 2599]),
+            "lineItems": items,
+        })
+    return orders
+
+
+def test_columnar_matches_dict_aggregation():
+    orders = make_orders(500)
+    assert OrderColumns(orders).aggregate() == aggregate_metrics(orders, None, None)
+
+
+def test_columnar_slice_matches_dict_aggregation():
+    orders = make_orders(300, seed=3)
+    assert OrderColumns(orders).aggregate(40, 210) == aggregate_metrics(orders[40:210], None, None)
+    assert OrderColumns(orders).aggregate(5, 5) == aggregate_metrics([], None, None)
+
+
+def test_app_routes_windows_the_rollups_cannot_serve_through_columnar(monkeypatch):
+    from datetime import datetime
+
+    import app
+    from order_index import OrderIndex
+
+    orders = [dict(o, id=str(i), state="locked") for i, o in enumerate(make_orders(200, seed=5))]
+    index = OrderIndex(orders)
+    current = (datetime(2025, 10, 5), datetime(2025, 10, 8, 23, 59, 59, 999999), "Oct 5-8")
+    previous = (datetime(2025, 10, 1), datetime(2025, 10, 4, 23, 59, 59, 999999), "Oct 1-4")
+    partial = (datetime(2025, 10, 3, 6), datetime(2025, 10, 3, 18), "Oct 3 daytime")
+    monkeypatch.setattr(app, "order_archive", lambda: None)
+
+    def analyses(columnar):
+        monkeypatch.setattr(app, "COLUMNAR", columnar)
+        app._ANALYSIS_CACHE.clear()
+        return app.analyze_comparison(current, previous, index=index), app.analyze_window(*partial, index=index)
+
+    scanned = analyses(False)
+    before = app._WINDOW_AGGREGATIONS.value(engine="columnar")
+    assert analyses(True) == scanned
+    assert app._WINDOW_AGGREGATIONS.value(engine="columnar") - before == 3
@@ -0,0 +1,29 @@
+import conversation
+
+
+ANALYSIS = {
+    "date_range": {"label": "Today"},
+    "totals": {"orders": 3, "revenue_cents": 4500},
+    "top_items": [{"name": "Latte", "qty": 2}],
+}
+
+
+def test_session_id_replaces_cookie_history():
+    session = {"conversation_history": [{"user": "hi", "bot": "a long answer"}]}
+    sid = conversation.session_id(session)
+    assert session == {"sid": sid}
+    assert conversation.session_id(session) == sid
+
+
+def test_turns_are_compact_and_bounded():
+    sid = conversation.session_id({})
+    for i in range(conversation.MAX_TURNS + 2):
+        conversation.record_turn(sid, conversation.summarize_turn(f"q{i}", ANALYSIS, "summary"))
+
+    turns = conversation.recent_turns(sid, n=10)
+    assert len(turns) == conversation.MAX_TURNS
+    assert turns[-1] == {
+        "q": f"q{conversation.MAX_TURNS + 1}", "intent": "summary", "range": "Today",
+        "orders": 3, "revenue_cents": 4500, "top_item": "Latte",
+    }
+    assert conversation.recent_turns("unknown") == []
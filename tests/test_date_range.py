@@ -0,0 +1,97 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from utils import DateWindow, parse_comparison, parse_date_range
+
+NOW = datetime(2025, 10, 16, 15, 30, tzinfo=timezone.utc)  # a Thursday
+
+
+def days(window):
+    return window.start.date(), window.end.date()
+
+
+@pytest.mark.parametrize("question, first, last", [
+    ("Revenue today", date(2025, 10, 16), date(2025, 10, 16)),
+    ("How did we do yesterday?", date(2025, 10, 15), date(2025, 10, 15)),
+    ("Sales last week", date(2025, 10, 6), date(2025, 10, 12)),
+    ("Sales this week", date(2025, 10, 13), date(2025, 10, 16)),
+    ("Which products performed best in October?", date(2025, 10, 1), date(2025, 10, 31)),
+    ("Revenue in November", date(2024, 11, 1), date(2024, 11, 30)),
+    ("Orders in Oct 2024", date(2024, 10, 1), date(2024, 10, 31)),
+    ("Revenue in the last 7 days", date(2025, 10, 10), date(2025, 10, 16)),
+    ("Past two weeks", date(2025, 10, 3), date(2025, 10, 16)),
+    ("How did Q3 go?", date(2025, 7, 1), date(2025, 9, 30)),
+    ("Q1 2024 revenue", date(2024, 1, 1), date(2024, 3, 31)),
+    ("Last quarter", date(2025, 7, 1), date(2025, 9, 30)),
+    ("Orders since Monday", date(2025, 10, 13), date(2025, 10, 16)),
+    ("Sales on Friday", date(2025, 10, 10), date(2025, 10, 10)),
+    ("Revenue from 2025-10-01 to 2025-10-05", date(2025, 10, 1), date(2025, 10, 5)),
+    ("Between Dec 28 and Jan 3", date(2024, 12, 28), date(2025, 1, 3)),
+    ("What happened on Oct 3?", date(2025, 10, 3), date(2025, 10, 3)),
+    ("sales Oct 3", date(2025, 10, 3), date(2025, 10, 3)),
+    ("2025-10-03", date(2025, 10, 3), date(2025, 10, 3)),
+    ("Orders since Oct 3", date(2025, 10, 3), date(2025, 10, 16)),
+    ("Revenue over the last 3 months", date(2025, 7, 17), date(2025, 10, 16)),
+    ("Past twelve months", date(2024, 10, 17), date(2025, 10, 16)),
+    ("Revenue year to date", date(2025, 1, 1), date(2025, 10, 16)),
+    ("YTD orders", date(2025, 1, 1), date(2025, 10, 16)),
+    ("Sales week to date", date(2025, 10, 13), date(2025, 10, 16)),
+    ("Revenue for the 3rd quarter", date(2025, 7, 1), date(2025, 9, 30)),
+    ("Second quarter of 2024", date(2024, 4, 1), date(2024, 6, 30)),
+    ("Sales on the 5th", date(2025, 10, 5), date(2025, 10, 5)),
+    ("What about the 20th?", date(2025, 9, 20), date(2025, 9, 20)),
+    ("Sales this weekend", date(2025, 10, 11), date(2025, 10, 12)),
+    ("Orders since may", date(2025, 5, 1), date(2025, 10, 16)),
+    ("Revenue over the last 3 sundays", date(2025, 9, 28), date(2025, 10, 12)),
+    ("Top 3 items from October 5 to 10", date(2025, 10, 5), date(2025, 10, 10)),
+    ("Oct 5-10 revenue", date(2025, 10, 5), date(2025, 10, 10)),
+    ("May I see the numbers?", date(2025, 10, 16), date(2025, 10, 16)),
+    ("Anything interesting?", date(2025, 10, 16), date(2025, 10, 16)),
+])
+def test_resolves_whole_day_windows(question, first, last):
+    window = parse_date_range(question, now=NOW)
+    assert days(window) == (first, last)
+    assert window.start.time() == datetime.min.time() and window.end.microsecond == 999999
+    assert window.start.tzinfo is timezone.utc
+
+
+def test_only_the_today_fallback_is_flagged_as_assumed():
+    assert parse_date_range("Anything interesting?", now=NOW).assumed
+    assert not parse_date_range("Revenue today", now=NOW).assumed
+
+
+def test_windows_unpack_and_key_caches():
+    start, end, label = window = parse_date_range("this week", now=NOW)
+    assert isinstance(window, DateWindow) and label == "This week (2025-10-13 to 2025-10-16)"
+    later = parse_date_range("  This   WEEK ", now=NOW.replace(hour=23))
+    assert later == window and {window: 1}[later] == 1
+    assert later is window  # memoized per (normalized text, day)
+
+
+def test_quarter_and_year_comparisons():
+    current, previous = parse_comparison("Compare this quarter vs last quarter", NOW)
+    assert days(current) == (date(2025, 10, 1), date(2025, 12, 31))
+    assert days(previous) == (date(2025, 7, 1), date(2025, 9, 30))
+
+
+@pytest.mark.parametrize("question, current, previous", [
+    ("Compare Monday vs Tuesday sales", (date(2025, 10, 14),) * 2, (date(2025, 10, 13),) * 2),
+    ("Compare last 7 days vs the previous 7 days",
+     (date(2025, 10, 10), date(2025, 10, 16)), (date(2025, 10, 3), date(2025, 10, 9))),
+    ("Compare October vs September", (date(2025, 10, 1), date(2025, 10, 31)), (date(2025, 9, 1), date(2025, 9, 30))),
+    ("Compare Q3 vs Q2", (date(2025, 7, 1), date(2025, 9, 30)), (date(2025, 4, 1), date(2025, 6, 30))),
+    ("Compare this month and last month", (date(2025, 10, 1), date(2025, 10, 31)),
+     (date(2025, 9, 1), date(2025, 9, 30))),
+    ("Compare this week vs last", (date(2025, 10, 13), date(2025, 10, 16)), (date(2025, 10, 6), date(2025, 10, 12))),
+    ("How did today compare?", (date(2025, 10, 16),) * 2, (date(2025, 10, 15),) * 2),
+    ("Sales over the last 2 sundays", (date(2025, 10, 12),) * 2, (date(2025, 10, 5),) * 2),
+])
+def test_comparisons_resolve_both_periods(question, current, previous):
+    windows = parse_comparison(question, NOW)
+    assert [days(w) for w in windows] == [current, previous]
+
+
+def test_non_comparisons_are_not_split():
+    assert parse_comparison("Show vsomething revenue for Monday", NOW) is None
+    assert parse_comparison("Revenue over the last 7 days", NOW) is None
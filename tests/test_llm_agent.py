@@ -0,0 +1,134 @@
+import sys
+import time
+import types
+
+import pytest
+
+import llm_agent
+
+
+ANALYSIS = {
+    "question": "Top products today",
+    "date_range": {"start": "2025-10-02T00:00:00", "end": "2025-10-02T23:59:59", "label": "Today (2025-10-02)"},
+    "totals": {"revenue_cents": 1000, "calc_revenue_cents": 1000, "orders": 2, "avg_order_value_cents": 500},
+    "top_items": [{"name": "Coffee", "qty": 2, "revenue_cents": 1000}],
+    "trend": {"2025-10-02": (1000, 2)},
+    "trend_insight": "Sales appear consistent for the selected period.",
+    "conversation_context": [],
+}
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    class Calls(list):
+        pass
+
+    calls = Calls()
+
+    class FakeModel:
+        delay = 0
+        fail = False
+
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, parts, **kwargs):
+            calls.append(parts)
+            time.sleep(FakeModel.delay)
+            if FakeModel.fail:
+                raise RuntimeError("gemini is down")
+            return types.SimpleNamespace(text=f"answer {len(calls)}")
+
+    genai = types.SimpleNamespace(configure=lambda **kw: None, GenerativeModel=FakeModel)
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(llm_agent, "_MODEL", {"key": None, "model": None})
+    monkeypatch.setattr(llm_agent, "_BREAKER", llm_agent._CircuitBreaker(threshold=2, cooldown=60))
+    llm_agent._LLM_CACHE.clear()
+    calls.model = FakeModel
+    return calls
+
+
+def test_same_inputs_hit_the_answer_cache(fake_gemini):
+    assert llm_agent.llm_explain(ANALYSIS) == "answer 1"
+    rephrased = {**ANALYSIS, "question": "best selling items today"}
+    assert llm_agent.llm_explain(rephrased) == "answer 1"
+    assert len(fake_gemini) == 1
+
+
+def test_cache_can_be_bypassed(fake_gemini):
+    llm_agent.llm_explain(ANALYSIS)
+    assert llm_agent.llm_explain(ANALYSIS, use_cache=False) == "answer 2"
+
+
+def test_fallback_without_key(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    assert llm_agent.llm_explain(ANALYSIS) == llm_agent._fallback_explanation(ANALYSIS)
+
+
+def test_slow_llm_falls_back_at_deadline(fake_gemini, monkeypatch):
+    monkeypatch.setattr(llm_agent, "_LLM_TIMEOUT_SECONDS", 0.05)
+    fake_gemini.model.delay = 0.5
+    started = time.monotonic()
+    answer = llm_agent.llm_explain(ANALYSIS)
+
+    assert time.monotonic() - started < 0.4
+    assert answer.startswith(llm_agent._fallback_explanation(ANALYSIS))
+
+
+def test_slow_stream_is_recorded_as_a_timeout(fake_gemini, monkeypatch):
+    monkeypatch.setattr(llm_agent, "_LLM_TIMEOUT_SECONDS", 0.05)
+    fake_gemini.model.delay = 0.5
+    timeouts, errors = (llm_agent._LLM_CALLS.value(outcome=o) for o in ("timeout", "error"))
+    answer = "".join(llm_agent.llm_explain_stream(ANALYSIS))
+
+    assert answer.startswith(llm_agent._fallback_explanation(ANALYSIS))
+    assert llm_agent._LLM_CALLS.value(outcome="timeout") == timeouts + 1
+    assert llm_agent._LLM_CALLS.value(outcome="error") == errors
+
+
+def test_breaker_skips_llm_after_repeated_failures(fake_gemini):
+    fake_gemini.model.fail = True
+    llm_agent.llm_explain(ANALYSIS, use_cache=False)
+    llm_agent.llm_explain(ANALYSIS, use_cache=False)
+    answer = llm_agent.llm_explain(ANALYSIS, use_cache=False)
+
+    assert len(fake_gemini) == 2
+    assert "temporarily skipped" in answer
+
+
+def month_analysis(question):
+    trend = {f"2025-10-{d:02d}": (10000 + d * 100, 20) for d in range(1, 31)}
+    trend["2025-10-17"] = (90000, 60)
+    turns = [{"q": f"question {i}", "intent": "summary", "range": "Today", "orders": 3, "revenue_cents": 1200}
+             for i in range(3)]
+    return {**ANALYSIS, "question": question, "trend": trend, "conversation_context": turns,
+            "top_items": [{"name": f"Item {i}", "qty": 10 - i, "revenue_cents": 500} for i in range(8)]}
+
+
+def test_prompt_sends_only_intent_sections_and_samples_long_trends():
+    _, prompt, report = llm_agent._compose(month_analysis("Show the sales trend this month"), 1000)
+    assert report["intent"] == "trend" and "Top items" not in prompt
+    assert "Daily trend (sampled, 8 of 30)" in prompt
+    assert "2025-10-17: $900.00, 60 orders" in prompt  # the peak always survives sampling
+    assert "question 0" in prompt
+
+    _, prompt, _ = llm_agent._compose(month_analysis("Top products this month"), 1000)
+    assert "5. Item 4" in prompt and "6. Item 5" not in prompt
+    assert "Daily trend" not in prompt
+
+
+def test_prompt_fits_the_token_budget(fake_gemini, monkeypatch):
+    analysis = month_analysis("Show the sales trend this month")
+    system, prompt, report = llm_agent._compose(analysis, 180)
+    assert report["tokens"] <= 180 and "context" in report["dropped"] and report["shortened"] == ["trend"]
+    assert "peak $900.00 (2025-10-17)" in prompt
+
+    monkeypatch.setattr(llm_agent, "_PROMPT_TOKEN_BUDGET", 180)
+    before = llm_agent._PROMPT_TOKENS.count()
+    llm_agent.llm_explain(analysis, use_cache=False)
+    assert llm_agent._PROMPT_TOKENS.count() == before + 1
+    assert fake_gemini[0] == [system, prompt]
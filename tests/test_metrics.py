@@ -0,0 +1,51 @@
+import logging
+import time
+
+import metrics
+
+
+def test_histogram_and_counter_render_in_prometheus_format():
+    hist = metrics.histogram("test_latency_seconds", "Test latency.", labels=("stage",), buckets=(0.1, 1))
+    hist.observe(0.05, stage="a")
+    hist.observe(0.5, stage="a")
+    hist.observe(5, stage="a")
+    metrics.counter("test_events_total", "Test events.").inc(3)
+
+    text = metrics.render({"test_gauge": 7, "ignored": "text"})
+    assert 'sales_insight_test_latency_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'sales_insight_test_latency_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 'sales_insight_test_latency_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'sales_insight_test_latency_seconds_count{stage="a"} 3' in text
+    assert "sales_insight_test_events_total 3" in text
+    assert "sales_insight_test_gauge 7" in text
+    assert "ignored" not in text
+
+
+def test_stages_add_up_in_the_request_breakdown():
+    with metrics.track_request("test") as trace:
+        with metrics.stage("work"):
+            time.sleep(0.01)
+        with metrics.stage("work"):
+            pass
+        timing = metrics.breakdown(trace)
+
+    assert set(timing) == {"work_ms", "total_ms"}
+    assert 10 <= timing["work_ms"] <= timing["total_ms"]
+    assert metrics.REQUEST_SECONDS.count(route="test") == 1
+
+
+def test_slow_requests_are_sampled(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "_PROFILE_THRESHOLD", 0.01)
+    monkeypatch.setattr(metrics, "_PROFILE_INTERVAL", 0.005)
+
+    def busy_wait():
+        deadline = time.perf_counter() + 0.15
+        while time.perf_counter() < deadline:
+            pass
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        with metrics.track_request("slow"):
+            busy_wait()
+
+    assert "Slow slow request" in caplog.text
+    assert "busy_wait" in caplog.text
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+from order_index import OrderIndex, index_for
+from utils import aggregate_metrics, aggregate_windows
+
+
+ORDERS = [
+    {"id": "a", "state": "locked", "createdTime": "2025-10-02T09:00:00-05:00"},
+    {"id": "b", "state": "open", "createdTime": "2025-10-02T10:00:00-05:00"},
+    {"id": "c", "state": "locked", "createdTime": "2025-10-01T23:59:59-05:00"},
+    {"id": "d", "state": "locked", "createdTime": "not a date"},
+    {"id": "e", "state": "locked", "createdTime": "2025-10-03T00:00:00-05:00"},
+]
+
+
+def test_between_matches_linear_filter():
+    index = OrderIndex(ORDERS)
+    start = datetime(2025, 10, 2, tzinfo=timezone.utc)
+    end = datetime(2025, 10, 3, tzinfo=timezone.utc)
+
+    assert [o["id"] for o in index.between(start, end)] == ["a", "e"]
+    assert len(index) == 3
+
+
+def test_index_is_reused_for_same_snapshot():
+    assert index_for(ORDERS) is index_for(ORDERS)
+    assert index_for(list(ORDERS)) is not index_for(ORDERS)
+
+
+def test_aggregate_windows_matches_separate_aggregations():
+    index = OrderIndex(ORDERS)
+    windows = [
+        (datetime(2025, 10, 2), datetime(2025, 10, 3)),
+        (datetime(2025, 10, 1), datetime(2025, 10, 1, 23, 59, 59)),
+    ]
+    expected = [aggregate_metrics(index.between(s, e), s, e) for s, e in windows]
+    assert aggregate_windows(index, windows) == expected
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from order_index import OrderIndex
+from order_store import OrderStore
+from rollups import DailyRollups
+from utils import aggregate_metrics
+
+
+def order(oid, created, total, state="locked"):
+    return {"id": oid, "state": state, "createdTime": created, "total": total,
+            "lineItems": [{"name": "Coffee", "price": total, "unitQty": 1}]}
+
+
+def test_full_sync_reports_only_what_changed():
+    store = OrderStore()
+    store.replace_all([order("1", "2025-10-01T09:00:00", 100), order("2", "2025-10-01T10:00:00", 200)])
+    before = store.orders()
+
+    changes = store.replace_all([order("1", "2025-10-01T09:00:00", 150), order("3", "2025-10-02T09:00:00", 50)])
+
+    assert sorted(o["id"] for o in changes.upserted) == ["1", "3"]
+    assert changes.removed == ["2"]
+    assert store.replace_all(store.orders()).upserted == []
+    assert store.orders() is not before
+
+
+def test_delta_sync_upserts_and_tombstones():
+    store = OrderStore()
+    store.replace_all([order("1", "2025-10-01T09:00:00", 100), order("2", "2025-10-01T10:00:00", 200)])
+
+    changes = store.apply_delta([order("2", "2025-10-01T10:00:00", 0, state="deleted"),
+                                 order("4", "2025-10-03T09:00:00", 75)])
+
+    assert changes.removed == ["2"]
+    assert [o["id"] for o in store.orders()] == ["1", "4"]
+    assert store.high_water == "2025-10-03T09:00:00"
+
+
+def test_index_and_rollups_follow_changesets():
+    store = OrderStore()
+    store.replace_all([order("1", "2025-10-01T09:00:00", 100), order("2", "2025-10-02T10:00:00", 200)])
+    index = OrderIndex(store.orders())
+    rollups = DailyRollups()
+    rollups.update(index)
+
+    changes = store.apply_delta([order("2", "2025-10-02T10:00:00", 0, state="open"),
+                                 order("3", "2025-10-01T12:00:00", 300)])
+    index = index.updated(changes)
+    rollups.apply_changes(changes)
+
+    assert [o["id"] for o in index.orders] == ["1", "3"]
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 2, 23, 59, 59, 999999)
+    assert rollups.metrics(index, start, end) == aggregate_metrics(OrderIndex(store.orders()).between(start, end), start, end)
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+
+from order_index import OrderIndex
+from records import Order, OrderRecord, created_day, decode_orders
+from utils import aggregate_metrics
+
+API_ORDER = {
+    "id": "A1",
+    "state": "locked",
+    "total": 1250,
+    "createdTime": "2025-10-02T23:30:00-05:00",
+    "modifiedTime": "2025-10-03T04:31:12.250+00:00",
+    "currency": "USD",
+    "employee": {"id": "E1", "href": "https://example/employees/E1"},
+    "lineItems": [
+        {"name": "Latte", "price": 500, "unitQty": 2, "id": "L1", "printed": True},
+        {"name": "Bagel", "price": 250, "item": {"id": "I9"}},
+    ],
+}
+
+
+def test_record_keeps_only_used_fields_and_reads_like_the_dict():
+    o = Order.from_api(API_ORDER)
+
+    assert o["createdTime"] == "2025-10-02T23:30:00-05:00"
+    assert o.get("modifiedTime") == "2025-10-03T04:31:12.250+00:00"
+    assert o.get("currency") is None and o.get("lineItems")[1].get("unitQty") is None
+    assert created_day(o) == "2025-10-02"
+    assert o.local_created() == datetime(2025, 10, 2, 23, 30)
+    assert o == {
+        "id": "A1", "state": "locked", "total": 1250,
+        "createdTime": "2025-10-02T23:30:00-05:00", "modifiedTime": "2025-10-03T04:31:12.250+00:00",
+        "lineItems": [{"name": "Latte", "price": 500, "unitQty": 2}, {"name": "Bagel", "price": 250}],
+    }
+    assert Order.from_row(o.to_row()) == o
+    assert o.lineItems[0].name is Order.from_api(API_ORDER).lineItems[0].name  # interned
+
+
+def test_records_aggregate_and_index_like_dicts():
+    orders = [API_ORDER, {**API_ORDER, "id": "A2", "createdTime": "bad"}, {**API_ORDER, "id": "A3", "state": "open"}]
+    compact = decode_orders(orders)
+    start, end = datetime(2025, 10, 2), datetime(2025, 10, 3)
+
+    assert OrderIndex(compact).times == OrderIndex(orders).times
+    assert aggregate_metrics(compact, start, end) == aggregate_metrics(orders, start, end)
+    assert Order.from_api({**API_ORDER, "deleted": True}).state == "deleted"
+
+
+def test_records_must_implement_the_hot_path_methods():
+    class Partial(OrderRecord):
+        __slots__ = ()
+        day = lines = local_created = hour = lambda self: None
+
+        def __getitem__(self, key):
+            raise KeyError(key)
+
+        def __iter__(self):
+            return iter(())
+
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError, match="stamps"):
+        Partial()
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from order_index import OrderIndex
+from rollups import DailyRollups
+from utils import aggregate_metrics
+
+
+def order(oid, created, total, items):
+    return {
+        "id": oid,
+        "state": "locked",
+        "createdTime": created,
+        "total": total,
+        "lineItems": [{"name": n, "price": p, "unitQty": q} for n, p, q in items],
+    }
+
+
+ORDERS = [
+    order("1", "2025-10-01T09:00:00-05:00", 1000, [("Coffee", 500, 2)]),
+    order("2", "2025-10-02T10:30:00-05:00", 0, [("Bagel", 300, 1), ("Coffee", 500, 1)]),
+    order("3", "2025-10-03T08:15:00-05:00", 700, [("Tea", 700, 1)]),
+    order("4", "2025-10-03T18:45:00-05:00", 450, [("Bagel", 300, 1)]),
+]
+
+
+def expected(index, start, end):
+    return aggregate_metrics(index.between(start, end), start, end)
+
+
+def test_full_and_partial_days_match_raw_aggregation():
+    index = OrderIndex(ORDERS)
+    rollups = DailyRollups()
+    rollups.update(index)
+
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 3, 12, 0)
+    assert rollups.metrics(index, start, end) == expected(index, start, end)
+    assert rollups.metrics(index, datetime(2025, 10, 3, 9), datetime(2025, 10, 3, 10)) is None
+
+
+def test_incremental_update_handles_changed_and_removed_orders():
+    rollups = DailyRollups()
+    rollups.update(OrderIndex(ORDERS))
+
+    changed = ORDERS[1:3] + [order("4", "2025-10-03T18:45:00-05:00", 900, [("Muffin", 900, 1)])]
+    index = OrderIndex(changed)
+    rollups.update(index)
+
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 3, 23, 59, 59, 999999)
+    assert rollups.metrics(index, start, end) == expected(index, start, end)
+
+
+def test_top_items_by_revenue_and_item_history():
+    index = OrderIndex(ORDERS)
+    rollups = DailyRollups()
+    rollups.update(index)
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 3, 23, 59, 59, 999999)
+
+    assert [i["name"] for i in rollups.top_items(index, start, end, k=2, by="revenue")] == ["Coffee", "Tea"]
+    assert [i["name"] for i in rollups.top_items(index, start, end, k=2)] == ["Coffee", "Bagel"]
+    assert rollups.find_item("how did the bagel do this month?") == "Bagel"
+    assert rollups.find_item("were sales steady instead of growing?") is None
+    assert rollups.find_item("TEA sales today") == "Tea"
+    assert rollups.item_history("Bagel") == {
+        "2025-10-02": {"qty": 1, "revenue_cents": 300, "orders": 1},
+        "2025-10-03": {"qty": 1, "revenue_cents": 300, "orders": 1},
+    }
+    assert rollups.item_history("Bagel", "2025-10-03", "2025-10-03") == {
+        "2025-10-03": {"qty": 1, "revenue_cents": 300, "orders": 1},
+    }
+
+
+def test_rollups_never_sync_back_to_an_older_index(monkeypatch):
+    import rollups
+
+    monkeypatch.setattr(rollups, "_ROLLUPS", DailyRollups())
+    monkeypatch.setattr(rollups, "_SYNCED", {"index": lambda: None, "version": None})
+    older, newer = OrderIndex(ORDERS), OrderIndex(ORDERS[:2])
+    older.version, newer.version = 1, 2
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 3, 23, 59, 59, 999999)
+
+    assert rollups.rollups_metrics(newer, start, end) == expected(newer, start, end)
+    assert rollups.rollups_metrics(older, start, end) is None  # the caller falls back to scanning
+    with rollups.synced_rollups(newer) as synced:
+        assert synced.item_history("Tea") == {}
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+
+import pytest
+
+import sales_api
+
+
+@pytest.fixture(autouse=True)
+def reset_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        sales_api, "_CACHE", {"data": None, "ts": 0, "error": None, "retry_at": 0, "snapshot_loaded": False}
+    )
+    monkeypatch.setattr(sales_api, "_REFRESHING", False)
+    monkeypatch.setattr(sales_api, "_STORE", sales_api.OrderStore())
+    monkeypatch.setattr(sales_api, "_LISTENERS", [])
+    monkeypatch.setattr(sales_api, "_SNAPSHOT_BASE", str(tmp_path / "orders_snapshot"))
+    monkeypatch.setattr(sales_api, "_SNAPSHOT_PATH", str(tmp_path / "orders_snapshot.bin"))
+
+
+def test_concurrent_cold_callers_share_one_fetch(monkeypatch):
+    calls = []
+
+    def slow_download():
+        calls.append(1)
+        time.sleep(0.2)
+        return [{"id": "a"}]
+
+    monkeypatch.setattr(sales_api, "_download_orders", slow_download)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sales_api.fetch_recent_orders())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [[{"id": "a"}]] * 8
+
+
+def test_stale_snapshot_served_when_upstream_fails(monkeypatch):
+    def failing_download():
+        raise RuntimeError("Sales API request failed: boom")
+
+    monkeypatch.setattr(sales_api, "_download_orders", failing_download)
+    sales_api._CACHE.update({"data": [{"id": "old"}], "ts": time.time() - 10_000, "snapshot_loaded": True})
+
+    assert sales_api.fetch_recent_orders() == [{"id": "old"}]
+
+
+def test_cold_failure_raises(monkeypatch):
+    def failing_download():
+        raise RuntimeError("Sales API request failed: boom")
+
+    monkeypatch.setattr(sales_api, "_download_orders", failing_download)
+    with pytest.raises(RuntimeError):
+        sales_api.fetch_recent_orders()
+
+
+def test_unexpected_refresh_error_releases_single_flight(monkeypatch):
+    def broken_write(orders, ts):
+        raise ValueError("disk exploded")
+
+    monkeypatch.setattr(sales_api, "_download_orders", lambda: [{"id": "a"}])
+    monkeypatch.setattr(sales_api, "_write_snapshot", broken_write)
+    with pytest.raises(ValueError):
+        sales_api.fetch_recent_orders()
+
+    assert sales_api._REFRESHING is False
+    monkeypatch.setattr(sales_api, "_write_snapshot", lambda orders, ts: None)
+    sales_api._CACHE["ts"] = 0
+    assert sales_api.fetch_recent_orders() == [{"id": "a"}]
+
+
+def test_fresh_snapshot_skips_the_network(monkeypatch):
+    sales_api._write_snapshot([{"id": "disk"}], time.time())
+
+    def unexpected_download():
+        raise AssertionError("should have been served from the snapshot")
+
+    monkeypatch.setattr(sales_api, "_download_orders", unexpected_download)
+    assert sales_api.fetch_recent_orders() == [{"id": "disk"}]
+
+
+def test_refresh_writes_snapshot(monkeypatch):
+    monkeypatch.setattr(sales_api, "_download_orders", lambda: [{"id": "net"}])
+    sales_api.fetch_recent_orders()
+
+    assert sales_api._read_snapshot()["orders"] == [{"id": "net"}]
+
+
+def test_unchanged_dataset_is_revalidated_with_304(monkeypatch):
+    import json
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    body = json.dumps({"orders": [{"id": "x"}]}).encode()
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append(self.headers.get("If-None-Match"))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(sales_api, "API_URL", f"http://127.0.0.1:{server.server_port}/orders/recent")
+    monkeypatch.setattr(sales_api, "_SESSION", {"session": None})
+    monkeypatch.setattr(sales_api, "_VALIDATORS", {"etag": None, "last_modified": None})
+    try:
+        first = sales_api.fetch_recent_orders()
+        os.remove(sales_api._SNAPSHOT_PATH)  # make this worker go to the network
+        sales_api._CACHE["ts"] = 0
+        second = sales_api.fetch_recent_orders()
+    finally:
+        server.shutdown()
+
+    assert seen == [None, '"v1"']
+    assert second is first
+    assert sales_api.fetch_stats()["not_modified"] >= 1
@@ -0,0 +1,134 @@
+from datetime import datetime
+
+import pytest
+
+import sales_api
+import shared_orders
+from order_index import OrderIndex
+from utils import aggregate_metrics
+
+LEAD_FOREVER = sales_api._lead_forever  # the shared_mode fixture stubs out the sidecar
+
+ORDERS = [
+    {"id": "a", "state": "locked", "total": 1000, "createdTime": "2025-10-02T09:00:00-05:00",
+     "lineItems": [{"name": "Latte", "price": 500, "unitQty": 2}], "ignored": {"big": "payload"}},
+    {"id": "b", "state": "locked", "total": 0, "createdTime": "2025-10-02T10:30:00.250-05:00",
+     "lineItems": [{"name": "Bagel", "price": 300}]},
+    {"id": "c", "state": "open", "createdTime": "2025-10-03T08:00:00+00:00"},
+]
+
+
+def test_segment_reads_back_like_the_orders(tmp_path):
+    shared_orders.write(str(tmp_path), ORDERS, version=7, ts=100.0)
+    seg, _ = shared_orders.Reader(str(tmp_path)).current()
+
+    assert (seg.version, len(seg)) == (7, 3)
+    assert seg[1]["createdTime"] == "2025-10-02T10:30:00.250-05:00"
+    assert seg[1].lines() == [("Bagel", 300, 1)]
+    assert seg[2].get("total") is None and seg[2].day() == "2025-10-03"
+    start, end = datetime(2025, 10, 1), datetime(2025, 10, 4)
+    assert aggregate_metrics(OrderIndex(seg).between(start, end), start, end) == \
+        aggregate_metrics(OrderIndex(ORDERS).between(start, end), start, end)
+
+
+def test_reader_remaps_only_after_a_swap(tmp_path):
+    reader = shared_orders.Reader(str(tmp_path))
+    shared_orders.write(str(tmp_path), ORDERS, version=1, ts=1.0)
+    first, _ = reader.current()
+    assert reader.current()[0] is first
+
+    shared_orders.write(str(tmp_path), ORDERS[:1], version=2, ts=2.0)
+    second, _ = reader.current()
+    assert second.version == 2 and len(second) == 1
+    assert first[0]["id"] == "a"  # the old mapping stays valid for in-flight readers
+
+
+@pytest.fixture
+def shared_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        sales_api, "_CACHE", {"data": None, "ts": 0, "error": None, "retry_at": 0, "snapshot_loaded": False}
+    )
+    monkeypatch.setattr(sales_api, "_REFRESHING", False)
+    monkeypatch.setattr(sales_api, "_STORE", sales_api.OrderStore())
+    monkeypatch.setattr(sales_api, "_LISTENERS", [])
+    monkeypatch.setattr(sales_api, "_SNAPSHOT_BASE", str(tmp_path / "orders_snapshot"))
+    monkeypatch.setattr(sales_api, "_SNAPSHOT_PATH", str(tmp_path / "orders_snapshot.bin"))
+    monkeypatch.setattr(sales_api, "_SHARED_DIR", str(tmp_path / "shm"))
+    monkeypatch.setattr(sales_api, "_SHARED", {"reader": None, "leader": None, "published": None, "pending": None})
+    monkeypatch.setattr(sales_api, "_lead_forever", lambda: None)
+    return tmp_path / "shm"
+
+
+def test_one_leader_fetches_and_followers_read_the_segment(shared_mode, monkeypatch):
+    calls = []
+    monkeypatch.setattr(sales_api, "_download_orders", lambda: calls.append(1) or list(ORDERS))
+    leader_orders = sales_api.fetch_recent_orders()
+    assert sales_api.fetch_stats()["shared"]["role"] == "leader"
+
+    # A second worker: its own reader, and the election is already taken
+    monkeypatch.setattr(sales_api, "_SHARED", {
+        "reader": shared_orders.Reader(str(shared_mode)),
+        "leader": shared_orders.Leadership(str(shared_mode)),
+        "published": None,
+        "pending": None,
+    })
+    follower_orders = sales_api.fetch_recent_orders()
+
+    assert calls == [1]
+    assert isinstance(follower_orders, shared_orders.Segment)
+    assert [o["id"] for o in follower_orders] == [o["id"] for o in leader_orders]
+    assert sales_api.fetch_stats()["shared"]["role"] == "follower"
+
+
+def test_leader_encodes_the_segment_outside_the_cache_lock(shared_mode, monkeypatch):
+    locked = []
+    write = shared_orders.write
+    monkeypatch.setattr(shared_orders, "write", lambda *a: locked.append(sales_api._LOCK.locked()) or write(*a))
+    monkeypatch.setattr(sales_api, "_download_orders", lambda: list(ORDERS))
+    sales_api.fetch_recent_orders()
+
+    assert locked == [False]
+    assert len(shared_orders.Reader(str(shared_mode)).current()[0]) == len(ORDERS)
+
+
+def test_leader_steps_down_when_refreshes_keep_failing(shared_mode, monkeypatch):
+    leader = shared_orders.Leadership(str(shared_mode))
+    assert leader.try_acquire()
+    monkeypatch.setattr(sales_api, "_SHARED", {"reader": None, "leader": leader, "published": None,
+                                               "pending": None, "shared_at": 0.0})
+    monkeypatch.setattr(sales_api, "_SOFT_TTL_SECONDS", 0.01)
+
+    def broken_refresh():
+        raise ValueError("wedged")
+
+    monkeypatch.setattr(sales_api, "_refresh", broken_refresh)
+    LEAD_FOREVER()  # returns once it gives up
+
+    assert not leader.held
+    assert shared_orders.Leadership(str(shared_mode)).try_acquire()
+
+
+def test_segment_carries_the_creation_order_and_the_delta(tmp_path, monkeypatch):
+    import order_index
+    from order_store import OrderStore
+
+    monkeypatch.setattr(order_index, "_INDEX", {"source": None, "index": None, "version": 0})
+    store = OrderStore()
+    store.replace_all(ORDERS)
+    shared_orders.write(str(tmp_path), store.orders(), store.version, 1.0, lineage=42)
+    reader = shared_orders.Reader(str(tmp_path))
+    first, _ = reader.current()
+    index = order_index.index_for(first)
+    assert list(index.times) == OrderIndex(ORDERS).times
+    assert [o["id"] for o in index.orders] == ["a", "b"]
+
+    newer = dict(ORDERS[0], total=1500)
+    changes = store.replace_all([newer, ORDERS[2]])
+    shared_orders.write(str(tmp_path), store.orders(), store.version, 2.0, 42, 1, changes)
+    second, _ = reader.current()
+    assert first.changes_since(second) is None  # not written with first as its base
+
+    updated = order_index.index_for(second)
+    assert (updated.base_version, [o["id"] for o in updated.changes.upserted], updated.changes.removed) == \
+        (index.version, ["a"], ["b"])
+    assert [o["total"] for o in updated.orders] == [1500]
@@ -0,0 +1,87 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import columnar
+import records
+from order_index import OrderIndex
+from records import created_day, created_hour, decode_orders
+from rollups import DailyRollups
+from utils import aggregate_metrics, analyze_trend, trend_summary
+
+CHICAGO = ZoneInfo("America/Chicago")
+
+
+def order(oid, created, total):
+    return {"id": oid, "state": "locked", "createdTime": created, "total": total,
+            "lineItems": [{"name": "Coffee", "price": total, "unitQty": 1}]}
+
+
+# UTC timestamps: 03:30Z on Oct 3 is still the evening of Oct 2 in Chicago
+ORDERS = [
+    order("1", "2025-10-02T14:00:00Z", 500),
+    order("2", "2025-10-02T17:15:00Z", 900),
+    order("3", "2025-10-03T03:30:00Z", 300),
+    order("4", "2025-10-03T15:00:00Z", 700),
+]
+
+
+@pytest.fixture
+def chicago(monkeypatch):
+    monkeypatch.setattr(records, "MERCHANT_TZ", CHICAGO)
+
+
+def test_days_and_hours_follow_the_merchant_timezone(chicago):
+    assert [created_day(o) for o in ORDERS] == ["2025-10-02", "2025-10-02", "2025-10-02", "2025-10-03"]
+    assert [created_hour(o) for o in ORDERS] == [9, 12, 22, 10]
+    assert [(o.day(), o.hour()) for o in decode_orders(ORDERS)] == [
+        (created_day(o), created_hour(o)) for o in ORDERS
+    ]
+    # DST ends at 07:00Z on Nov 2: the same wall-clock hour comes round twice
+    assert [created_hour({"createdTime": t}) for t in ("2025-11-02T06:30:00Z", "2025-11-02T07:30:00Z")] == [1, 1]
+
+    index = OrderIndex(decode_orders(ORDERS))
+    start = datetime(2025, 10, 2, tzinfo=CHICAGO)
+    end = datetime(2025, 10, 2, 23, 59, 59, 999999, tzinfo=CHICAGO)
+    assert [o["id"] for o in index.between(start, end)] == ["1", "2", "3"]
+
+
+def test_single_day_windows_carry_an_hourly_series(chicago):
+    index = OrderIndex(decode_orders(ORDERS))
+    rollups = DailyRollups()
+    rollups.update(index)
+    start = datetime(2025, 10, 2, tzinfo=CHICAGO)
+    end = datetime(2025, 10, 2, 23, 59, 59, 999999, tzinfo=CHICAGO)
+
+    result = rollups.metrics(index, start, end)
+    assert result == aggregate_metrics(index.between(start, end), start, end)
+    hourly = {h: v for h, v in result["trend_hourly"].items() if v[1]}
+    assert hourly == {"09:00": (500, 1), "12:00": (900, 1), "22:00": (300, 1)}
+
+    two_days = rollups.metrics(index, start, datetime(2025, 10, 3, 23, 59, 59, 999999, tzinfo=CHICAGO))
+    assert two_days["trend_hourly"] is None
+    assert two_days["trend_daily"] == {"2025-10-02": (1700, 3), "2025-10-03": (700, 1)}
+
+
+def test_trend_summary_matches_the_insight():
+    trend = {"2025-10-01": (1000, 2), "2025-10-02": (400, 1), "2025-10-03": (1500, 3), "2025-10-04": (1500, 2)}
+    summary = trend_summary(trend)
+    assert (summary["peak"], summary["trough"], summary["growth_pct"]) == ("2025-10-03", "2025-10-02", 50.0)
+    assert analyze_trend(trend, summary) == analyze_trend(trend) == (
+        "Sales increased 50% from 2025-10-01 to 2025-10-04. "
+        "2025-10-03 had the highest revenue, while 2025-10-02 was the lowest."
+    )
+
+
+def test_multi_day_windows_with_one_active_day_have_no_hourly_series(chicago):
+    index = OrderIndex(decode_orders(ORDERS[3:]))
+    rollups = DailyRollups()
+    rollups.update(index)
+    start = datetime(2025, 9, 29, tzinfo=CHICAGO)
+    end = datetime(2025, 10, 5, 23, 59, 59, 999999, tzinfo=CHICAGO)
+
+    assert aggregate_metrics(index.between(start, end), start, end)["trend_hourly"] is None
+    assert rollups.metrics(index, start, end)["trend_hourly"] is None
+    if columnar.available():
+        assert index.aggregate(start, end)["trend_hourly"] is None
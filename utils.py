@@ -1,54 +1,387 @@
-from datetime import datetime, timedelta, timezone
-from collections import defaultdict, Counter
+from datetime import date, datetime, timedelta, timezone
+import re
+import heapq
+from collections import defaultdict
+from functools import lru_cache
+from typing import NamedTuple
+
+from records import created_day, created_hour, order_lines, wall_clock
 
 # ------------------------
 # Date Parsing
 # ------------------------
-def parse_date_range(text: str, now: datetime):
-    """Parse natural language timeframes like today, yesterday, this week, etc."""
-    t = text.lower().strip()
-
-    def day_bounds(dt):
-        start = datetime(dt.year, dt.month, dt.day, tzinfo=dt.tzinfo)
-        end = start + timedelta(days=1) - timedelta(microseconds=1)
-        return start, end
-
-    if "today" in t:
-        start, end = day_bounds(now)
-        return start, end, f"Today ({start.date().isoformat()})"
-
-    if "yesterday" in t:
-        y = now - timedelta(days=1)
-        start, end = day_bounds(y)
-        return start, end, f"Yesterday ({start.date().isoformat()})"
-
-    if "last week" in t:
-        this_monday = now - timedelta(days=now.weekday())
-        last_monday = this_monday - timedelta(days=7)
-        last_sunday = last_monday + timedelta(days=6)
-        return last_monday, last_sunday, f"Last week ({last_monday.date()} to {last_sunday.date()})"
-
-    if "this week" in t:
-        this_monday = now - timedelta(days=now.weekday())
-        return this_monday, now, f"This week ({this_monday.date()} to {now.date()})"
-
-    if "this month" in t:
-        start = datetime(now.year, now.month, 1, tzinfo=now.tzinfo)
-        nm = datetime(now.year + (now.month // 12), (now.month % 12) + 1, 1, tzinfo=now.tzinfo)
-        end = nm - timedelta(microseconds=1)
-        return start, end, f"This month ({start.date()} to {end.date()})"
-
-    if "last month" in t:
-        if now.month == 1:
-            start = datetime(now.year - 1, 12, 1, tzinfo=now.tzinfo)
+class DateWindow(NamedTuple):
+    """A resolved window. Unpacks as (start, end, label) and is hashable, so it can key caches directly.
+
+    `assumed` is True when the text named no timeframe and the window fell back to today.
+    """
+
+    start: datetime
+    end: datetime
+    label: str
+    assumed = False
+
+
+class _AssumedWindow(DateWindow):
+    __slots__ = ()
+    assumed = True
+
+
+_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_WEEKDAYS = {d: i for i, d in enumerate(("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"))}
+_NUMBER_WORDS = {w: i for i, w in enumerate(
+    ("one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+     "thirteen", "fourteen"), start=1)}
+
+_MONTH = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+_WEEKDAY = r"(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+_ORD = r"(?:st|nd|rd|th)?"
+_ORDINALS = {w: i for i, w in enumerate(("first", "second", "third", "fourth"), start=1)}
+_NUMBER = rf"(?:\d+|{'|'.join(_NUMBER_WORDS)})"
+_DATE = (rf"(?:\d{{4}}-\d{{1,2}}-\d{{1,2}}|{_MONTH}\.? \d{{1,2}}{_ORD}(?:,? \d{{4}})?"
+         rf"|\d{{1,2}}{_ORD} {_MONTH}\.?(?:,? \d{{4}})?)")
+_DATE_PARTS = [
+    re.compile(r"^(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})$"),
+    re.compile(rf"^(?P<name>{_MONTH})\.? (?P<day>\d{{1,2}}){_ORD}(?:,? (?P<year>\d{{4}}))?$"),
+    re.compile(rf"^(?P<day>\d{{1,2}}){_ORD} (?P<name>{_MONTH})\.?(?:,? (?P<year>\d{{4}}))?$"),
+]
+
+
+def _past(year, month, day, today):
+    """date(year, month, day); without a year, its most recent occurrence on or before today."""
+    if year is not None:
+        return date(int(year), month, day)
+    d = date(today.year, month, day)
+    return d if d <= today else date(today.year - 1, month, day)
+
+
+def _parse_day(text, today):
+    for pattern in _DATE_PARTS:
+        m = pattern.match(text)
+        if m:
+            month = int(m["month"]) if "month" in pattern.groupindex else _MONTHS[m["name"][:3]]
+            try:
+                return _past(m["year"], month, int(m["day"]), today)
+            except ValueError:  # e.g. Feb 30
+                return None
+    return None
+
+
+def _month_end(year, month):
+    return date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+
+
+def _month(today, year, month):
+    if year is None and month > today.month:
+        year = today.year - 1
+    year = today.year if year is None else int(year)
+    return date(year, month, 1), _month_end(year, month)
+
+
+def _quarter(year, q):
+    return date(year, 3 * q - 2, 1), _month_end(year, 3 * q)
+
+
+def _number(word):
+    return int(word) if word.isdigit() else _NUMBER_WORDS[word]
+
+
+def _weekday(today, name, strictly_before=False):
+    back = (today.weekday() - _WEEKDAYS[name]) % 7
+    if back == 0 and strictly_before:
+        back = 7
+    return today - timedelta(days=back)
+
+
+# Each resolver takes (match, today) and returns (first day, last day, label prefix), or None to
+# let the next rule try. A None prefix labels the window with its dates alone.
+def _span(m, today):
+    a = _parse_day(m["a"], today)
+    if a is None:
+        return None
+    if m["b_day"]:  # "October 5 to 10": the end shares the start's month
+        try:
+            b = a.replace(day=int(m["b_day"]))
+        except ValueError:
+            return None
+        return (a, b, None) if b >= a else None
+    b = _parse_day(m["b"], today)
+    if b is None:
+        return None
+    return min(a, b), max(a, b), None
+
+
+def _since(m, today):
+    month = re.fullmatch(rf"(?P<name>{_MONTH})(?: (?P<year>\d{{4}}))?", m["anchor"])
+    # A bare month goes straight to _month: the month rule leaves a lone "may" to the verb
+    anchor = _month(today, month["year"], _MONTHS[month["name"][:3]]) if month else _match_rules(m["anchor"], today)
+    if anchor is None or anchor[0] > today:
+        return None
+    name = m["anchor"].title() if m["anchor"] in _WEEKDAYS else f"{anchor[0]:%b} {anchor[0].day}"
+    return anchor[0], today, f"Since {name}"
+
+
+def _months_back(today, n):
+    """The same day n months before today, clamped to the end of shorter months."""
+    year, month = divmod(today.year * 12 + today.month - 1 - n, 12)
+    return date(year, month + 1, min(today.day, _month_end(year, month + 1).day))
+
+
+def _rolling(m, today):
+    n = _number(m["n"])
+    if n < 1:
+        return None
+    if m["unit"] == "month":
+        first = _months_back(today, n) + timedelta(days=1)
+    else:
+        first = today - timedelta(days=(n * 7 if m["unit"] == "week" else n) - 1)
+    return first, today, f"Last {n} {m['unit']}{'s' if n != 1 else ''}"
+
+
+def _on_day(m, today):
+    d = _parse_day(m["day"], today)
+    return (d, d, f"{d:%b} {d.day}") if d else None
+
+
+def _day_of_month(m, today):
+    """"on the 5th" is the latest 5th on or before today; "the 5th of May" the latest such date."""
+    day = int(m["day"])
+    try:
+        if m["name"]:
+            d = _past(None, _MONTHS[m["name"][:3]], day, today)
         else:
-            start = datetime(now.year, now.month - 1, 1, tzinfo=now.tzinfo)
-        end = datetime(now.year, now.month, 1, tzinfo=now.tzinfo) - timedelta(microseconds=1)
-        return start, end, f"Last month ({start.date()} to {end.date()})"
+            d = today.replace(day=day)
+            if d > today:
+                previous = today.replace(day=1) - timedelta(days=1)
+                d = previous.replace(day=day)
+    except ValueError:  # e.g. the 31st after a 30-day month
+        return None
+    return d, d, f"{d:%b} {d.day}"
+
+
+def _to_date(m, today):
+    unit = m["unit"]
+    if unit == "week":
+        first = today - timedelta(days=today.weekday())
+    elif unit == "month":
+        first = today.replace(day=1)
+    elif unit == "quarter":
+        first = _quarter(today.year, (today.month - 1) // 3 + 1)[0]
+    else:
+        first = today.replace(month=1, day=1)
+    return first, today, f"{unit.title()} to date"
+
+
+def _weekend(m, today):
+    """The latest Saturday-Sunday that has started, cut off at today."""
+    saturday = _weekday(today, "saturday")
+    in_weekend = today.weekday() >= 5
+    if m["which"] != "this" and in_weekend:
+        saturday -= timedelta(days=7)  # "last weekend" while one is under way: the one before
+    label = "This weekend" if in_weekend and m["which"] == "this" else "Last weekend"
+    return saturday, min(saturday + timedelta(days=1), today), label
+
+
+def _weekdays(m, today):
+    """"last 2 Sundays": from the earliest of the n latest such days (today included) to the latest."""
+    n = _number(m["n"])
+    if n < 1:
+        return None
+    latest = _weekday(today, m["name"])
+    return latest - timedelta(days=7 * (n - 1)), latest, f"Last {n} {m['name'].title()}s"
+
+
+def _this_week(m, today):
+    monday = today - timedelta(days=today.weekday())
+    return monday, today, "This week"
+
+
+def _last_week(m, today):
+    monday = today - timedelta(days=today.weekday() + 7)
+    return monday, monday + timedelta(days=6), "Last week"
+
+
+def _this_month(m, today):
+    return (*_month(today, today.year, today.month), "This month")
+
+
+def _last_month(m, today):
+    first = today.replace(day=1) - timedelta(days=1)
+    return (*_month(today, first.year, first.month), "Last month")
+
+
+def _relative_quarter(m, today):
+    q, year = (today.month - 1) // 3 + 1, today.year
+    if m["which"] == "last":
+        q, year = (4, year - 1) if q == 1 else (q - 1, year)
+    return (*_quarter(year, q), f"{m['which'].title()} quarter")
+
+
+def _named_quarter(m, today):
+    q = int(m["q"]) if m["q"].isdigit() else _ORDINALS.get(m["q"]) or int(m["q"][0])
+    year = int(m["year"]) if m["year"] else today.year
+    if not m["year"] and date(year, 3 * q - 2, 1) > today:
+        year -= 1
+    return (*_quarter(year, q), f"Q{q} {year}")
+
+
+def _relative_year(m, today):
+    year = today.year - (m["which"] == "last")
+    return date(year, 1, 1), date(year, 12, 31), f"{m['which'].title()} year"
 
-    # Default to today
-    start, end = day_bounds(now)
-    return start, end, f"Today ({start.date().isoformat()})"
+
+def _named_month(m, today):
+    name = m["name"]
+    if name == "may" and not (m["prep"] or m["year"]):
+        return None  # "may" on its own is far more often the verb
+    start, end = _month(today, m["year"], _MONTHS[name[:3]])
+    return start, end, start.strftime("%B %Y")
+
+
+def _named_weekday(m, today):
+    d = _weekday(today, m["name"], strictly_before=bool(m["last"]))
+    return d, d, m["name"].title()
+
+
+_RULES = [
+    (re.compile(rf"\b(?:from|between) (?P<a>{_DATE}) (?:to|and|until|through|-) "
+                rf"(?:(?P<b>{_DATE})|(?P<b_day>\d{{1,2}}){_ORD})\b"), _span),
+    (re.compile(rf"\b(?P<a>{_DATE}) ?(?:to|until|through|-) ?(?:(?P<b>{_DATE})|(?P<b_day>\d{{1,2}}){_ORD})\b"), _span),
+    (re.compile(rf"\bsince (?P<anchor>{_DATE}|{_WEEKDAY}|{_MONTH}(?: \d{{4}})?|yesterday|last week|last month"
+                r"|last quarter|q[1-4](?: \d{4})?)\b"), _since),
+    (re.compile(rf"\b(?:last|past|previous) (?P<n>{_NUMBER}) (?P<unit>day|week|month)s?\b"), _rolling),
+    (re.compile(rf"\b(?:last|past|previous) (?P<n>{_NUMBER}) (?P<name>{_WEEKDAY})s\b"), _weekdays),
+    (re.compile(r"\b(?P<unit>year|quarter|month|week)[ -]to[ -]date\b"), _to_date),
+    (re.compile(r"\b(?:(?P<y>y)|(?P<q>q)|(?P<m>m)|(?P<w>w))td\b"),
+     lambda m, today: _to_date({"unit": {"y": "year", "q": "quarter", "m": "month", "w": "week"}[m.lastgroup]}, today)),
+    (re.compile(rf"\bon (?P<day>{_DATE})\b"), _on_day),
+    (re.compile(r"\b(?:the )?(?P<q>1st|2nd|3rd|4th|first|second|third|fourth) quarter(?: (?:of )?(?P<year>\d{4}))?\b"),
+     _named_quarter),
+    (re.compile(rf"\bthe (?P<day>\d{{1,2}})(?:st|nd|rd|th)\b(?: of (?P<name>{_MONTH})\b)?"), _day_of_month),
+    (re.compile(r"\b(?P<which>this|last|past) weekend\b"), _weekend),
+    (re.compile(r"\btoday\b"), lambda m, today: (today, today, "Today")),
+    (re.compile(r"\byesterday\b"), lambda m, today: (today - timedelta(days=1),) * 2 + ("Yesterday",)),
+    (re.compile(r"\blast week\b"), _last_week),
+    (re.compile(r"\bthis week\b"), _this_week),
+    (re.compile(r"\bthis month\b"), _this_month),
+    (re.compile(r"\blast month\b"), _last_month),
+    (re.compile(r"\b(?P<which>this|last) quarter\b"), _relative_quarter),
+    (re.compile(r"\bq(?P<q>[1-4])(?: ?(?P<year>\d{4}))?\b"), _named_quarter),
+    (re.compile(r"\b(?P<which>this|last) year\b"), _relative_year),
+    (re.compile(rf"\b(?P<day>{_DATE})\b"), _on_day),
+    (re.compile(rf"\b(?P<prep>in |during |for |of )?(?P<name>{_MONTH})\b(?: (?P<year>\d{{4}}))?"), _named_month),
+    (re.compile(rf"\b(?P<last>last )?(?:on )?(?P<name>{_WEEKDAY})\b"), _named_weekday),
+]
+
+
+def _match_rules(t, today):
+    for pattern, resolve in _RULES:
+        for m in pattern.finditer(t):
+            found = resolve(m, today)
+            if found is not None:
+                return found
+    return None
+
+
+def _window(first, last, prefix, tz):
+    start = datetime(first.year, first.month, first.day, tzinfo=tz)
+    end = datetime(last.year, last.month, last.day, tzinfo=tz) + timedelta(days=1) - timedelta(microseconds=1)
+    dates = first.isoformat() if first == last else f"{first} to {last}"
+    return DateWindow(start, end, f"{prefix} ({dates})" if prefix else dates)
+
+
+@lru_cache(maxsize=4096)
+def _resolve(t, today, tz):
+    found = _match_rules(t, today)
+    if found is None:
+        return _AssumedWindow(*_window(today, today, "Today", tz))
+    return _window(*found, tz)
+
+
+def parse_date_range(text: str, now: datetime) -> DateWindow:
+    """Resolve the timeframe in a question into a whole-day DateWindow in now's timezone.
+
+    Understands today/yesterday, this/last week, weekend, month, quarter and year,
+    "year to date" (and week/month/quarter, or "ytd"), month names ("in October",
+    "Oct 2024", "since May"), quarters ("Q3", "the 3rd quarter"), rolling windows ("last 7
+    days", "past 2 weeks", "last 3 months", "last 2 Sundays"), weekdays ("on Friday", "since
+    Monday"), days of the month ("on the 5th") and explicit dates and spans ("from 2025-10-01
+    to 2025-10-15", "October 5 to 10", "Oct 3", "2025-10-03"). Anything else is today,
+    flagged as `assumed`. Results are memoized per (normalized text, day).
+    """
+    return _resolve(" ".join(text.lower().split()), now.date(), now.tzinfo)
+
+
+# "A vs B": the comparator splits the question into one period per side
+_COMPARATOR = re.compile(r"\b(?:vs\.?|versus|against|compared (?:to|with))(?!\w)")
+# "Compare A and B": a comparison word, then the sides are split at a joining word
+_COMPARE_WORD = re.compile(r"\b(?:compare|comparison|comparing|difference)\b")
+_JOINER = re.compile(r"\b(?:and|with|to)\b")
+# Without two explicit periods, the unit named decides "this <unit>" vs "last <unit>"
+_COMPARE_UNITS = [
+    (re.compile(r"\bquarters?\b"), ["this quarter", "last quarter"]),
+    (re.compile(r"\byears?\b"), ["this year", "last year"]),
+    (re.compile(r"\bmonths?\b"), ["this month", "last month"]),
+    (re.compile(r"\bweeks?\b"), ["this week", "last week"]),
+    (re.compile(r"\b(?:today|yesterday|day)\b"), ["today", "yesterday"]),
+]
+
+
+# "last 2 Sundays": the two days themselves, compared, rather than the week between them
+_WEEKDAY_PAIR = re.compile(rf"\b(?:last|past|previous) (?:2|two) (?P<name>{_WEEKDAY})s\b")
+
+
+def _sides(t, today):
+    """The two periods named on either side of a comparator or joining word, or None."""
+    m = _COMPARATOR.search(t)
+    splits = [(t[:m.start()], t[m.end():])] if m else [(t[:j.start()], t[j.end():]) for j in _JOINER.finditer(t)]
+    for left, right in splits:
+        a, b = _match_rules(left.strip(), today), _match_rules(right.strip(), today)
+        if a is not None and b is not None:
+            return a, b
+    return None
+
+
+def _preceding(period):
+    """The window of the same length ending the day before `period` starts."""
+    first, last, _ = period
+    length = last - first
+    return first - length - timedelta(days=1), first - timedelta(days=1), None
+
+
+def parse_comparison(text: str, now: datetime):
+    """Resolve comparison questions into [current, previous] DateWindows, or None.
+
+    Two named periods ("Monday vs Tuesday", "October vs September", "last 7
+    days vs the previous 7 days") are compared as given, the later one as
+    current; a repeated rolling window means the one before it. Otherwise the
+    unit mentioned picks this vs last period ("compare this week vs last"). "Last 2
+    Sundays" compares the latest Sunday with the one before.
+    """
+    t = " ".join(text.lower().split())
+    today = now.date()
+    pair = _WEEKDAY_PAIR.search(t)
+    if pair:
+        latest, name = _weekday(today, pair["name"]), pair["name"].title()
+        earlier = latest - timedelta(days=7)
+        return [_window(latest, latest, name, now.tzinfo), _window(earlier, earlier, f"Previous {name}", now.tzinfo)]
+    if not (_COMPARATOR.search(t) or _COMPARE_WORD.search(t)):
+        return None
+
+    sides = _sides(t, today)
+    if sides is not None:
+        a, b = sides
+        if a[:2] == b[:2]:
+            b = _preceding(a)
+        current, previous = sorted((a, b), key=lambda p: p[0], reverse=True)
+        return [_window(*current, now.tzinfo), _window(*previous, now.tzinfo)]
+
+    for pattern, periods in _COMPARE_UNITS:
+        if pattern.search(t):
+            return [parse_date_range(p, now) for p in periods]
+    return None
 
 
 # ------------------------
@@ -62,91 +395,205 @@ def friendly_currency(cents: int) -> str:
 # ------------------------
 # Aggregation Logic
 # ------------------------
-def aggregate_metrics(orders, start_dt, end_dt):
+def aggregate_metrics(orders, start_dt, end_dt, columnar=False):
     """
     Aggregates both recorded and calculated revenue, AOV, top items, and daily trends.
     Uses hybrid approach to ensure accurate revenue even if 'total' is missing in some orders.
+    With columnar=True (and numpy installed) the vectorized engine in columnar.py is used.
     """
+    if columnar:
+        import columnar as col
+        if col.available():
+            return col.OrderColumns(orders).aggregate(hourly=single_day(start_dt, end_dt))
 
-    order_count = len(orders)
-    total_revenue_cents = 0        # From order.total
-    calc_revenue_cents = 0         # From line items
-    item_counter = Counter()
-    item_revenue = Counter()
-    trend_daily = defaultdict(lambda: [0, 0])  # {date: [revenue, order_count]}
-
+    acc = _MetricsAccumulator(hourly=single_day(start_dt, end_dt))
     for o in orders:
+        acc.add(o)
+    return acc.result()
+
+
+def aggregate_windows(index, windows):
+    """
+    aggregate_metrics() for several (start_dt, end_dt) windows in a single pass over
+    an OrderIndex: only the union of the windows is scanned, once.
+    """
+    if not windows:
+        return []
+    bounds = [(wall_clock(s), wall_clock(e)) for s, e in windows]
+    lo, hi = index.bounds(min(s for s, _ in bounds), max(e for _, e in bounds))
+
+    accs = [_MetricsAccumulator(hourly=single_day(s, e)) for s, e in windows]
+    for ct, o in zip(index.times[lo:hi], index.orders[lo:hi]):
+        for (s, e), acc in zip(bounds, accs):
+            if s <= ct <= e:
+                acc.add(o)
+    return [acc.result() for acc in accs]
+
+
+HOURS = tuple(f"{h:02d}:00" for h in range(24))  # labels of trend_hourly
+
+
+def single_day(start_dt, end_dt):
+    """Whether a window lies within one merchant-local day; only such windows get trend_hourly."""
+    return start_dt is not None and end_dt is not None and wall_clock(start_dt).date() == wall_clock(end_dt).date()
+
+
+class _MetricsAccumulator:
+    """Running totals behind aggregate_metrics, fed one order at a time."""
+
+    def __init__(self, hourly=False):
+        self.hourly = hourly                # Report trend_hourly (single-day windows)
+        self.order_count = 0
+        self.total_revenue_cents = 0        # From order.total
+        self.calc_revenue_cents = 0         # From line items
+        self.items = {}                     # {name: [qty, revenue]}, in first-seen order
+        self.trend_daily = defaultdict(lambda: [0, 0])  # {date: [revenue, order_count]}
+        self.hour_revenue = [0] * 24
+        self.hour_orders = [0] * 24
+
+    def add(self, o):
         # Get values safely
         order_total = int(o.get("total") or 0)
-        line_total = sum(int(i.get("price") or 0) for i in o.get("lineItems", []))
-        created_date = o.get("createdTime", "")[:10]
+        lines = order_lines(o)
+        line_total = sum(price for _, price, _ in lines)
+        created_date = created_day(o)
+        self.order_count += 1
 
         # Recorded revenue (from order totals)
-        total_revenue_cents += order_total
+        self.total_revenue_cents += order_total
 
         # Calculated revenue (from line items)
-        calc_revenue_cents += line_total
+        self.calc_revenue_cents += line_total
 
-        # Use whichever is valid for daily trend visualization
-        trend_daily[created_date][0] += order_total if order_total > 0 else line_total
-        trend_daily[created_date][1] += 1
+        # Use whichever is valid for daily (and hourly) trend visualization
+        trend_revenue = order_total if order_total > 0 else line_total
+        day = self.trend_daily[created_date]
+        day[0] += trend_revenue
+        day[1] += 1
+        hour = created_hour(o)
+        self.hour_revenue[hour] += trend_revenue
+        self.hour_orders[hour] += 1
 
         # Count item stats
-        for li in o.get("lineItems", []) or []:
-            name = li.get("name") or "Unknown Item"
-            qty = li.get("unitQty") if li.get("unitQty") else 1
-            price = int(li.get("price") or 0)
-            item_counter[name] += qty
-            item_revenue[name] += price * qty
+        for name, price, qty in lines:
+            stats = self.items.get(name)
+            if stats is None:
+                stats = self.items[name] = [0, 0]
+            stats[0] += qty
+            stats[1] += price * qty
 
-    # Top items
-    top_items = [
-        {"name": n, "qty": int(q), "revenue_cents": int(item_revenue[n])}
-        for n, q in item_counter.most_common(10)
-    ]
+    def result(self):
+        # Top items (bounded heap; ties keep first-seen order, like Counter.most_common)
+        top_items = [
+            {"name": n, "qty": int(q), "revenue_cents": int(r)}
+            for n, (q, r) in heapq.nlargest(10, self.items.items(), key=lambda kv: kv[1][0])
+        ]
 
-    # Average Order Value (based on recorded totals)
-    aov_cents = int(total_revenue_cents / order_count) if order_count else 0
+        # Average Order Value (based on recorded totals)
+        order_count = self.order_count
+        aov_cents = int(self.total_revenue_cents / order_count) if order_count else 0
 
-    # Sort daily trend
-    trend_daily = {k: (v[0], v[1]) for k, v in sorted(trend_daily.items())}
+        # Sort daily trend
+        trend_daily = {k: (v[0], v[1]) for k, v in sorted(self.trend_daily.items())}
+
+        return {
+            "order_count": order_count,
+            "total_revenue_cents": self.total_revenue_cents,
+            "calc_revenue_cents": self.calc_revenue_cents,
+            "aov_cents": aov_cents,
+            "top_items": top_items,
+            "trend_daily": trend_daily,
+            "trend_summary": trend_summary(trend_daily),
+            # A single-day window also gets its hourly series
+            "trend_hourly": dict(zip(HOURS, zip(self.hour_revenue, self.hour_orders))) if self.hourly else None,
+        }
+
+
+def comparison_block(current, previous, current_label, previous_label):
+    """Growth figures between two aggregate_metrics() results (revenue in dollars)."""
+    def growth(cur, prev):
+        return round((cur - prev) / prev * 100, 1) if prev else 0.0
 
     return {
-        "order_count": order_count,
-        "total_revenue_cents": total_revenue_cents,
-        "calc_revenue_cents": calc_revenue_cents,
-        "aov_cents": aov_cents,
-        "top_items": top_items,
-        "trend_daily": trend_daily,
+        "current_label": current_label,
+        "previous_label": previous_label,
+        "rev_current": current["total_revenue_cents"] / 100.0,
+        "rev_previous": previous["total_revenue_cents"] / 100.0,
+        "orders_current": current["order_count"],
+        "orders_previous": previous["order_count"],
+        "aov_current": current["aov_cents"] / 100.0,
+        "aov_previous": previous["aov_cents"] / 100.0,
+        "rev_growth_pct": growth(current["total_revenue_cents"], previous["total_revenue_cents"]),
+        "order_growth_pct": growth(current["order_count"], previous["order_count"]),
     }
 
 
 # ------------------------
 # Trend Insight
 # ------------------------
-def analyze_trend(trend_daily):
+def trend_summary(series):
+    """Endpoints, start-to-end growth, peak and trough of an ordered {label: (revenue, orders)} series.
+
+    One pass; ties resolve to the earliest label, as max()/min() would.
+    """
+    first = last = peak = trough = None
+    points = 0
+    for label, (revenue, _) in series.items():
+        if first is None:
+            first = peak = trough = (label, revenue)
+        elif revenue > peak[1]:
+            peak = (label, revenue)
+        elif revenue < trough[1]:
+            trough = (label, revenue)
+        last = (label, revenue)
+        points += 1
+    if first is None:
+        return None
+    start_rev, end_rev = first[1], last[1]
+    return {
+        "first": first[0],
+        "last": last[0],
+        "points": points,
+        "start_revenue_cents": start_rev,
+        "end_revenue_cents": end_rev,
+        "growth_pct": round((end_rev - start_rev) / start_rev * 100, 1) if start_rev > 0 else 0.0,
+        "peak": peak[0],
+        "peak_revenue_cents": peak[1],
+        "trough": trough[0],
+        "trough_revenue_cents": trough[1],
+    }
+
+
+def analyze_trend(trend_daily, summary=None):
     """Generate human-readable insight about sales trend."""
     if not trend_daily:
         return "No sales data available for the selected period."
 
-    days = list(trend_daily.keys())
-    revenues = [trend_daily[d][0] for d in days]
-
-    if len(revenues) < 2:
+    summary = summary or trend_summary(trend_daily)
+    if summary["points"] < 2:
         return "Sales appear consistent for the selected period."
 
-    start_rev, end_rev = revenues[0], revenues[-1]
-    diff = end_rev - start_rev
-    pct = (diff / start_rev * 100) if start_rev > 0 else 0
-
-    max_day = max(trend_daily.items(), key=lambda kv: kv[1][0])[0]
-    min_day = min(trend_daily.items(), key=lambda kv: kv[1][0])[0]
+    start_rev, end_rev = summary["start_revenue_cents"], summary["end_revenue_cents"]
+    pct = ((end_rev - start_rev) / start_rev * 100) if start_rev > 0 else 0
+    first, last = summary["first"], summary["last"]
 
     if pct > 10:
-        direction = f"Sales increased {pct:.0f}% from {days[0]} to {days[-1]}."
+        direction = f"Sales increased {pct:.0f}% from {first} to {last}."
     elif pct < -10:
-        direction = f"Sales decreased {abs(pct):.0f}% from {days[0]} to {days[-1]}."
+        direction = f"Sales decreased {abs(pct):.0f}% from {first} to {last}."
     else:
         direction = "Sales remained fairly steady during this period."
 
-    return f"{direction} {max_day} had the highest revenue, while {min_day} was the lowest."
+    return f"{direction} {summary['peak']} had the highest revenue, while {summary['trough']} was the lowest."
+
+
+def analyze_hourly(trend_hourly):
+    """Insight for a single day from its hourly series: busiest and quietest trading hours."""
+    active = {h: v for h, v in trend_hourly.items() if v[1]}
+    if not active:
+        return "No sales data available for the selected period."
+    summary = trend_summary(active)
+    if summary["points"] < 2:
+        return f"All sales came in the {summary['peak']} hour."
+    return (f"The busiest hour was {summary['peak']} ({friendly_currency(summary['peak_revenue_cents'])}), "
+            f"the quietest was {summary['trough']} ({friendly_currency(summary['trough_revenue_cents'])}).")